@@ -6,6 +6,14 @@ from routes import register_routes
 from utils.i18n import t, get_locale
 from init_db import db, init_database
 from models import Settings
+from services.render_pool import init_render_pool
+from services.thermal import warm_thermal_worker
+from services.render_cache import init_render_cache
+from services.prerender import init_prerender_queue
+from services.jobs import init_job_runner
+from services.analytics import init_analytics_cache
+from services.logos import logo_variant
+from utils.template_context import LazyMapping, ContextStats
 
 app = Flask(__name__)
 app.secret_key = get_secret_key()
@@ -18,6 +26,12 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 os.makedirs('static/uploads', exist_ok=True)
 
 init_database(app)
+init_render_pool(app, initializer=warm_thermal_worker)
+init_render_cache(app)
+init_prerender_queue(app)
+init_job_runner(app)
+init_analytics_cache(app)
+app.extensions['context_stats'] = ContextStats()
 register_routes(app)
 
 PUBLIC_ROUTES = ['auth.login', 'auth.logout', 'static', 'pwa.manifest', 'pwa.service_worker']
@@ -29,15 +43,27 @@ def check_login():
     if 'user_id' not in session and request.endpoint != 'auth.login':
         return redirect(url_for('auth.login'))
 
+@app.template_filter('logo_thumb')
+def logo_thumb(logo_path):
+    return logo_variant(logo_path, 'thumb')
+
 @app.context_processor
 def inject_globals():
     locale = get_locale()
     user_id = session.get('user_id')
+    stats = app.extensions['context_stats']
+    stats.count('renders')
+
+    def load_settings():
+        stats.count('settings_loaded')
+        return Settings.get(user_id=user_id)
+
     return {
         't': t,
         'locale': locale,
         'is_rtl': locale == 'ar',
-        'settings': Settings.get(user_id=user_id),
+        # Only looked up (site_url fallback included) if the template reads a setting
+        'settings': LazyMapping(load_settings),
         'current_user': {
             'id': user_id,
             'username': session.get('username'),
@@ -5,6 +5,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy import text, inspect
+from sqlalchemy.schema import CreateTable, CreateIndex
 from werkzeug.security import generate_password_hash
 
 class Base(DeclarativeBase):
@@ -40,11 +41,17 @@ class Company(db.Model):
 
 class Client(db.Model):
     __tablename__ = 'clients'
+    __table_args__ = (
+        db.Index('idx_clients_user_name', 'user_id', text('lower(name)')),
+        db.Index('idx_clients_user_phone', 'user_id', 'whatsapp_digits'),
+    )
     
     id = db.Column(db.String(36), primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(255), nullable=False)
     whatsapp = db.Column(db.String(50), default='')
+    # utils.phone.phone_digits(whatsapp), set on every write; NULL until backfilled by migrate_database
+    whatsapp_digits = db.Column(db.String(20))
     email = db.Column(db.String(255), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -52,11 +59,17 @@ class Receipt(db.Model):
     __tablename__ = 'receipts'
     __table_args__ = (
         db.Index('idx_receipts_user_created', 'user_id', 'created_at'),
+        db.Index('idx_receipts_client_created', 'user_id', 'client_id', 'created_at'),
+        db.Index('uq_receipts_user_number', 'user_id', 'receipt_number', unique=True),
+        # Receipt list filters (Receipt.FILTERS), newest first within a filter
+        db.Index('idx_receipts_company_created', 'user_id', 'company_id', 'created_at'),
+        db.Index('idx_receipts_payment_created', 'user_id', 'payment_method', 'created_at'),
+        db.Index('idx_receipts_user_amount', 'user_id', 'amount'),
     )
     
     id = db.Column(db.String(36), primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    receipt_number = db.Column(db.String(50), unique=True, nullable=False)
+    receipt_number = db.Column(db.String(50), nullable=False)
     client_id = db.Column(db.String(36), nullable=True)
     company_id = db.Column(db.String(36), nullable=True)
     description = db.Column(db.Text, nullable=False)
@@ -64,13 +77,67 @@ class Receipt(db.Model):
     payment_method = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ReceiptSequence(db.Model):
+    __tablename__ = 'receipt_sequences'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    # '' when the counter never resets, else the current year / month / day
+    period = db.Column(db.String(10), primary_key=True, default='')
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class UserStats(db.Model):
+    """Dashboard summary of a user, maintained in the same transactions as their receipts and clients"""
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    receipt_count = db.Column(db.Integer, nullable=False, default=0)
+    client_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    cash_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    card_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    transfer_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    check_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    other_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    last_receipt_at = db.Column(db.DateTime, nullable=True)
+    # Bumped on every change; keys the analytics cache so writes invalidate it in every process
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DocumentJob(db.Model):
+    __tablename__ = 'document_jobs'
+    __table_args__ = (
+        db.Index('idx_document_jobs_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text, default='{}')
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(100), default='')
+    result_path = db.Column(db.String(255), default='')
+    result_name = db.Column(db.String(255), default='')
+    mimetype = db.Column(db.String(100), default='')
+    error = db.Column(db.Text, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
 class Settings(db.Model):
     __tablename__ = 'settings'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
     thermal_width = db.Column(db.Integer, default=58)
+    thermal_density = db.Column(db.Integer, default=0)
+    pdf_renderer = db.Column(db.String(20), default='canvas')
     receipt_number_format = db.Column(db.String(50), default='REC-{YYYY}{MM}{DD}-{N}')
+    receipt_number_reset = db.Column(db.String(10), default='never')
     timezone = db.Column(db.String(50), default='Africa/Casablanca')
 
     # PWA Settings
@@ -99,6 +166,9 @@ class Settings(db.Model):
     # Global App Settings
     site_url = db.Column(db.String(255), default='')
 
+    # Bumped by every save so cached copies in other workers are refreshed
+    version = db.Column(db.Integer, default=0)
+
 def migrate_database(app):
     """Run migrations to add missing columns to existing tables"""
     with app.app_context():
@@ -356,6 +426,41 @@ def migrate_database(app):
                 'table': 'receipts',
                 'index': 'idx_receipts_user_created',
                 'sql': "CREATE INDEX IF NOT EXISTS idx_receipts_user_created ON receipts (user_id, created_at)"
+            },
+            {
+                'table': 'receipts',
+                'index': 'idx_receipts_client_created',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_receipts_client_created ON receipts (user_id, client_id, created_at)"
+            },
+            {
+                'table': 'receipts',
+                'index': 'uq_receipts_user_number',
+                'sql': "CREATE UNIQUE INDEX IF NOT EXISTS uq_receipts_user_number ON receipts (user_id, receipt_number)"
+            },
+            {
+                'table': 'receipts',
+                'index': 'idx_receipts_company_created',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_receipts_company_created ON receipts (user_id, company_id, created_at)"
+            },
+            {
+                'table': 'receipts',
+                'index': 'idx_receipts_payment_created',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_receipts_payment_created ON receipts (user_id, payment_method, created_at)"
+            },
+            {
+                'table': 'receipts',
+                'index': 'idx_receipts_user_amount',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_receipts_user_amount ON receipts (user_id, amount)"
+            },
+            {
+                'table': 'clients',
+                'index': 'idx_clients_user_name',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_clients_user_name ON clients (user_id, lower(name))"
+            },
+            {
+                'table': 'clients',
+                'index': 'idx_clients_user_phone',
+                'sql': "CREATE INDEX IF NOT EXISTS idx_clients_user_phone ON clients (user_id, whatsapp_digits)"
             }
         ]
 
@@ -364,8 +469,7 @@ def migrate_database(app):
             index_name = migration['index']
 
             if table_name in inspector.get_table_names():
-                indexes = inspector.get_indexes(table_name)
-                existing_indexes = [idx['name'] for idx in indexes]
+                existing_indexes = index_names(inspector, table_name)
 
                 if index_name not in existing_indexes:
                     try:
@@ -376,12 +480,88 @@ def migrate_database(app):
                         db.session.rollback()
                         print(f"Migration warning for {table_name}.{index_name}: {e}")
 
+        # receipt_number used to be unique across all users, so two tenants with the
+        # default format collided; it is now unique per user (uq_receipts_user_number).
+        # SQLite cannot drop a column constraint in place: the table is rebuilt without it.
+        if 'receipts' in inspector.get_table_names() and db.engine.dialect.name == 'sqlite':
+            if sqlite_has_global_receipt_number_constraint():
+                try:
+                    rebuild_sqlite_receipts_table()
+                    db.session.commit()
+                    print("Migration: Rebuilt receipts without the global unique constraint on receipt_number")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Migration warning for receipts.receipt_number: {e}")
+        elif 'receipts' in inspector.get_table_names():
+            for constraint in inspector.get_unique_constraints('receipts'):
+                if constraint.get('name') and constraint['column_names'] == ['receipt_number']:
+                    try:
+                        db.session.execute(text(f"ALTER TABLE receipts DROP CONSTRAINT {constraint['name']}"))
+                        db.session.commit()
+                        print(f"Migration: Dropped global unique constraint '{constraint['name']}' on receipts.receipt_number")
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Migration warning for receipts.{constraint['name']}: {e}")
+
+        # Clients created before whatsapp_digits existed
+        if 'clients' in inspector.get_table_names():
+            from utils.phone import phone_digits
+            rows = db.session.execute(text(
+                "SELECT id, whatsapp FROM clients WHERE whatsapp_digits IS NULL"
+            )).all()
+            for client_id, whatsapp in rows:
+                db.session.execute(text("UPDATE clients SET whatsapp_digits = :digits WHERE id = :id"),
+                                   {'digits': phone_digits(whatsapp), 'id': client_id})
+            if rows:
+                db.session.commit()
+                print(f"Migration: Normalized phone numbers of {len(rows)} clients")
+
+def sqlite_has_global_receipt_number_constraint():
+    # UNIQUE constraints show up as indexes of origin 'u' (sqlite_autoindex_receipts_N)
+    for _, name, _, origin, _ in db.session.execute(text("PRAGMA index_list('receipts')")):
+        if origin == 'u':
+            columns = [row[2] for row in db.session.execute(text(f"PRAGMA index_info('{name}')"))]
+            if columns == ['receipt_number']:
+                return True
+    return False
+
+def rebuild_sqlite_receipts_table():
+    """
+    Recreate `receipts` from the model definition and copy its rows (SQLite's
+    create / copy / drop / rename procedure), then recreate the model's indexes.
+    Runs in the session transaction; the caller commits.
+    """
+    table = Receipt.__table__
+    create_sql = str(CreateTable(table).compile(dialect=db.engine.dialect)).strip()
+    existing = [row[1] for row in db.session.execute(text("PRAGMA table_info('receipts')"))]
+    columns = ', '.join(column.name for column in table.columns if column.name in existing)
+
+    db.session.execute(text("DROP TABLE IF EXISTS receipts_rebuild"))
+    db.session.execute(text(create_sql.replace('CREATE TABLE receipts ', 'CREATE TABLE receipts_rebuild ', 1)))
+    db.session.execute(text(f"INSERT INTO receipts_rebuild ({columns}) SELECT {columns} FROM receipts"))
+    db.session.execute(text("DROP TABLE receipts"))
+    db.session.execute(text("ALTER TABLE receipts_rebuild RENAME TO receipts"))
+    for index in table.indexes:
+        db.session.execute(CreateIndex(index, if_not_exists=True))
+
+def index_names(inspector, table_name):
+    # SQLAlchemy does not reflect expression indexes such as lower(name) on SQLite
+    if db.engine.dialect.name == 'sqlite':
+        return [row[0] for row in db.session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        ), {'table': table_name})]
+    return [idx['name'] for idx in inspector.get_indexes(table_name)]
+
 def init_database(app):
     db.init_app(app)
     with app.app_context():
         db.create_all()
         
         migrate_database(app)
+
+        from services.search import ensure_search_schema
+        if ensure_search_schema():
+            print("Created the receipt search index")
         
         # Force SITE_URL from environment if present (as requested for deployment)
         site_url_env = os.environ.get('SITE_URL')
@@ -1,3 +1,3 @@
-from models.db_models import Client, Receipt, Settings, Company, User
+from models.db_models import Client, Receipt, Settings, Company, User, DocumentJob, UserStats
 
-__all__ = ['Client', 'Receipt', 'Settings', 'Company', 'User']
+__all__ = ['Client', 'Receipt', 'Settings', 'Company', 'User', 'DocumentJob', 'UserStats']
@@ -1,9 +1,19 @@
 import uuid
 import os
-from flask import request
+import json
+import time
+import threading
+from flask import request, g, has_request_context, current_app
 from datetime import datetime
-from init_db import db, Company as CompanyModel, Client as ClientModel, Receipt as ReceiptModel, Settings as SettingsModel, User as UserModel
+from decimal import Decimal
+from init_db import db, Company as CompanyModel, Client as ClientModel, Receipt as ReceiptModel, Settings as SettingsModel, User as UserModel, DocumentJob as DocumentJobModel, ReceiptSequence as ReceiptSequenceModel, UserStats as UserStatsModel
+from sqlalchemy import update, tuple_, select, and_, case, or_, func
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
+from services.numbering import format_receipt_number, number_pattern, effective_reset, period_bounds, DEFAULT_NUMBER_FORMAT
+from models.records import ReceiptRecord, ClientRecord, CompanyRecord
+from services.search import index_receipt, unindex_receipt, reindex_client_receipts, reindex_company_receipts
+from utils.phone import phone_digits, looks_like_phone
 
 class User:
     @staticmethod
@@ -63,6 +73,7 @@ class User:
     def delete(user_id):
         user = UserModel.query.get(user_id)
         if user:
+            UserStatsModel.query.filter_by(user_id=user_id).delete()
             db.session.delete(user)
             db.session.commit()
     
@@ -97,6 +108,16 @@ class Company:
         company = query.first()
         return Company._to_dict(company) if company else None
     
+    @staticmethod
+    def get_map_by_ids(company_ids, user_id=None):
+        company_ids = [c for c in set(company_ids) if c]
+        if not company_ids:
+            return {}
+        query = CompanyModel.query.filter(CompanyModel.id.in_(company_ids))
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        return {c.id: Company._to_dict(c) for c in query.all()}
+    
     @staticmethod
     def create(user_id, name, address='', tax_id='', phone='', logo=''):
         new_company = CompanyModel(
@@ -120,9 +141,13 @@ class Company:
             query = query.filter_by(user_id=user_id)
         company = query.first()
         if company:
+            renamed = 'name' in kwargs and kwargs['name'] != company.name
             for key, value in kwargs.items():
                 if hasattr(company, key) and key not in ['id', 'user_id']:
                     setattr(company, key, value)
+            if renamed:
+                db.session.flush()
+                reindex_company_receipts(company.user_id, company.id)
             db.session.commit()
             return Company._to_dict(company)
         return None
@@ -135,6 +160,8 @@ class Company:
         company = query.first()
         if company:
             db.session.delete(company)
+            db.session.flush()
+            reindex_company_receipts(company.user_id, company.id)
             db.session.commit()
     
     @staticmethod
@@ -153,6 +180,8 @@ class Company:
         }
 
 class Client:
+    LOOKUP_LIMIT = 10
+
     @staticmethod
     def get_all(user_id=None):
         query = ClientModel.query
@@ -179,6 +208,46 @@ class Client:
         clients = query.all()
         return {c.id: Client._to_dict(c) for c in clients}
     
+    @staticmethod
+    def get_map_by_ids(client_ids, user_id=None):
+        client_ids = [c for c in set(client_ids) if c]
+        if not client_ids:
+            return {}
+        query = ClientModel.query.filter(ClientModel.id.in_(client_ids))
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        return {c.id: Client._to_dict(c) for c in query.all()}
+    
+    @staticmethod
+    def lookup(user_id, query, limit=LOOKUP_LIMIT):
+        """
+        Typeahead over a user's clients, best matches first: names starting with
+        `query`, WhatsApp numbers starting with it (any format, see phone_digits),
+        then names with a later word starting with it. The first two are range
+        scans on idx_clients_user_name / idx_clients_user_phone; the last one only
+        runs when they leave room.
+        """
+        query = ' '.join((query or '').split()).lower()
+        if not query or not user_id:
+            return []
+        name = func.lower(ClientModel.name)
+        steps = [and_(name >= query, name < _prefix_end(query))]
+        digits = phone_digits(query) if looks_like_phone(query) else ''
+        if digits:
+            steps.append(and_(ClientModel.whatsapp_digits >= digits,
+                              ClientModel.whatsapp_digits < _prefix_end(digits)))
+        steps.append(name.contains(' ' + query, autoescape=True))
+
+        found = {}
+        for condition in steps:
+            if len(found) >= limit:
+                break
+            clients = (ClientModel.query.filter(ClientModel.user_id == user_id, condition)
+                       .order_by(name, ClientModel.id).limit(limit).all())
+            for client in clients:
+                found.setdefault(client.id, client)
+        return [Client._to_dict(c) for c in list(found.values())[:limit]]
+
     @staticmethod
     def create(user_id, name, whatsapp='', email=''):
         new_client = ClientModel(
@@ -186,10 +255,12 @@ class Client:
             user_id=user_id,
             name=name,
             whatsapp=whatsapp,
+            whatsapp_digits=phone_digits(whatsapp),
             email=email,
             created_at=datetime.utcnow()
         )
         db.session.add(new_client)
+        UserStats.client_added(user_id)
         db.session.commit()
         return Client._to_dict(new_client)
     
@@ -201,8 +272,12 @@ class Client:
         client = query.first()
         if client:
             for key, value in kwargs.items():
-                if hasattr(client, key) and key not in ['id', 'user_id']:
+                if hasattr(client, key) and key not in ['id', 'user_id', 'whatsapp_digits']:
                     setattr(client, key, value)
+            client.whatsapp_digits = phone_digits(client.whatsapp)
+            db.session.flush()
+            # Name, phone and e-mail are part of the search documents of the client's receipts
+            reindex_client_receipts(client.user_id, client.id)
             db.session.commit()
             return Client._to_dict(client)
         return None
@@ -215,6 +290,9 @@ class Client:
         client = query.first()
         if client:
             db.session.delete(client)
+            UserStats.client_removed(client.user_id)
+            db.session.flush()
+            reindex_client_receipts(client.user_id, client.id)
             db.session.commit()
     
     @staticmethod
@@ -237,7 +315,27 @@ class Client:
             'created_at': client.created_at.isoformat() if client.created_at else ''
         }
 
+def _prefix_end(prefix):
+    """Smallest string greater than every string starting with `prefix` (upper bound of an index range scan)"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
 class Receipt:
+    # Receipt list filters: name -> condition on the parsed value (routes.receipts.parse_receipt_filters)
+    FILTERS = {
+        'start': lambda value: ReceiptModel.created_at >= value,
+        'end': lambda value: ReceiptModel.created_at < value,
+        'payment_method': lambda value: ReceiptModel.payment_method == value,
+        'client_id': lambda value: ReceiptModel.client_id == value,
+        'company_id': lambda value: ReceiptModel.company_id == value,
+        'min_amount': lambda value: ReceiptModel.amount >= value,
+        'max_amount': lambda value: ReceiptModel.amount <= value,
+    }
+
+    @staticmethod
+    def filter_conditions(filters):
+        """WHERE conditions of the filters that are set, to be ANDed with the owner"""
+        return [Receipt.FILTERS[name](value) for name, value in (filters or {}).items() if value is not None]
+
     @staticmethod
     def get_all(user_id=None):
         query = ReceiptModel.query
@@ -268,24 +366,174 @@ class Receipt:
         return [Receipt._to_dict(r) for r in receipts]
     
     @staticmethod
-    def generate_receipt_number(user_id, format_template=None):
-        if not format_template:
-            format_template = 'REC-{YYYY}{MM}{DD}-{N}'
-        
-        count = ReceiptModel.query.filter_by(user_id=user_id).count() + 1
-        now = datetime.now()
-        
-        receipt_number = format_template
-        receipt_number = receipt_number.replace('{YYYY}', now.strftime('%Y'))
-        receipt_number = receipt_number.replace('{MM}', now.strftime('%m'))
-        receipt_number = receipt_number.replace('{DD}', now.strftime('%d'))
-        receipt_number = receipt_number.replace('{N}', f'{count:04d}')
-        
-        return receipt_number
+    def get_bundle(receipt_id, user_id=None):
+        """
+        A receipt with its client and company as one ReceiptRecord, read in a
+        single joined SELECT of the columns documents need (no ORM objects).
+        Related rows are matched on the receipt owner, as for public views.
+        """
+        if not receipt_id:
+            return None
+        query = Receipt._bundle_select().where(ReceiptModel.id == receipt_id)
+        if user_id:
+            query = query.where(ReceiptModel.user_id == user_id)
+        row = db.session.execute(query).first()
+        return Receipt._to_record(row) if row else None
+
+    @staticmethod
+    def get_bundles(receipt_ids, user_id):
+        """ReceiptRecords of the given ids (one joined query), in the order of `receipt_ids`"""
+        if not receipt_ids:
+            return []
+        # Ownership is checked on the rows: with user_id in the WHERE clause SQLite may pick
+        # the (user_id, ...) index and walk every receipt of the user instead of the primary key
+        query = Receipt._bundle_select().where(ReceiptModel.id.in_(receipt_ids))
+        records = {row.id: Receipt._to_record(row) for row in db.session.execute(query) if row.user_id == user_id}
+        return [records[receipt_id] for receipt_id in receipt_ids if receipt_id in records]
+
+    @staticmethod
+    def get_page(user_id, cursor=None, limit=50, filters=None):
+        """
+        One page of a user's receipts (as ReceiptRecords with client and company),
+        newest first, and the cursor of the next page (None on the last one).
+        Keyset pagination on (created_at, id): every page is an index range scan
+        on idx_receipts_user_created (or the index of the filter), however deep it is.
+        """
+        query = Receipt._bundle_select().where(ReceiptModel.user_id == user_id, *Receipt.filter_conditions(filters))
+        if cursor:
+            created_at, receipt_id = cursor
+            query = query.where(tuple_(ReceiptModel.created_at, ReceiptModel.id) < tuple_(created_at, receipt_id))
+        query = query.order_by(ReceiptModel.created_at.desc(), ReceiptModel.id.desc()).limit(limit + 1)
+        rows = db.session.execute(query).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].created_at, rows[-1].id)
+        return [Receipt._to_record(r) for r in rows], next_cursor
+    
+    @staticmethod
+    def get_totals(user_id, filters=None):
+        """Number and total amount of the receipts matching `filters`, all pages included"""
+        conditions = Receipt.filter_conditions(filters)
+        if not conditions:
+            stats = UserStats.get(user_id)
+            return {'count': stats['receipt_count'], 'total': stats['total_amount']}
+        count, total = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(ReceiptModel.amount), 0))
+            .where(ReceiptModel.user_id == user_id, *conditions)
+        ).one()
+        return {'count': count, 'total': round(float(total), 2)}
+
+    @staticmethod
+    def _many_query(user_id, receipt_ids=None, start=None, end=None):
+        query = ReceiptModel.query.filter_by(user_id=user_id)
+        if receipt_ids is not None:
+            query = query.filter(ReceiptModel.id.in_(receipt_ids))
+        if start:
+            query = query.filter(ReceiptModel.created_at >= start)
+        if end:
+            query = query.filter(ReceiptModel.created_at < end)
+        return query
+
+    @staticmethod
+    def get_many(user_id, receipt_ids=None, start=None, end=None, limit=None):
+        """Receipts by id list and/or created_at range [start, end), oldest first, in one query"""
+        query = Receipt._many_query(user_id, receipt_ids, start, end).order_by(ReceiptModel.created_at)
+        if limit:
+            query = query.limit(limit)
+        return [Receipt._to_dict(r) for r in query.all()]
+
+    @staticmethod
+    def count_many(user_id, receipt_ids=None, start=None, end=None):
+        return Receipt._many_query(user_id, receipt_ids, start, end).count()
+
+    @staticmethod
+    def iter_many(user_id, receipt_ids=None, start=None, end=None, chunk_size=500):
+        """
+        The receipts of get_many as lists of at most `chunk_size`, oldest first.
+        Each chunk is one keyset query on (created_at, id), so no cursor stays
+        open between chunks and a range of any size runs in constant memory.
+        """
+        after = None
+        while True:
+            query = Receipt._many_query(user_id, receipt_ids, start, end)
+            if after:
+                query = query.filter(tuple_(ReceiptModel.created_at, ReceiptModel.id) > tuple_(*after))
+            rows = query.order_by(ReceiptModel.created_at, ReceiptModel.id).limit(chunk_size).all()
+            if not rows:
+                return
+            yield [Receipt._to_dict(r) for r in rows]
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1].created_at, rows[-1].id)
+    
+    @staticmethod
+    def iter_for_client(user_id, client_id, start=None, end=None, batch_size=500):
+        """
+        Stream a client's receipts in [start, end), oldest first, as light dicts.
+        Rows are fetched `batch_size` at a time so statements of any length run
+        in constant memory.
+        """
+        query = db.session.query(
+            ReceiptModel.receipt_number,
+            ReceiptModel.created_at,
+            ReceiptModel.description,
+            ReceiptModel.amount,
+            ReceiptModel.payment_method
+        ).filter(ReceiptModel.user_id == user_id, ReceiptModel.client_id == client_id)
+        if start:
+            query = query.filter(ReceiptModel.created_at >= start)
+        if end:
+            query = query.filter(ReceiptModel.created_at < end)
+        query = query.order_by(ReceiptModel.created_at, ReceiptModel.id).execution_options(yield_per=batch_size)
+        for row in query:
+            yield {
+                'receipt_number': row.receipt_number,
+                'created_at': row.created_at,
+                'description': row.description,
+                'amount': row.amount,
+                'payment_method': row.payment_method
+            }
+
+    @staticmethod
+    def generate_receipt_number(user_id, format_template=None, reset='never', now=None):
+        """
+        Next receipt number of a user from their sequence counter (O(1), no COUNT).
+        Must run inside the transaction that inserts the receipt: the counter row
+        stays locked until commit, and a failed insert gives the number back.
+        `now` is the receipt's created_at (UTC), so periods follow the stored dates.
+        """
+        format_template = format_template or DEFAULT_NUMBER_FORMAT
+        now = now or datetime.utcnow()
+        period, start, end = period_bounds(effective_reset(format_template, reset), now)
+
+        def seed():
+            # First number of a period: continue after the receipts it already holds,
+            # and after the highest number of this format (deleted receipts leave gaps)
+            query = ReceiptModel.query.filter_by(user_id=user_id)
+            if start:
+                query = query.filter(ReceiptModel.created_at >= start, ReceiptModel.created_at < end)
+            pattern, prefix = number_pattern(format_template)
+            highest = 0
+            if pattern.groups:
+                numbers = query.filter(ReceiptModel.receipt_number.startswith(prefix, autoescape=True)) \
+                    .with_entities(ReceiptModel.receipt_number).yield_per(1000)
+                for (number,) in numbers:
+                    match = pattern.match(number or '')
+                    if match:
+                        highest = max(highest, int(match.group(1)))
+            return max(highest, query.count())
+
+        count = ReceiptSequence.next_value(user_id, period, seed)
+        return format_receipt_number(format_template, count, now)
     
     @staticmethod
-    def create(user_id, client_id, description, amount, payment_method, company_id='', receipt_number_format=None):
-        receipt_number = Receipt.generate_receipt_number(user_id, receipt_number_format)
+    def create(user_id, client_id, description, amount, payment_method, company_id='', receipt_number_format=None,
+               receipt_number_reset='never'):
+        created_at = datetime.utcnow()
+        receipt_number = Receipt.generate_receipt_number(user_id, receipt_number_format, receipt_number_reset,
+                                                         now=created_at)
         
         new_receipt = ReceiptModel(
             id=str(uuid.uuid4()),
@@ -296,9 +544,12 @@ class Receipt:
             description=description,
             amount=float(amount) if amount else 0,
             payment_method=payment_method,
-            created_at=datetime.utcnow()
+            created_at=created_at
         )
         db.session.add(new_receipt)
+        UserStats.receipt_added(user_id, new_receipt.amount, payment_method, new_receipt.created_at)
+        db.session.flush()
+        index_receipt(new_receipt.id)
         db.session.commit()
         return Receipt._to_dict(new_receipt)
     
@@ -310,6 +561,8 @@ class Receipt:
         receipt = query.first()
         if receipt:
             db.session.delete(receipt)
+            UserStats.receipt_removed(receipt.user_id, receipt.amount, receipt.payment_method)
+            unindex_receipt(receipt.id)
             db.session.commit()
     
     @staticmethod
@@ -328,6 +581,41 @@ class Receipt:
         result = query.scalar()
         return float(result) if result else 0
     
+    @staticmethod
+    def _bundle_select():
+        return select(
+            ReceiptModel.id, ReceiptModel.user_id, ReceiptModel.receipt_number, ReceiptModel.client_id,
+            ReceiptModel.company_id, ReceiptModel.description, ReceiptModel.amount, ReceiptModel.payment_method,
+            ReceiptModel.created_at,
+            ClientModel.id.label('client_pk'), ClientModel.name.label('client_name'),
+            ClientModel.whatsapp.label('client_whatsapp'), ClientModel.email.label('client_email'),
+            CompanyModel.id.label('company_pk'), CompanyModel.name.label('company_name'),
+            CompanyModel.address.label('company_address'), CompanyModel.tax_id.label('company_tax_id'),
+            CompanyModel.phone.label('company_phone'), CompanyModel.logo.label('company_logo')
+        ).outerjoin(
+            ClientModel, and_(ClientModel.id == ReceiptModel.client_id, ClientModel.user_id == ReceiptModel.user_id)
+        ).outerjoin(
+            CompanyModel, and_(CompanyModel.id == ReceiptModel.company_id, CompanyModel.user_id == ReceiptModel.user_id)
+        )
+
+    @staticmethod
+    def _to_record(row):
+        # Values formatted exactly like _to_dict so render cache keys are unchanged
+        client = None
+        if row.client_pk:
+            client = ClientRecord(row.client_pk, row.client_name, row.client_whatsapp, row.client_email)
+        company = None
+        if row.company_pk:
+            company = CompanyRecord(row.company_pk, row.company_name, row.company_address, row.company_tax_id,
+                                    row.company_phone, row.company_logo)
+        return ReceiptRecord(
+            row.id, row.user_id, row.receipt_number, row.client_id, row.company_id, row.description,
+            str(row.amount) if row.amount else '0',
+            row.payment_method,
+            row.created_at.isoformat() if row.created_at else '',
+            client, company
+        )
+
     @staticmethod
     def _to_dict(receipt):
         if not receipt:
@@ -344,12 +632,382 @@ class Receipt:
             'created_at': receipt.created_at.isoformat() if receipt.created_at else ''
         }
 
+class ReceiptSequence:
+    @staticmethod
+    def next_value(user_id, period, seed):
+        """
+        Atomically increment and return the counter of (user_id, period).
+        The UPDATE ... RETURNING row-locks the counter until the caller commits;
+        `seed()` is only called the first time a period is used.
+        """
+        bump = update(ReceiptSequenceModel).where(
+            ReceiptSequenceModel.user_id == user_id,
+            ReceiptSequenceModel.period == period
+        ).values(value=ReceiptSequenceModel.value + 1).returning(ReceiptSequenceModel.value)
+
+        value = db.session.execute(bump).scalar()
+        if value is not None:
+            return value
+
+        value = seed() + 1
+        try:
+            with db.session.begin_nested():
+                db.session.add(ReceiptSequenceModel(user_id=user_id, period=period, value=value))
+        except IntegrityError:
+            # A concurrent request created the counter first: take the next value from it
+            value = db.session.execute(bump).scalar()
+        return value
+
+class UserStats:
+    # payment_method -> user_stats column; other methods add up in other_total
+    PAYMENT_COLUMNS = {'cash': 'cash_total', 'card': 'card_total', 'transfer': 'transfer_total', 'check': 'check_total'}
+
+    @staticmethod
+    def get(user_id):
+        """A user's dashboard summary: one primary-key lookup, built from the tables the first time"""
+        stats = db.session.get(UserStatsModel, user_id)
+        if stats is None:
+            UserStats.rebuild(user_id)
+            stats = db.session.get(UserStatsModel, user_id)
+        return UserStats._to_dict(stats)
+
+    @staticmethod
+    def receipt_added(user_id, amount, payment_method, created_at):
+        amount = Decimal(str(amount or 0))
+        column = getattr(UserStatsModel, UserStats.PAYMENT_COLUMNS.get(payment_method, 'other_total'))
+        last = UserStatsModel.last_receipt_at
+        UserStats._apply(user_id, {
+            'receipt_count': UserStatsModel.receipt_count + 1,
+            'total_amount': UserStatsModel.total_amount + amount,
+            column.key: column + amount,
+            'last_receipt_at': case((or_(last.is_(None), last < created_at), created_at), else_=last),
+        })
+
+    @staticmethod
+    def receipt_removed(user_id, amount, payment_method):
+        amount = Decimal(str(amount or 0))
+        column = getattr(UserStatsModel, UserStats.PAYMENT_COLUMNS.get(payment_method, 'other_total'))
+        db.session.flush()
+        UserStats._apply(user_id, {
+            'receipt_count': UserStatsModel.receipt_count - 1,
+            'total_amount': UserStatsModel.total_amount - amount,
+            column.key: column - amount,
+            # Index lookup on idx_receipts_user_created
+            'last_receipt_at': select(func.max(ReceiptModel.created_at))
+                .where(ReceiptModel.user_id == user_id).scalar_subquery(),
+        })
+
+    @staticmethod
+    def client_added(user_id):
+        UserStats._apply(user_id, {'client_count': UserStatsModel.client_count + 1})
+
+    @staticmethod
+    def client_removed(user_id):
+        UserStats._apply(user_id, {'client_count': UserStatsModel.client_count - 1})
+
+    @staticmethod
+    def _apply(user_id, values):
+        """
+        Update a user's summary inside the caller's transaction, so it commits or
+        rolls back with the receipt/client change. A user without a summary yet
+        gets one computed from the tables, which already include the change.
+        """
+        bump = update(UserStatsModel).where(UserStatsModel.user_id == user_id).values(
+            version=UserStatsModel.version + 1, updated_at=datetime.utcnow(), **values
+        ).execution_options(synchronize_session=False)
+        if db.session.execute(bump).rowcount:
+            return
+        db.session.flush()
+        try:
+            with db.session.begin_nested():
+                db.session.add(UserStatsModel(**UserStats._compute(user_id)))
+        except IntegrityError:
+            # Created concurrently from a snapshot that does not include this change
+            db.session.execute(bump)
+
+    @staticmethod
+    def _compute(user_id):
+        """Summary values of a user aggregated from the receipts and clients tables"""
+        values = {
+            'user_id': user_id,
+            'receipt_count': 0,
+            'client_count': ClientModel.query.filter_by(user_id=user_id).count(),
+            'total_amount': Decimal('0'),
+            'last_receipt_at': None,
+            'updated_at': datetime.utcnow(),
+        }
+        for column in list(UserStats.PAYMENT_COLUMNS.values()) + ['other_total']:
+            values[column] = Decimal('0')
+        rows = db.session.query(
+            ReceiptModel.payment_method,
+            func.count(ReceiptModel.id),
+            func.sum(ReceiptModel.amount),
+            func.max(ReceiptModel.created_at)
+        ).filter(ReceiptModel.user_id == user_id).group_by(ReceiptModel.payment_method)
+        for payment_method, count, total, last in rows:
+            total = Decimal(str(total or 0))
+            values['receipt_count'] += count
+            values['total_amount'] += total
+            values[UserStats.PAYMENT_COLUMNS.get(payment_method, 'other_total')] += total
+            if last and (values['last_receipt_at'] is None or last > values['last_receipt_at']):
+                values['last_receipt_at'] = last
+        return values
+
+    @staticmethod
+    def rebuild(user_id=None):
+        """
+        Recompute the summary of one user (all users when None) from the tables
+        and store it. Returns the ids of users whose stored summary was missing or
+        had drifted.
+        """
+        if user_id:
+            user_ids = [user_id]
+        else:
+            user_ids = [row[0] for row in db.session.query(UserModel.id)]
+        drifted = []
+        for uid in user_ids:
+            values = UserStats._compute(uid)
+            stats = db.session.get(UserStatsModel, uid)
+            if stats is None:
+                db.session.add(UserStatsModel(**values))
+                drifted.append(uid)
+                continue
+            stored = UserStats._to_dict(stats)
+            for key, value in values.items():
+                setattr(stats, key, value)
+            if stored != UserStats._to_dict(stats):
+                stats.version = (stats.version or 0) + 1
+                drifted.append(uid)
+        db.session.commit()
+        return drifted
+
+    @staticmethod
+    def _to_dict(stats):
+        if not stats:
+            return None
+        return {
+            'user_id': stats.user_id,
+            'receipt_count': stats.receipt_count or 0,
+            'client_count': stats.client_count or 0,
+            'total_amount': round(float(stats.total_amount or 0), 2),
+            'payment_totals': {
+                method: round(float(getattr(stats, column) or 0), 2)
+                for method, column in list(UserStats.PAYMENT_COLUMNS.items()) + [('other', 'other_total')]
+            },
+            'last_receipt_at': stats.last_receipt_at.isoformat() if stats.last_receipt_at else '',
+            'version': stats.version or 0
+        }
+
+class DocumentJob:
+    @staticmethod
+    def create(user_id, kind, params):
+        now = datetime.utcnow()
+        job = DocumentJobModel(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            kind=kind,
+            status='queued',
+            params=json.dumps(params),
+            created_at=now,
+            updated_at=now
+        )
+        db.session.add(job)
+        db.session.commit()
+        return DocumentJob._to_dict(job)
+    
+    @staticmethod
+    def get_by_id(job_id, user_id=None):
+        if not job_id:
+            return None
+        query = DocumentJobModel.query.filter_by(id=job_id)
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        job = query.first()
+        return DocumentJob._to_dict(job) if job else None
+    
+    @staticmethod
+    def claim_next(worker):
+        """
+        Atomically move the oldest queued job to 'running' for `worker`.
+        The conditional UPDATE makes two dispatchers racing for the same row safe.
+        """
+        candidates = db.session.query(DocumentJobModel.id).filter_by(status='queued') \
+            .order_by(DocumentJobModel.created_at).limit(5).all()
+        for (job_id,) in candidates:
+            now = datetime.utcnow()
+            claimed = DocumentJobModel.query.filter_by(id=job_id, status='queued').update({
+                'status': 'running',
+                'worker': worker,
+                'attempts': DocumentJobModel.attempts + 1,
+                'started_at': now,
+                'updated_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return DocumentJob.get_by_id(job_id)
+        return None
+    
+    @staticmethod
+    def update(job_id, **kwargs):
+        kwargs['updated_at'] = datetime.utcnow()
+        DocumentJobModel.query.filter_by(id=job_id).update(kwargs, synchronize_session=False)
+        db.session.commit()
+    
+    @staticmethod
+    def requeue_stale(stale_before, max_attempts):
+        """Give running jobs whose worker stopped reporting back to the queue; returns the count"""
+        stale = DocumentJobModel.query.filter(
+            DocumentJobModel.status == 'running',
+            DocumentJobModel.updated_at < stale_before
+        )
+        failed = stale.filter(DocumentJobModel.attempts >= max_attempts).update({
+            'status': 'failed',
+            'error': 'Worker stopped before the job finished',
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        requeued = stale.filter(DocumentJobModel.attempts < max_attempts).update({
+            'status': 'queued',
+            'progress': 0
+        }, synchronize_session=False)
+        db.session.commit()
+        return requeued + failed
+    
+    @staticmethod
+    def pop_expired(now):
+        """Delete jobs past their expiry and return them, so their result files can be removed"""
+        jobs = DocumentJobModel.query.filter(DocumentJobModel.expires_at < now).all()
+        expired = [DocumentJob._to_dict(j) for j in jobs]
+        for job in jobs:
+            db.session.delete(job)
+        db.session.commit()
+        return expired
+    
+    @staticmethod
+    def _to_dict(job):
+        if not job:
+            return None
+        return {
+            'id': job.id,
+            'user_id': job.user_id,
+            'kind': job.kind,
+            'status': job.status,
+            'params': json.loads(job.params or '{}'),
+            'progress': job.progress or 0,
+            'total': job.total or 0,
+            'attempts': job.attempts or 0,
+            'result_path': job.result_path or '',
+            'result_name': job.result_name or '',
+            'mimetype': job.mimetype or '',
+            'error': job.error or '',
+            'created_at': job.created_at.isoformat() if job.created_at else '',
+            'started_at': job.started_at.isoformat() if job.started_at else '',
+            'finished_at': job.finished_at.isoformat() if job.finished_at else '',
+            'expires_at': job.expires_at.isoformat() if job.expires_at else ''
+        }
+
+_settings_cache_lock = threading.Lock()
+
 class Settings:
+    # Seconds a process trusts its cached settings before re-checking the row versions
+    CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', 30))
+
     @staticmethod
     def get(user_id=None):
+        """
+        Settings of a user overlaid on the global ones.
+
+        Memoized per request in flask.g, and per process for CACHE_TTL seconds;
+        after that one small query compares the row versions and the dict is only
+        rebuilt when Settings.save ran since, in this worker or another one.
+        """
+        memo = Settings._request_memo()
+        if memo is not None and user_id in memo:
+            return dict(memo[user_id])
+
+        settings = dict(Settings._cached(user_id))
+        if not settings['site_url']:
+            # Fallback to request.url_root if no Env var and no DB value (never cached)
+            try:
+                if request:
+                    settings['site_url'] = request.url_root.rstrip('/')
+            except RuntimeError:
+                # Working outside of request context
+                pass
+            except Exception:
+                pass
+
+        if memo is not None:
+            memo[user_id] = settings
+            return dict(settings)
+        return settings
+
+    @staticmethod
+    def invalidate(user_id=None):
+        """Drop cached settings of a user, or of everyone when the global row changed (user_id None)"""
+        cache = Settings._cache()
+        with _settings_cache_lock:
+            if user_id is None:
+                cache.clear()
+            else:
+                cache.pop(user_id, None)
+        if has_request_context():
+            g.pop('_settings', None)
+
+    @staticmethod
+    def _request_memo():
+        if not has_request_context():
+            return None
+        # Tied to the request object: an app context (and its g) may outlive one request
+        current = request._get_current_object()
+        memo = g.get('_settings')
+        if memo is None or memo[0] is not current:
+            memo = g._settings = (current, {})
+        return memo[1]
+
+    @staticmethod
+    def _cache():
+        # user_id -> (row versions, monotonic time of the last version check, settings), per app
+        return current_app.extensions.setdefault('settings_cache', {})
+
+    @staticmethod
+    def _cached(user_id):
+        cache = Settings._cache()
+        now = time.monotonic()
+        entry = cache.get(user_id)
+        if entry and now - entry[1] < Settings.CACHE_TTL:
+            return entry[2]
+
+        versions = Settings._versions(user_id)
+        if entry and entry[0] == versions:
+            settings = entry[2]
+        else:
+            settings = Settings._load(user_id)
+        with _settings_cache_lock:
+            cache[user_id] = (versions, now, settings)
+        return settings
+
+    @staticmethod
+    def _versions(user_id):
+        """(global row version, user row version) in one query; None for a missing row"""
+        condition = SettingsModel.user_id.is_(None)
+        if user_id:
+            condition = or_(condition, SettingsModel.user_id == user_id)
+        global_version = user_version = None
+        for row_user_id, version in db.session.query(SettingsModel.user_id, SettingsModel.version).filter(condition):
+            if row_user_id is None:
+                global_version = version or 0
+            else:
+                user_version = version or 0
+        return global_version, user_version
+
+    @staticmethod
+    def _load(user_id):
         defaults = {
             'thermal_width': 58,
+            'thermal_density': 0,
+            'pdf_renderer': 'canvas',
             'receipt_number_format': 'REC-{YYYY}{MM}{DD}-{N}',
+            'receipt_number_reset': 'never',
             'timezone': 'Africa/Casablanca',
             'pwa_enabled': True,
             'pwa_app_name': 'Receipt App',
@@ -398,20 +1056,10 @@ class Settings:
             if hasattr(global_settings, 'site_url') and global_settings.site_url:
                  defaults['site_url'] = global_settings.site_url
 
-        # Priority Override: Environment Variable > DB Value > Request URL
+        # Priority Override: Environment Variable > DB Value > Request URL (added by get)
         env_site_url = os.environ.get('SITE_URL')
         if env_site_url:
             defaults['site_url'] = env_site_url.rstrip('/')
-        elif not defaults['site_url']:
-            # Fallback to request.url_root if no Env var and no DB value
-            try:
-                if request:
-                    defaults['site_url'] = request.url_root.rstrip('/')
-            except RuntimeError:
-                # Working outside of request context
-                pass
-            except Exception:
-                pass
 
         # 2. Overlay User Settings (User Prefs)
         if user_id:
@@ -419,7 +1067,10 @@ class Settings:
             if user_settings:
                 defaults.update({
                     'thermal_width': user_settings.thermal_width,
+                    'thermal_density': getattr(user_settings, 'thermal_density', 0) or 0,
+                    'pdf_renderer': getattr(user_settings, 'pdf_renderer', 'canvas') or 'canvas',
                     'receipt_number_format': getattr(user_settings, 'receipt_number_format', 'REC-{YYYY}{MM}{DD}-{N}') or 'REC-{YYYY}{MM}{DD}-{N}',
+                    'receipt_number_reset': getattr(user_settings, 'receipt_number_reset', 'never') or 'never',
                     'timezone': getattr(user_settings, 'timezone', 'Africa/Casablanca') or 'Africa/Casablanca',
                 })
 
@@ -483,8 +1134,14 @@ class Settings:
             db.session.add(settings)
 
         settings.thermal_width = settings_dict.get('thermal_width', 58)
+        if hasattr(settings, 'thermal_density'):
+            settings.thermal_density = settings_dict.get('thermal_density', 0)
+        if hasattr(settings, 'pdf_renderer'):
+            settings.pdf_renderer = settings_dict.get('pdf_renderer', 'canvas')
         if hasattr(settings, 'receipt_number_format'):
             settings.receipt_number_format = settings_dict.get('receipt_number_format', 'REC-{YYYY}{MM}{DD}-{N}')
+        if hasattr(settings, 'receipt_number_reset'):
+            settings.receipt_number_reset = settings_dict.get('receipt_number_reset', 'never')
         if hasattr(settings, 'timezone'):
             settings.timezone = settings_dict.get('timezone', 'Africa/Casablanca')
 
@@ -528,4 +1185,7 @@ class Settings:
         if hasattr(settings, 'seo_twitter_card'):
             settings.seo_twitter_card = settings_dict.get('seo_twitter_card', 'summary_large_image')
 
+        # Other workers see the new version at their next check
+        settings.version = (settings.version or 0) + 1
         db.session.commit()
+        Settings.invalidate(user_id)
@@ -0,0 +1,48 @@
+class Record:
+    """
+    Read-only projection of a SQL row.
+
+    Slots keep instances small and skip ORM hydration; `get` / `[]` make a
+    record a drop-in for the `_to_dict` dicts the renderers and templates use.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            return getattr(self, key, default)
+        return default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {name: getattr(self, name, None) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class ClientRecord(Record):
+    __slots__ = ('id', 'name', 'whatsapp', 'email')
+
+
+class CompanyRecord(Record):
+    __slots__ = ('id', 'name', 'address', 'tax_id', 'phone', 'logo')
+
+
+class ReceiptRecord(Record):
+    """A receipt with its client and company attached (None when missing)."""
+    __slots__ = ('id', 'user_id', 'receipt_number', 'client_id', 'company_id', 'description',
+                 'amount', 'payment_method', 'created_at', 'client', 'company')
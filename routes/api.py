@@ -1,23 +1,65 @@
-from flask import Blueprint, jsonify, request, session
+import os
+from flask import Blueprint, current_app, jsonify, request, session, send_file, url_for
 
-from models import Client, Receipt, Company, Settings
+from models import Client, Receipt, Settings, DocumentJob
 from services.share import get_share_message
+from services.prerender import get_prerender_queue
+from services.jobs import get_job_runner, prepare_job_params, JobError
+from services.analytics import revenue_report, breakdown_report, AnalyticsError
+from services.search import search_receipt_ids, SEARCH_PAGE_SIZE
+from utils.i18n import get_locale
+from routes.auth import superadmin_required
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+MAX_CLIENT_LOOKUP = 50
+
 @api_bp.route('/share/<receipt_id>')
 def share_data(receipt_id):
     user_id = session.get('user_id')
-    receipt = Receipt.get_by_id(receipt_id, user_id=user_id)
+    receipt = Receipt.get_bundle(receipt_id, user_id=user_id)
     if not receipt:
         return jsonify({'error': 'Receipt not found'}), 404
     
-    client = Client.get_by_id(receipt.get('client_id'), user_id=user_id)
-    company = Company.get_by_id(receipt.get('company_id'), user_id=user_id)
-    
     settings = Settings.get(user_id=user_id)
 
-    return jsonify(get_share_message(receipt, client, company, settings))
+    return jsonify(get_share_message(receipt, receipt.client, receipt.company, settings))
+
+@api_bp.route('/search')
+def search():
+    """Receipts matching every word of ?q= (number, description, amount, client, company), best first; ?page= from 1"""
+    user_id = session.get('user_id')
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    receipt_ids, has_more = search_receipt_ids(user_id, query, page=page, per_page=SEARCH_PAGE_SIZE)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'next_page': page + 1 if has_more else None,
+        'results': [search_result(receipt) for receipt in Receipt.get_bundles(receipt_ids, user_id)]
+    })
+
+def search_result(receipt):
+    return {
+        'id': receipt.id,
+        'receipt_number': receipt.receipt_number,
+        'created_at': receipt.created_at,
+        'amount': receipt.amount,
+        'description': (receipt.description or '')[:100],
+        'client': receipt.client.name if receipt.client else '',
+        'company': receipt.company.name if receipt.company else '',
+        'url': url_for('receipts.view_receipt', receipt_id=receipt.id)
+    }
+
+@api_bp.route('/clients/search')
+def search_clients():
+    """Typeahead of the receipt form: top ?limit= clients (at most MAX_CLIENT_LOOKUP) whose name or WhatsApp number matches ?q="""
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', Client.LOOKUP_LIMIT, type=int), 1), MAX_CLIENT_LOOKUP)
+    clients = Client.lookup(user_id, request.args.get('q', ''), limit=limit)
+    return jsonify({
+        'results': [{key: client[key] for key in ('id', 'name', 'whatsapp', 'email')} for client in clients]
+    })
 
 @api_bp.route('/clients/quick-add', methods=['POST'])
 def quick_add_client():
@@ -35,3 +77,81 @@ def quick_add_client():
     )
     
     return jsonify(new_client)
+
+@api_bp.route('/prerender/status')
+@superadmin_required
+def prerender_status():
+    prerender = get_prerender_queue()
+    if prerender is None:
+        return jsonify({'enabled': False})
+    return jsonify(prerender.stats())
+
+@api_bp.route('/template-context/status')
+@superadmin_required
+def template_context_status():
+    """Template renders and how many of them skipped the settings lookup"""
+    return jsonify(current_app.extensions['context_stats'].stats())
+
+@api_bp.route('/analytics/revenue')
+def analytics_revenue():
+    """Receipt count and revenue per ?period=day|week|month over ?start=&end= (local YYYY-MM-DD, inclusive)"""
+    user_id = session.get('user_id')
+    try:
+        report = revenue_report(user_id, Settings.get(user_id=user_id), request.args.get('period', 'day'),
+                                request.args.get('start'), request.args.get('end'))
+    except AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+@api_bp.route('/analytics/by/<dimension>')
+def analytics_breakdown(dimension):
+    """Receipt count and revenue per payment_method, company or client over ?start=&end=, largest first"""
+    user_id = session.get('user_id')
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        report = breakdown_report(user_id, Settings.get(user_id=user_id), dimension, request.args.get('start'),
+                                  request.args.get('end'), locale=get_locale(), limit=max(1, min(limit, 100)))
+    except AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+@api_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a long document job: {"kind": "pdf|thermal_batch|statement|export", ...params}"""
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or request.form.to_dict()
+    kind = data.get('kind')
+
+    try:
+        params = prepare_job_params(kind, data, Settings.get(user_id=user_id), get_locale())
+    except JobError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = get_job_runner().submit(user_id, kind, params)
+    return jsonify(job_status_payload(job)), 202, {'Location': url_for('api.job_status', job_id=job['id'])}
+
+@api_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = DocumentJob.get_by_id(job_id, user_id=session.get('user_id'))
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status_payload(job))
+
+@api_bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = DocumentJob.get_by_id(job_id, user_id=session.get('user_id'))
+    if not job or job['status'] != 'done' or not os.path.exists(job['result_path']):
+        return jsonify({'error': 'Result not available'}), 404
+    return send_file(
+        job['result_path'],
+        as_attachment=True,
+        download_name=job['result_name'],
+        mimetype=job['mimetype']
+    )
+
+def job_status_payload(job):
+    payload = {key: job[key] for key in ('id', 'kind', 'status', 'progress', 'total', 'error',
+                                         'created_at', 'finished_at', 'expires_at')}
+    if job['status'] == 'done':
+        payload['result_url'] = url_for('api.job_result', job_id=job['id'])
+    return payload
@@ -19,7 +19,7 @@ def branding_seo_page():
         if 'branding_logo' in request.files:
             file = request.files['branding_logo']
             if file and file.filename:
-                logo_path = save_logo(file)
+                logo_path = save_logo(file, variants=False)
                 if logo_path:
                     form_data['branding_logo_url'] = '/' + logo_path
 
@@ -42,7 +42,7 @@ def branding_seo_page():
         if 'seo_og_image' in request.files:
             file = request.files['seo_og_image']
             if file and file.filename:
-                og_image_path = save_logo(file) # save_logo is fine for OG image too
+                og_image_path = save_logo(file, variants=False) # save_logo is fine for OG image too
                 if og_image_path:
                     form_data['seo_og_image_url'] = '/' + og_image_path
 
@@ -1,6 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from flask import Blueprint, render_template, request, redirect, url_for, session, send_file
 
-from models import Client
+from models import Client, Receipt
+from services.statement import render_client_statement, statement_period, statement_filename
+from utils.dates import parse_date
 
 clients_bp = Blueprint('clients', __name__, url_prefix='/clients')
 
@@ -49,3 +53,32 @@ def delete_client(client_id):
     user_id = session.get('user_id')
     Client.delete(client_id, user_id=user_id)
     return redirect(url_for('clients.list_clients'))
+
+@clients_bp.route('/<client_id>/statement')
+def statement(client_id):
+    """Account statement PDF of a client: ?start=YYYY-MM-DD&end=YYYY-MM-DD (both optional, end inclusive)"""
+    user_id = session.get('user_id')
+    client = Client.get_by_id(client_id, user_id=user_id)
+    if not client:
+        return redirect(url_for('clients.list_clients'))
+
+    start = parse_date(request.args.get('start'))
+    end = parse_date(request.args.get('end'))
+    period = statement_period(start, end)
+
+    receipts = Receipt.iter_for_client(
+        user_id, client_id,
+        start=start,
+        end=end + timedelta(days=1) if end else None
+    )
+    # Pages are kept compressed by ReportLab; the finished file spills to disk when large
+    output = SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    render_client_statement(receipts, client, output, period=period)
+    output.seek(0)
+
+    return send_file(
+        output,
+        as_attachment=True,
+        download_name=statement_filename(client),
+        mimetype='application/pdf'
+    )
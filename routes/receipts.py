@@ -1,28 +1,82 @@
 import os
-from flask import Blueprint, render_template, request, redirect, url_for, send_file, session
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+from flask import Blueprint, Response, jsonify, render_template, request, redirect, url_for, send_file, session, stream_with_context
 
 from models import Client, Receipt, Settings, Company
-from services.pdf import generate_receipt_pdf
-from services.thermal import generate_thermal_receipt
+from services.thermal import compose_thermal_roll
+from services.documents import cached_receipt_pdf, cached_thermal_receipt, render_thermal_batch
+from services.render_pool import RenderPoolError
+from services.escpos import clamp_density
+from services.export import stream_year_archive
+from services.prerender import enqueue_prerender
+from services.jobs import get_job_runner
+from utils.dates import parse_date
+from utils.i18n import get_locale
+from utils.zipstream import stream_zip
 
 receipts_bp = Blueprint('receipts', __name__, url_prefix='/receipts')
 
+# ?format= value -> (file extension, mimetype)
+THERMAL_FORMATS = {
+    'png': ('png', 'image/png'),
+    'escpos': ('bin', 'application/octet-stream'),
+}
+MAX_BATCH_RECEIPTS = 200
+RECEIPTS_PAGE_SIZE = 50
+
 @receipts_bp.route('/')
 def list_receipts():
+    """Receipts newest first, filtered by ?start=&end= (days, inclusive), payment_method, client_id, company_id, min_amount, max_amount"""
     user_id = session.get('user_id')
-    receipts = Receipt.get_sorted(user_id=user_id)
-    client_map = Client.get_map(user_id=user_id)
-    
-    for receipt in receipts:
-        client = client_map.get(receipt.get('client_id'))
-        receipt['client'] = client
-    
-    return render_template('receipts.html', receipts=receipts)
+    filter_args, filters = parse_receipt_filters(request.args)
+    receipts, next_cursor = load_receipts_page(user_id, decode_cursor(request.args.get('cursor')), filters)
+    return render_template('receipts.html', receipts=receipts, next_cursor=next_cursor,
+                           filter_args=filter_args, totals=Receipt.get_totals(user_id, filters),
+                           filter_client=Client.get_by_id(filters['client_id'], user_id=user_id),
+                           companies=Company.get_all(user_id=user_id),
+                           current_year=datetime.now().year)
+
+@receipts_bp.route('/page')
+def receipts_page():
+    """Infinite scroll: the page after ?cursor= (same filters as the list) as rendered table rows / mobile cards plus the next cursor"""
+    user_id = session.get('user_id')
+    _, filters = parse_receipt_filters(request.args)
+    receipts, next_cursor = load_receipts_page(user_id, decode_cursor(request.args.get('cursor')), filters)
+    return jsonify({
+        'rows': render_template('partials/receipt_rows.html', receipts=receipts),
+        'cards': render_template('partials/receipt_cards.html', receipts=receipts),
+        'next_cursor': next_cursor
+    })
+
+def load_receipts_page(user_id, cursor, filters=None):
+    receipts, next_cursor = Receipt.get_page(user_id, cursor=cursor, limit=RECEIPTS_PAGE_SIZE, filters=filters)
+    return receipts, encode_cursor(next_cursor)
+
+def parse_receipt_filters(values):
+    """
+    Receipt list filters of a query string: the accepted values as given (kept in
+    the form and in page links) and parsed for Receipt.get_page / get_totals.
+    Invalid values are ignored.
+    """
+    filters = {
+        'start': parse_date(values.get('start')),
+        'end': parse_date(values.get('end')),
+        'payment_method': values.get('payment_method', '').strip() or None,
+        'client_id': values.get('client_id', '').strip() or None,
+        'company_id': values.get('company_id', '').strip() or None,
+        'min_amount': parse_amount(values.get('min_amount')),
+        'max_amount': parse_amount(values.get('max_amount')),
+    }
+    filter_args = {name: values.get(name).strip() for name, value in filters.items() if value is not None}
+    if filters['end']:
+        filters['end'] += timedelta(days=1)
+    return filter_args, filters
 
 @receipts_bp.route('/add', methods=['GET', 'POST'])
 def add_receipt():
     user_id = session.get('user_id')
-    clients = Client.get_all(user_id=user_id)
     companies = Company.get_all(user_id=user_id)
     
     if request.method == 'POST':
@@ -30,20 +84,22 @@ def add_receipt():
         new_client_name = request.form.get('new_client_name', '').strip()
         company_id = request.form.get('company_id', '')
         new_company_name = request.form.get('new_company_name', '').strip()
+        # Clients are picked through /api/clients/search: only the chosen one is loaded
+        selected_client = Client.get_by_id(client_id, user_id=user_id) if client_id != 'new' else None
         
         if client_id == 'new' and new_client_name:
-            new_client = Client.create(
+            selected_client = Client.create(
                 user_id=user_id,
                 name=new_client_name,
                 whatsapp=request.form.get('new_client_whatsapp', ''),
                 email=request.form.get('new_client_email', '')
             )
-            client_id = new_client['id']
+            client_id = selected_client['id']
         elif client_id == 'new' and not new_client_name:
-            return render_template('receipt_form.html', receipt=None, clients=clients, companies=companies,
+            return render_template('receipt_form.html', receipt=None, selected_client=None, companies=companies,
                                  error="Veuillez entrer le nom du client")
-        elif not client_id:
-            return render_template('receipt_form.html', receipt=None, clients=clients, companies=companies,
+        elif not selected_client:
+            return render_template('receipt_form.html', receipt=None, selected_client=None, companies=companies,
                                  error="Veuillez selectionner ou ajouter un client")
         
         if company_id == 'new' and new_company_name:
@@ -56,10 +112,10 @@ def add_receipt():
             )
             company_id = new_company['id']
         elif company_id == 'new' and not new_company_name:
-            return render_template('receipt_form.html', receipt=None, clients=clients, companies=companies,
+            return render_template('receipt_form.html', receipt=None, selected_client=selected_client, companies=companies,
                                  error="Veuillez entrer le nom de l'entreprise")
         elif not company_id:
-            return render_template('receipt_form.html', receipt=None, clients=clients, companies=companies,
+            return render_template('receipt_form.html', receipt=None, selected_client=selected_client, companies=companies,
                                  error="Veuillez selectionner ou ajouter une entreprise")
         
         settings = Settings.get(user_id=user_id)
@@ -72,25 +128,24 @@ def add_receipt():
             description=request.form.get('description', ''),
             amount=request.form.get('amount', '0'),
             payment_method=request.form.get('payment_method', ''),
-            receipt_number_format=receipt_number_format
+            receipt_number_format=receipt_number_format,
+            receipt_number_reset=settings.get('receipt_number_reset', 'never')
         )
         
+        # After the commit, so the pre-render worker can load the receipt
+        enqueue_prerender(new_receipt)
         session['last_receipt_id'] = new_receipt['id']
         return redirect(url_for('receipts.receipt_saved', receipt_id=new_receipt['id']))
     
-    return render_template('receipt_form.html', receipt=None, clients=clients, companies=companies)
+    return render_template('receipt_form.html', receipt=None, selected_client=None, companies=companies)
 
 @receipts_bp.route('/saved/<receipt_id>')
 def receipt_saved(receipt_id):
     user_id = session.get('user_id')
-    receipt = Receipt.get_by_id(receipt_id, user_id=user_id)
+    receipt = Receipt.get_bundle(receipt_id, user_id=user_id)
     if not receipt:
         return redirect(url_for('receipts.list_receipts'))
     
-    client = Client.get_by_id(receipt.get('client_id'), user_id=user_id)
-    receipt['client'] = client
-    company = Company.get_by_id(receipt.get('company_id'), user_id=user_id)
-    receipt['company'] = company
     settings = Settings.get(user_id=user_id)
     
     return render_template('receipt_saved.html', receipt=receipt, settings=settings)
@@ -98,18 +153,12 @@ def receipt_saved(receipt_id):
 @receipts_bp.route('/view/<receipt_id>')
 def view_receipt(receipt_id):
     user_id = session.get('user_id')
-    receipt = Receipt.get_by_id(receipt_id, user_id=user_id)
+    # Client and company come with the receipt, matched on its owner for public views
+    receipt = Receipt.get_bundle(receipt_id, user_id=user_id)
     if not receipt:
         return redirect(url_for('receipts.list_receipts'))
     
-    # Use receipt owner's ID for fetching related data to ensure consistency for public views
-    owner_id = receipt.get('user_id')
-
-    client = Client.get_by_id(receipt.get('client_id'), user_id=owner_id)
-    receipt['client'] = client
-    company = Company.get_by_id(receipt.get('company_id'), user_id=owner_id)
-    receipt['company'] = company
-    settings = Settings.get(user_id=owner_id)
+    settings = Settings.get(user_id=receipt.user_id)
     
     return render_template('receipt_view.html', receipt=receipt, settings=settings)
 
@@ -122,20 +171,17 @@ def delete_receipt(receipt_id):
 @receipts_bp.route('/pdf/<receipt_id>')
 def download_pdf(receipt_id):
     user_id = session.get('user_id')
-    receipt = Receipt.get_by_id(receipt_id, user_id=user_id)
+    receipt = Receipt.get_bundle(receipt_id, user_id=user_id)
     if not receipt:
         return redirect(url_for('receipts.list_receipts'))
     
-    owner_id = receipt.get('user_id')
-
-    client = Client.get_by_id(receipt.get('client_id'), user_id=owner_id)
-    company = Company.get_by_id(receipt.get('company_id'), user_id=owner_id)
-    settings = Settings.get(user_id=owner_id)
+    client, company = receipt.client, receipt.company
+    settings = Settings.get(user_id=receipt.user_id)
     
-    buffer = generate_receipt_pdf(receipt, client, company, settings)
+    path = cached_receipt_pdf(receipt, client, company, settings, get_locale())
     
     return send_file(
-        buffer,
+        path,
         as_attachment=True,
         download_name=f"{receipt.get('receipt_number', 'receipt')}.pdf",
         mimetype='application/pdf'
@@ -144,21 +190,160 @@ def download_pdf(receipt_id):
 @receipts_bp.route('/thermal/<receipt_id>')
 def download_thermal(receipt_id):
     user_id = session.get('user_id')
-    receipt = Receipt.get_by_id(receipt_id, user_id=user_id)
+    receipt = Receipt.get_bundle(receipt_id, user_id=user_id)
     if not receipt:
         return redirect(url_for('receipts.list_receipts'))
     
-    owner_id = receipt.get('user_id')
-
-    client = Client.get_by_id(receipt.get('client_id'), user_id=owner_id)
-    company = Company.get_by_id(receipt.get('company_id'), user_id=owner_id)
-    settings = Settings.get(user_id=owner_id)
+    client, company = receipt.client, receipt.company
+    settings = Settings.get(user_id=receipt.user_id)
     
-    buffer = generate_thermal_receipt(receipt, client, company, settings)
+    output_format = request.args.get('format', 'png')
+    if output_format not in THERMAL_FORMATS:
+        output_format = 'png'
+    ext, mimetype = THERMAL_FORMATS[output_format]
+    density = request.args.get('density', settings.get('thermal_density', 0))
+
+    try:
+        path = cached_thermal_receipt(receipt, client, company, settings,
+                                      output_format=output_format, density=density)
+    except RenderPoolError as e:
+        return render_busy_response(e)
     
     return send_file(
-        buffer,
+        path,
         as_attachment=True,
-        download_name=f"{receipt.get('receipt_number', 'receipt')}_thermal.png",
-        mimetype='image/png'
+        download_name=f"{receipt.get('receipt_number', 'receipt')}_thermal.{ext}",
+        mimetype=mimetype
+    )
+
+@receipts_bp.route('/thermal/batch', methods=['GET', 'POST'])
+def download_thermal_batch():
+    """
+    Reprint many receipts at once: ?ids=a,b,c or ?start=YYYY-MM-DD&end=YYYY-MM-DD,
+    output=roll (one image / ESC-POS stream with cuts) or output=zip (streamed archive).
+    """
+    user_id = session.get('user_id')
+    values = request.values
+
+    receipt_ids = [rid.strip() for raw in values.getlist('ids') for rid in raw.split(',') if rid.strip()]
+    start = parse_date(values.get('start'))
+    end = parse_date(values.get('end'))
+    if not receipt_ids and not start and not end:
+        return redirect(url_for('receipts.list_receipts'))
+
+    # Constant number of queries: receipts, then their clients and companies in bulk
+    receipts = Receipt.get_many(
+        user_id,
+        receipt_ids=receipt_ids or None,
+        start=start,
+        end=end + timedelta(days=1) if end else None,
+        limit=MAX_BATCH_RECEIPTS
+    )
+    if not receipts:
+        return redirect(url_for('receipts.list_receipts'))
+
+    client_map = Client.get_map_by_ids([r.get('client_id') for r in receipts], user_id=user_id)
+    company_map = Company.get_map_by_ids([r.get('company_id') for r in receipts], user_id=user_id)
+    settings = Settings.get(user_id=user_id)
+
+    output_format = values.get('format', 'png')
+    if output_format not in THERMAL_FORMATS:
+        output_format = 'png'
+    ext, mimetype = THERMAL_FORMATS[output_format]
+    density = clamp_density(values.get('density', settings.get('thermal_density', 0)))
+
+    jobs = [(r, client_map.get(r.get('client_id')), company_map.get(r.get('company_id'))) for r in receipts]
+    rendered = render_thermal_batch(jobs, settings, output_format=output_format, density=density)
+    batch_name = f"recus_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    if values.get('output') == 'zip':
+        # Fill the first window before the 200 goes out, so a saturated pool is a 503, not a cut archive
+        try:
+            first = next(rendered)
+        except RenderPoolError as e:
+            return render_busy_response(e)
+        entries = ((f"{receipt.get('receipt_number', receipt.get('id'))}.{ext}", data)
+                   for receipt, data in chain((first,), rendered))
+        return Response(
+            stream_with_context(stream_zip(entries)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{batch_name}.zip"'}
+        )
+
+    try:
+        documents = [data for _, data in rendered]
+    except RenderPoolError as e:
+        return render_busy_response(e)
+
+    if output_format == 'escpos':
+        # Each receipt stream already ends with its own cut command
+        roll = b''.join(documents)
+    else:
+        roll = compose_thermal_roll(documents)
+
+    return Response(
+        roll,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{batch_name}.{ext}"'}
+    )
+
+@receipts_bp.route('/export')
+def export_year():
+    """
+    Every receipt PDF of ?year=YYYY plus an index CSV, as a ZIP streamed while it is built.
+    ?from=MM&to=MM restricts the months, e.g. to resume an interrupted download.
+    """
+    user_id = session.get('user_id')
+    year = request.args.get('year', type=int) or datetime.now().year
+    first_month = parse_month(request.args.get('from'), 1)
+    last_month = parse_month(request.args.get('to'), 12)
+    if first_month > last_month or not 2000 <= year <= 2100:
+        return redirect(url_for('receipts.list_receipts'))
+
+    settings = Settings.get(user_id=user_id)
+    # Rendered on the job pool so a year of PDFs does not queue behind single downloads
+    archive = stream_year_archive(user_id, year, settings, get_locale(), first_month, last_month,
+                                  pool=get_job_runner().pool)
+    suffix = '' if (first_month, last_month) == (1, 12) else f"_{first_month:02d}-{last_month:02d}"
+    return Response(
+        stream_with_context(archive),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="recus_{year}{suffix}.zip"'}
+    )
+
+def parse_month(value, default):
+    try:
+        month = int(value)
+    except (TypeError, ValueError):
+        return default
+    return month if 1 <= month <= 12 else default
+
+def encode_cursor(cursor):
+    if not cursor:
+        return None
+    created_at, receipt_id = cursor
+    return f"{created_at.isoformat()}~{receipt_id}"
+
+def decode_cursor(value):
+    """(created_at, id) from an opaque page cursor; None (first page) when missing or malformed"""
+    try:
+        created_at, receipt_id = value.split('~', 1)
+        return datetime.fromisoformat(created_at), receipt_id
+    except (AttributeError, ValueError):
+        return None
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value.strip())
+    except (AttributeError, InvalidOperation):
+        return None
+    return amount if amount.is_finite() else None
+
+def render_busy_response(error):
+    """503 with Retry-After so print bridges and browsers back off instead of hammering the pool"""
+    return Response(
+        "Service d'impression occupe, veuillez reessayer dans quelques secondes.",
+        status=503,
+        headers={'Retry-After': str(error.retry_after)},
+        mimetype='text/plain'
     )
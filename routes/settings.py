@@ -3,6 +3,10 @@ import os
 
 from models import Settings, Company
 from utils.files import save_logo
+from services.escpos import clamp_density
+from services.pdf import PDF_RENDERERS
+from services.numbering import RESET_PERIODS
+from services.render_cache import get_render_cache
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
 
@@ -15,7 +19,12 @@ def settings_page():
     if request.method == 'POST':
         thermal_width = int(request.form.get('thermal_width', 58))
         settings['thermal_width'] = thermal_width if thermal_width in [48, 57, 58, 80] else 58
+        settings['thermal_density'] = clamp_density(request.form.get('thermal_density', 0))
+        pdf_renderer = request.form.get('pdf_renderer', 'canvas')
+        settings['pdf_renderer'] = pdf_renderer if pdf_renderer in PDF_RENDERERS else 'canvas'
         settings['receipt_number_format'] = request.form.get('receipt_number_format', 'REC-{YYYY}{MM}{DD}-{N}')
+        receipt_number_reset = request.form.get('receipt_number_reset', 'never')
+        settings['receipt_number_reset'] = receipt_number_reset if receipt_number_reset in RESET_PERIODS else 'never'
         settings['timezone'] = request.form.get('timezone', 'Africa/Casablanca')
 
 
@@ -71,6 +80,7 @@ def edit_company(company_id):
             phone=request.form.get('phone', ''),
             logo=logo_path
         )
+        get_render_cache().invalidate(company_id)
         return redirect(url_for('settings.settings_page'))
     
     return render_template('company_form.html', company=company)
@@ -79,4 +89,5 @@ def edit_company(company_id):
 def delete_company(company_id):
     user_id = session.get('user_id')
     Company.delete(company_id, user_id=user_id)
+    get_render_cache().invalidate(company_id)
     return redirect(url_for('settings.settings_page'))
@@ -0,0 +1,44 @@
+"""
+Compare the NumPy dithering stage with Pillow's built-in convert('1').
+
+Usage: python -m scripts.bench_dither [iterations]
+
+Sizes cover a thermal logo variant (80mm band) and a full 80mm receipt canvas.
+"""
+import sys
+import time
+
+from PIL import Image
+
+from services import dither
+
+SIZES = {
+    'logo 200x80': (200, 80),
+    'receipt 640x900': (640, 900),
+}
+
+def _sample(size):
+    # Radial gradient resized to the target: smooth tones are the hard case for dithering
+    return Image.radial_gradient('L').resize(size, Image.BILINEAR)
+
+def _bench(label, iterations, fn):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = (time.perf_counter() - start) / iterations * 1000
+    print(f"  {label:<22} {elapsed:8.2f} ms")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    if dither.np is None:
+        print("numpy is not installed: dither() falls back to Pillow")
+    for name, size in SIZES.items():
+        img = _sample(size)
+        print(f"{name} ({iterations} iterations)")
+        _bench("pillow convert('1')", iterations, lambda: img.convert('1'))
+        if dither.np is not None:
+            _bench("numpy floyd-steinberg", iterations, lambda: dither.dither(img, 'floyd-steinberg'))
+            _bench("numpy bayer 4x4", iterations, lambda: dither.dither(img, 'bayer'))
+
+if __name__ == '__main__':
+    main()
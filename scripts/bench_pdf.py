@@ -0,0 +1,64 @@
+"""
+Throughput benchmark for the A4 PDF renderer.
+
+Usage: python -m scripts.bench_pdf [iterations]
+
+"before" drops the per-process label/footer registries and the QR cache and
+rebuilds the sample stylesheet, paragraph styles and table style on every
+render, which is what each request paid before they were hoisted to module
+level; "after" reuses them like a long-lived worker does. Both use the platypus
+renderer; "canvas" is the direct-canvas fast path selected by the pdf_renderer
+setting.
+"""
+import sys
+import time
+
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from services import pdf, qr
+
+SAMPLE_RECEIPT = {
+    'receipt_number': 'REC-20260101-0001',
+    'created_at': '2026-01-01T10:30:00',
+    'description': 'Reparation et entretien complet du materiel informatique',
+    'amount': '1250.00',
+    'payment_method': 'cash'
+}
+SAMPLE_CLIENT = {'name': 'Client Exemple', 'email': 'client@example.com', 'whatsapp': '0600000000'}
+SAMPLE_COMPANY = {'name': 'Entreprise Exemple', 'address': '12 Rue Exemple\nCasablanca', 'phone': '0522000000', 'tax_id': '001234567000089'}
+SETTINGS = {'site_url': 'https://example.com', 'pdf_renderer': 'platypus'}
+CANVAS_SETTINGS = dict(SETTINGS, pdf_renderer='canvas')
+
+def _rebuild_per_request_state():
+    pdf._labels_cache.clear()
+    pdf._footer.cache_clear()
+    qr._cached.cache_clear()
+    styles = getSampleStyleSheet()
+    for name, parent in (('Title', 'Heading1'), ('Text', 'Normal'), ('TextLeft', 'Normal')):
+        ParagraphStyle(name, parent=styles[parent], fontSize=14)
+    for name in ('ReceiptTitle', 'TotalStyle', 'ThankYou', 'SiteUrl'):
+        ParagraphStyle(name, fontSize=14)
+    pdf.TableStyle(pdf.ITEMS_TABLE_STYLE.getCommands())
+
+def _bench(label, iterations, before, settings=SETTINGS):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if before:
+            _rebuild_per_request_state()
+        pdf.generate_receipt_pdf(SAMPLE_RECEIPT, SAMPLE_CLIENT, SAMPLE_COMPANY, settings, locale='fr')
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {elapsed / iterations * 1000:8.2f} ms/pdf  {iterations / elapsed:8.1f} pdf/s")
+    return elapsed
+
+def main(iterations=200):
+    # Warm imports and font metrics so neither side pays them
+    pdf.generate_receipt_pdf(SAMPLE_RECEIPT, SAMPLE_CLIENT, SAMPLE_COMPANY, SETTINGS, locale='fr')
+    pdf.generate_receipt_pdf(SAMPLE_RECEIPT, SAMPLE_CLIENT, SAMPLE_COMPANY, CANVAS_SETTINGS, locale='fr')
+    before = _bench('before', iterations, before=True)
+    after = _bench('after', iterations, before=False)
+    print(f"{'speedup':<8} {before / after:8.2f}x")
+    canvas = _bench('canvas', iterations, before=False, settings=CANVAS_SETTINGS)
+    print(f"{'speedup':<8} {before / canvas:8.2f}x (canvas vs before)")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for the thermal receipt renderer.
+
+Usage: python -m scripts.bench_thermal [iterations]
+
+"cold" clears the per-process font/layout registry before every render, which
+is what each request paid when fonts were loaded inside the task; "warm" reuses
+the registry like a long-lived render pool worker does.
+
+The canvas section compares the legacy canvas (RGB sized for 45 lines, PNG
+compress level 6) with the tight canvas in the configured PNG mode and level.
+"""
+import sys
+import time
+from io import BytesIO
+
+from services import thermal
+
+SAMPLE_RECEIPT = {
+    'receipt_number': 'REC-20260101-0001',
+    'created_at': '2026-01-01T10:30:00',
+    'description': 'Reparation et entretien complet du materiel informatique',
+    'amount': '1250.00',
+    'payment_method': 'cash'
+}
+SAMPLE_CLIENT = {'name': 'Client Exemple'}
+SAMPLE_COMPANY = {'name': 'Entreprise Exemple', 'address': '12 Rue Exemple\nCasablanca', 'phone': '0522000000', 'tax_id': '001234567000089'}
+
+def _bench(label, iterations, settings, cold):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            thermal._fonts_cache.clear()
+            thermal._resources_cache.clear()
+        thermal._generate_thermal_receipt_task(SAMPLE_RECEIPT, SAMPLE_CLIENT, SAMPLE_COMPANY, settings)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed / iterations * 1000:8.2f} ms/render")
+    return elapsed
+
+BANDS = {'1': 1 / 8, 'L': 1, 'RGB': 3}
+
+def _bench_canvas(iterations, settings):
+    res = thermal.get_thermal_resources(settings['thermal_width'])
+    layout, height = thermal._layout_thermal_receipt(SAMPLE_RECEIPT, SAMPLE_CLIENT, SAMPLE_COMPANY, settings)
+    legacy_height = 45 * res.line_height + 200 + res.qr_size + res.logo_height
+
+    variants = [
+        ('legacy', 'RGB', legacy_height, 6),
+        ('tight', thermal.PNG_MODE, height, thermal.PNG_COMPRESS_LEVEL),
+    ]
+    for label, mode, canvas_height, level in variants:
+        paint = encode = 0.0
+        size = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            img = layout.paint(mode, canvas_height)
+            if canvas_height != height:
+                img = img.crop((0, 0, res.width_px, height))
+            paint += time.perf_counter() - start
+
+            start = time.perf_counter()
+            buffer = BytesIO()
+            img.save(buffer, format='PNG', compress_level=level)
+            encode += time.perf_counter() - start
+            size = buffer.tell()
+        canvas_kb = res.width_px * canvas_height * BANDS[mode] / 1024
+        print(f"{label:<12} mode={mode:<3} canvas={canvas_kb:7.0f} KB  paint={paint / iterations * 1000:6.2f} ms"
+              f"  encode={encode / iterations * 1000:6.2f} ms  png={size / 1024:5.1f} KB")
+
+def main(iterations=200):
+    for width in thermal.SUPPORTED_WIDTHS:
+        settings = {'thermal_width': width, 'site_url': 'https://example.com'}
+        print(f"-- {width} mm")
+        cold = _bench('cold', iterations, settings, cold=True)
+        warm = _bench('warm', iterations, settings, cold=False)
+        print(f"{'speedup':<12} {cold / warm:8.2f}x")
+        _bench_canvas(iterations, settings)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,33 @@
+"""
+Backfill derived logo files for logos uploaded before variants existed.
+
+Usage: python -m scripts.build_logo_variants [--force]
+
+Renderers fall back to resizing the original logo until its variants exist, so
+this is optional; it only moves that work off the request path.
+"""
+import os
+import re
+import sys
+
+from utils.files import UPLOAD_DIR
+from services.logos import build_logo_variants
+
+# Originals only: variants carry a _<name> suffix after the id
+ORIGINAL_LOGO = re.compile(r'^logo_[0-9a-f]+\.png$')
+
+def main():
+    force = '--force' in sys.argv[1:]
+    built = 0
+    for name in sorted(os.listdir(UPLOAD_DIR)):
+        if not ORIGINAL_LOGO.match(name):
+            continue
+        try:
+            build_logo_variants(os.path.join(UPLOAD_DIR, name), force=force)
+            built += 1
+        except Exception as e:
+            print(f"{name}: {e}")
+    print(f"Variants ready for {built} logo(s)")
+
+if __name__ == '__main__':
+    main()
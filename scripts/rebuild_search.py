@@ -0,0 +1,23 @@
+"""
+Rebuild the receipt search index from the receipts, clients and companies tables.
+
+Usage: python -m scripts.rebuild_search
+
+Search documents are rewritten in the same transaction as every receipt, client
+and company write, so this is only needed after editing those tables by hand or
+restoring a backup.
+"""
+from sqlalchemy import text
+
+from app import app
+from init_db import db
+from services.search import rebuild_search_index
+
+def main():
+    with app.app_context():
+        rebuild_search_index()
+        count = db.session.execute(text("SELECT COUNT(*) FROM receipts")).scalar()
+    print(f"Search index rebuilt ({count} receipts)")
+
+if __name__ == '__main__':
+    main()
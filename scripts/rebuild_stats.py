@@ -0,0 +1,26 @@
+"""
+Recompute the per-user dashboard summaries (user_stats) from the receipts and
+clients tables.
+
+Usage: python -m scripts.rebuild_stats [user_id ...]
+
+Summaries are maintained in the same transaction as every receipt/client write,
+so this is only needed after editing those tables by hand or restoring a backup.
+Without arguments every user is rebuilt.
+"""
+import sys
+
+from app import app
+from models import UserStats
+
+def main(user_ids):
+    with app.app_context():
+        drifted = []
+        for user_id in user_ids or [None]:
+            drifted.extend(UserStats.rebuild(user_id))
+    for user_id in drifted:
+        print(f"Repaired summary of user {user_id}")
+    print(f"{len(drifted)} summaries repaired")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,19 @@
+"""
+Run the document job dispatcher in the foreground.
+
+Usage: python -m scripts.run_jobs
+
+Web workers only queue jobs (unless JOBS_ENABLED=1); this process runs them,
+keeping long exports entirely out of the request-serving processes. Several
+dispatchers can share the job table: claiming a job is an atomic conditional
+UPDATE.
+"""
+from app import app
+
+def main():
+    runner = app.extensions['job_runner']
+    print(f"Document job dispatcher {runner.worker_id} started, results in {runner.directory}")
+    runner.run_forever()
+
+if __name__ == '__main__':
+    main()
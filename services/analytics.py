@@ -0,0 +1,276 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import current_app
+from sqlalchemy import case, func, literal
+
+from utils.i18n import t
+
+PERIODS = ('day', 'week', 'month')
+DIMENSIONS = ('payment_method', 'company', 'client')
+# Buckets shown when no range is given
+DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}
+MAX_RANGE_DAYS = 3 * 366
+DEFAULT_TIMEZONE = 'Africa/Casablanca'
+
+
+class AnalyticsError(Exception):
+    """An analytics request cannot be served; the message is shown to the user."""
+
+
+def get_zone(name):
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise AnalyticsError(f"Invalid date: {value}")
+
+
+def bucket_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(period, day):
+    if period == 'week':
+        return day + timedelta(days=7)
+    if period == 'month':
+        return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+    return day + timedelta(days=1)
+
+
+def report_range(period, start=None, end=None, today=None):
+    """
+    [start, end) local dates of a report, aligned on bucket boundaries.
+    `start` / `end` are inclusive 'YYYY-MM-DD' strings; the default covers the
+    last DEFAULT_BUCKETS[period] buckets up to today.
+    """
+    if period not in PERIODS:
+        raise AnalyticsError(f"Unknown period: {period}")
+    end_day = _parse_day(end) or today or date.today()
+    end_day = next_bucket(period, bucket_start(period, end_day))
+    start_day = _parse_day(start)
+    if start_day is None:
+        start_day = end_day
+        for _ in range(DEFAULT_BUCKETS[period]):
+            start_day = bucket_start(period, start_day - timedelta(days=1))
+    start_day = bucket_start(period, start_day)
+    if start_day >= end_day:
+        raise AnalyticsError("The start date must be before the end date")
+    if (end_day - start_day).days > MAX_RANGE_DAYS:
+        raise AnalyticsError(f"The range cannot exceed {MAX_RANGE_DAYS} days")
+    return start_day, end_day
+
+
+def utc_bounds(start_day, end_day, zone):
+    """Naive UTC datetimes (the storage format of created_at) of two local midnights"""
+    def to_utc(day):
+        local = datetime(day.year, day.month, day.day, tzinfo=zone)
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+    return to_utc(start_day), to_utc(end_day)
+
+
+def utc_offsets(zone, start_utc, end_utc):
+    """
+    [(from_utc, offset_minutes), ...] covering [start_utc, end_utc): the zone's
+    UTC offset and the instants it changes (DST), found day by day then to the
+    quarter hour.
+    """
+    def offset(moment):
+        return int(moment.replace(tzinfo=timezone.utc).astimezone(zone).utcoffset().total_seconds() // 60)
+
+    segments = [(start_utc, offset(start_utc))]
+    day = start_utc
+    while day < end_utc:
+        following = min(day + timedelta(days=1), end_utc)
+        if offset(following) != segments[-1][1]:
+            moment = day
+            while offset(moment) == segments[-1][1]:
+                moment += timedelta(minutes=15)
+            segments.append((moment, offset(moment)))
+        day = following
+    return segments
+
+
+def bucket_expression(dialect, period, column, zone, start_utc, end_utc):
+    """
+    SQL expression of the local bucket start of a naive-UTC timestamp column.
+    PostgreSQL converts with the tz database itself; SQLite has none, so the
+    offsets of the range (DST changes included) are inlined as a CASE.
+    """
+    if dialect == 'postgresql':
+        return func.date_trunc(period, func.timezone(zone.key, func.timezone('UTC', column)))
+
+    segments = utc_offsets(zone, start_utc, end_utc)
+    if len(segments) == 1:
+        minutes = literal(segments[0][1])
+    else:
+        minutes = case(
+            *[(column < segments[i + 1][0], segments[i][1]) for i in range(len(segments) - 1)],
+            else_=segments[-1][1]
+        )
+    modifier = func.printf('%d minutes', minutes)
+    if period == 'week':
+        # 'weekday 0' moves to the next Sunday (or stays), -6 days is that week's Monday
+        return func.date(column, modifier, 'weekday 0', '-6 days')
+    if period == 'month':
+        return func.strftime('%Y-%m-01', column, modifier)
+    return func.date(column, modifier)
+
+
+def _bucket_key(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def revenue_series(user_id, period, start_day, end_day, zone):
+    """Receipt count and revenue per local day/week/month bucket, empty buckets included"""
+    from init_db import db, Receipt as ReceiptModel
+
+    start_utc, end_utc = utc_bounds(start_day, end_day, zone)
+    bucket = bucket_expression(db.engine.dialect.name, period, ReceiptModel.created_at, zone, start_utc, end_utc)
+    rows = db.session.query(
+        bucket.label('bucket'), func.count(ReceiptModel.id), func.sum(ReceiptModel.amount)
+    ).filter(
+        ReceiptModel.user_id == user_id,
+        ReceiptModel.created_at >= start_utc,
+        ReceiptModel.created_at < end_utc
+    ).group_by(bucket).all()
+    totals = {_bucket_key(key): (count, total) for key, count, total in rows}
+
+    series = []
+    day = start_day
+    while day < end_day:
+        count, total = totals.get(day.isoformat(), (0, 0))
+        series.append({'bucket': day.isoformat(), 'count': count, 'total': round(float(total or 0), 2)})
+        day = next_bucket(period, day)
+    return series
+
+
+def breakdown(user_id, dimension, start_day, end_day, zone, limit=10):
+    """Receipt count and revenue per payment method / company / client, largest first"""
+    from init_db import db, Receipt as ReceiptModel
+
+    column = getattr(ReceiptModel, 'payment_method' if dimension == 'payment_method' else f'{dimension}_id')
+    start_utc, end_utc = utc_bounds(start_day, end_day, zone)
+    revenue = func.sum(ReceiptModel.amount)
+    rows = db.session.query(column, func.count(ReceiptModel.id), revenue).filter(
+        ReceiptModel.user_id == user_id,
+        ReceiptModel.created_at >= start_utc,
+        ReceiptModel.created_at < end_utc
+    ).group_by(column).order_by(revenue.desc()).limit(limit).all()
+    return [{'key': key or '', 'count': count, 'total': round(float(total or 0), 2)} for key, count, total in rows]
+
+
+class AnalyticsCache:
+    """
+    Process-wide LRU of computed reports. Keys carry the user's user_stats
+    version, which every receipt/client write bumps, so a write in any process
+    makes that user's cached reports unreachable; they then age out.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+def init_analytics_cache(app):
+    cache = AnalyticsCache(max_entries=int(os.environ.get('ANALYTICS_CACHE_SIZE', 512)))
+    app.extensions['analytics_cache'] = cache
+    return cache
+
+
+def get_analytics_cache():
+    return current_app.extensions['analytics_cache']
+
+
+def _cached(user_id, zone, key, compute):
+    from models import UserStats
+
+    version = UserStats.get(user_id)['version']
+    return get_analytics_cache().get_or_compute((user_id, version, zone.key) + key, compute)
+
+
+def revenue_report(user_id, settings, period='day', start=None, end=None):
+    zone = get_zone(settings.get('timezone'))
+    start_day, end_day = report_range(period, start, end, today=datetime.now(zone).date())
+    series = _cached(user_id, zone, ('revenue', period, start_day, end_day),
+                     lambda: revenue_series(user_id, period, start_day, end_day, zone))
+    return {
+        'period': period,
+        'timezone': zone.key,
+        'start': start_day.isoformat(),
+        'end': (end_day - timedelta(days=1)).isoformat(),
+        'count': sum(row['count'] for row in series),
+        'total': round(sum(row['total'] for row in series), 2),
+        'buckets': series,
+    }
+
+
+def breakdown_report(user_id, settings, dimension, start=None, end=None, locale=None, limit=10):
+    """Breakdown over [start, end] (default: the last 12 months) with display labels"""
+    from models import Client, Company
+
+    if dimension not in DIMENSIONS:
+        raise AnalyticsError(f"Unknown dimension: {dimension}")
+    zone = get_zone(settings.get('timezone'))
+    today = datetime.now(zone).date()
+    if not start:
+        start = report_range('month', None, end, today=today)[0].isoformat()
+    start_day, end_day = report_range('day', start, end, today=today)
+    rows = _cached(user_id, zone, ('breakdown', dimension, start_day, end_day, limit),
+                   lambda: breakdown(user_id, dimension, start_day, end_day, zone, limit=limit))
+
+    # Labels are looked up per request so renaming a client or company shows at once
+    if dimension == 'payment_method':
+        labels = {}
+        for row in rows:
+            key = f"receipts.payment_methods.{row['key']}"
+            label = t(key, locale)
+            labels[row['key']] = label if label != key else row['key']
+    else:
+        model = Client if dimension == 'client' else Company
+        labels = {key: record['name'] for key, record in
+                  model.get_map_by_ids([row['key'] for row in rows], user_id=user_id).items()}
+    return {
+        'dimension': dimension,
+        'timezone': zone.key,
+        'start': start_day.isoformat(),
+        'end': (end_day - timedelta(days=1)).isoformat(),
+        'rows': [dict(row, label=labels.get(row['key']) or row['key'] or '-') for row in rows],
+    }
@@ -0,0 +1,92 @@
+import os
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # Optional extra: without it every method but 'threshold' uses Pillow
+    np = None
+
+# 'pillow' is Pillow's Floyd-Steinberg in C (fastest); 'floyd-steinberg' (exact float
+# error diffusion) and 'bayer' are NumPy implementations, opt-in and several times slower
+DITHER_METHODS = ('pillow', 'floyd-steinberg', 'bayer', 'threshold')
+
+# Method used for thermal logo variants and ESC/POS output
+DITHER_METHOD = os.environ.get('THERMAL_DITHER', 'pillow')
+if DITHER_METHOD not in DITHER_METHODS:
+    DITHER_METHOD = 'pillow'
+
+_bayer_cache = {}
+
+def bayer_thresholds(size=4):
+    """Normalized Bayer matrix (0..255 thresholds) of a power-of-two size."""
+    thresholds = _bayer_cache.get(size)
+    if thresholds is None:
+        matrix = np.zeros((1, 1), dtype=np.int32)
+        while matrix.shape[0] < size:
+            matrix = np.block([
+                [4 * matrix, 4 * matrix + 2],
+                [4 * matrix + 3, 4 * matrix + 1],
+            ])
+        thresholds = (matrix + 0.5) * (255.0 / matrix.size)
+        _bayer_cache[size] = thresholds
+    return thresholds
+
+def ordered_dither(grey, size=4):
+    """Bayer dithering of a 2D greyscale array; returns True where the pixel stays white."""
+    thresholds = bayer_thresholds(size)
+    height, width = grey.shape
+    reps = (-(-height // size), -(-width // size))
+    return grey > np.tile(thresholds, reps)[:height, :width]
+
+def floyd_steinberg(grey):
+    """
+    Floyd-Steinberg error diffusion of a 2D greyscale array, True = white.
+
+    A pixel depends on its left neighbour and the three pixels above it, so all
+    pixels on the anti-diagonal t = 2y + x are independent and are processed as
+    one vectorized step (width + 2 * height steps instead of width * height).
+    """
+    height, width = grey.shape
+    # One spare row below and one spare column on each side swallow edge spill
+    buf = np.zeros((height + 1, width + 2), dtype=np.float32)
+    buf[:height, 1:width + 1] = grey
+    out = np.zeros((height, width), dtype=bool)
+
+    for t in range(width + 2 * (height - 1)):
+        y_min = max(0, (t - width + 2) // 2)
+        y_max = min(height - 1, t // 2)
+        if y_min > y_max:
+            continue
+        ys = np.arange(y_min, y_max + 1)
+        xs = t - 2 * ys + 1
+
+        old = buf[ys, xs]
+        white = old >= 128
+        err = old - white * 255.0
+        out[ys, xs - 1] = white
+
+        # Separate statements: neighbouring pixels of one diagonal share targets
+        buf[ys, xs + 1] += err * (7 / 16)
+        buf[ys + 1, xs - 1] += err * (3 / 16)
+        buf[ys + 1, xs] += err * (5 / 16)
+        buf[ys + 1, xs + 1] += err * (1 / 16)
+    return out
+
+def dither(img, method=None):
+    """Convert a PIL image to mode '1' for the thermal head."""
+    method = method or DITHER_METHOD
+    if img.mode == '1':
+        return img
+    grey = img.convert('L')
+
+    if method == 'threshold':
+        return grey.convert('1', dither=Image.Dither.NONE)
+    if method == 'pillow' or np is None:
+        return grey.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+
+    pixels = np.asarray(grey, dtype=np.float32)
+    if method == 'bayer':
+        white = ordered_dither(pixels)
+    else:
+        white = floyd_steinberg(pixels)
+    return Image.fromarray(white)
@@ -0,0 +1,107 @@
+from collections import deque
+
+from services.pdf import generate_receipt_pdf, _generate_receipt_pdf_task
+from services.thermal import generate_thermal_receipt, _generate_thermal_receipt_task, FORMAT_EXTENSIONS
+from services.render_cache import get_render_cache, render_key
+from services.render_pool import get_render_pool, RenderPoolBusy
+from services.escpos import clamp_density
+
+# Single place where cache keys are derived, so downloads hit what pre-rendering stored
+
+def cached_receipt_pdf(receipt, client, company, settings, locale):
+    """Path of the receipt PDF in the render cache, rendering it on a miss."""
+    key = render_key('pdf', receipt, client, company, settings, locale=locale)
+    return get_render_cache().get_or_render(
+        key, 'pdf',
+        lambda: generate_receipt_pdf(receipt, client, company, settings, locale=locale).getvalue(),
+        namespace=receipt.get('company_id')
+    )
+
+def cached_thermal_receipt(receipt, client, company, settings, output_format='png', density=None):
+    """
+    Path of the thermal ticket in the render cache, rendering it in the render
+    pool on a miss (may raise RenderPoolError).
+    """
+    if density is None:
+        density = settings.get('thermal_density', 0)
+    density = clamp_density(density)
+    key = render_key('thermal', receipt, client, company, settings, format=output_format, density=density)
+    return get_render_cache().get_or_render(
+        key, FORMAT_EXTENSIONS[output_format],
+        lambda: generate_thermal_receipt(receipt, client, company, settings,
+                                         output_format=output_format, density=density).getvalue(),
+        namespace=receipt.get('company_id')
+    )
+
+def render_batch(jobs, settings, kind, ext, task, task_kwargs, locale='', key_options=None, pool=None,
+                 cache_results=True):
+    """
+    Yield (receipt, data) for every (receipt, client, company) job, in order.
+
+    Cached artifacts are read from the render cache; misses are rendered in
+    parallel by `task(receipt, client, company, settings, **task_kwargs)` across
+    `pool` (the interactive render pool by default), keeping a bounded window of
+    jobs in flight so a large batch cannot monopolise the queue.
+
+    With cache_results=False (bulk exports) hits keep their recency and misses
+    are not stored, so one large batch does not evict the interactive working set.
+    """
+    pool = pool or get_render_pool()
+    cache = get_render_cache()
+    key_options = key_options or {}
+    window = pool.max_workers + 1
+    pending = deque()
+
+    def finish(entry):
+        receipt, key, namespace, data, future = entry
+        if future is not None:
+            data = pool.result(future)
+            if cache_results:
+                cache.put(key, ext, data, namespace)
+        return receipt, data
+
+    def read_cached(key, namespace):
+        path = cache.get(key, ext, namespace, touch=cache_results)
+        if path is None:
+            return None
+        # Read now: another process may evict the file before this entry is yielded
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    for receipt, client, company in jobs:
+        key = render_key(kind, receipt, client, company, settings, locale=locale, **key_options)
+        namespace = receipt.get('company_id')
+        data = read_cached(key, namespace)
+        future = None
+        while data is None and future is None:
+            try:
+                future = pool.submit(task, receipt, client, company, settings, **task_kwargs)
+            except RenderPoolBusy:
+                # Drain our own work first; only give up if nothing of ours is queued
+                if not pending:
+                    raise
+                yield finish(pending.popleft())
+        pending.append((receipt, key, namespace, data, future))
+        if len(pending) >= window:
+            yield finish(pending.popleft())
+
+    while pending:
+        yield finish(pending.popleft())
+
+def render_thermal_batch(jobs, settings, output_format='png', density=None, pool=None):
+    """Thermal tickets of many receipts, see render_batch."""
+    options = {'format': output_format, 'density': density}
+    return render_batch(
+        jobs, settings, 'thermal', FORMAT_EXTENSIONS[output_format], _generate_thermal_receipt_task,
+        {'output_format': output_format, 'density': density}, key_options=options, pool=pool
+    )
+
+def render_pdf_batch(jobs, settings, locale, pool=None, cache_results=True):
+    """Receipt PDFs of many receipts, see render_batch."""
+    return render_batch(
+        jobs, settings, 'pdf', 'pdf', _generate_receipt_pdf_task,
+        {'locale': locale}, locale=locale, pool=pool, cache_results=cache_results
+    )
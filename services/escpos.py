@@ -0,0 +1,64 @@
+from PIL import Image
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+# Raster bands are kept small enough for printers with limited line buffers
+RASTER_BAND_HEIGHT = 256
+MIN_DENSITY = -6
+MAX_DENSITY = 8
+
+# PIL packs mode '1' pixels with 1 = white; ESC/POS expects 1 = dot printed
+_INVERT_TABLE = bytes(255 - i for i in range(256))
+
+def clamp_density(density):
+    try:
+        density = int(density)
+    except (TypeError, ValueError):
+        return 0
+    return max(MIN_DENSITY, min(MAX_DENSITY, density))
+
+def density_command(density):
+    """GS ( K fn=49: select print density (-6..8, 0 = printer default)."""
+    density = clamp_density(density)
+    if density == 0:
+        return b''
+    return GS + b'(K' + bytes([2, 0, 49, density & 0xFF])
+
+def raster_commands(img):
+    """Encode a mode '1' image as a sequence of GS v 0 raster bit image commands."""
+    if img.mode != '1':
+        img = img.convert('1')
+
+    width, height = img.size
+    width_bytes = (width + 7) // 8
+    if width % 8:
+        # Pad to a whole number of bytes with white so padding bits do not print
+        padded = Image.new('1', (width_bytes * 8, height), 1)
+        padded.paste(img, (0, 0))
+        img = padded
+
+    data = img.tobytes().translate(_INVERT_TABLE)
+    commands = []
+    for band_top in range(0, height, RASTER_BAND_HEIGHT):
+        band_height = min(RASTER_BAND_HEIGHT, height - band_top)
+        header = GS + b'v0' + bytes([
+            0,
+            width_bytes & 0xFF, (width_bytes >> 8) & 0xFF,
+            band_height & 0xFF, (band_height >> 8) & 0xFF,
+        ])
+        start = band_top * width_bytes
+        commands.append(header + data[start:start + band_height * width_bytes])
+    return b''.join(commands)
+
+def cut_command(feed_dots=96, partial=False):
+    """GS V function B: feed paper by `feed_dots` then cut."""
+    return GS + b'V' + bytes([66 if partial else 65, max(0, min(255, feed_dots))])
+
+def encode_receipt(img, density=0, cut=True):
+    """Full printer byte stream for one receipt image."""
+    stream = INIT + density_command(density) + raster_commands(img)
+    if cut:
+        stream += cut_command()
+    return stream
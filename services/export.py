@@ -0,0 +1,113 @@
+import io
+import csv
+import re
+import tempfile
+from datetime import datetime
+
+from services.documents import render_pdf_batch
+from utils.i18n import t
+from utils.zipstream import stream_zip
+
+CSV_COLUMNS = (
+    ('receipt_number', 'receipts.receipt_number'),
+    ('date', 'receipts.date'),
+    ('client', 'clients.client'),
+    ('company', 'users.company'),
+    ('description', 'receipts.description'),
+    ('payment_method', 'receipts.payment_method'),
+    ('amount', 'receipts.amount'),
+)
+PAYMENT_METHODS = ('cash', 'card', 'transfer', 'check')
+
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def with_related(user_id, receipts):
+    """(receipt, client, company) triples, fetching clients and companies in two bulk queries."""
+    from models import Client, Company
+
+    client_map = Client.get_map_by_ids([r.get('client_id') for r in receipts], user_id=user_id)
+    company_map = Company.get_map_by_ids([r.get('company_id') for r in receipts], user_id=user_id)
+    return [(r, client_map.get(r.get('client_id')), company_map.get(r.get('company_id'))) for r in receipts]
+
+
+class ReceiptCsv:
+    """CSV rows of receipts with translated headers and payment methods."""
+
+    def __init__(self, output, locale, extra_columns=()):
+        self.writer = csv.writer(output)
+        self.payment_methods = {method: t(f'receipts.payment_methods.{method}', locale) for method in PAYMENT_METHODS}
+        self.writer.writerow([t(label, locale) for _, label in CSV_COLUMNS] + list(extra_columns))
+
+    def write(self, receipt, client, company, *extra):
+        self.writer.writerow([
+            receipt.get('receipt_number', ''),
+            receipt.get('created_at', '')[:19].replace('T', ' '),
+            (client or {}).get('name', ''),
+            (company or {}).get('name', ''),
+            receipt.get('description', ''),
+            self.payment_methods.get(receipt.get('payment_method'), receipt.get('payment_method', '')),
+            receipt.get('amount', '0'),
+        ] + list(extra))
+
+
+def month_range(year, month):
+    """[start, end) datetimes of one calendar month."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def archive_entry_name(year, month, receipt, taken=None):
+    """
+    ZIP path of a receipt PDF inside its month folder. Sanitising can map two
+    receipt numbers to one name, so names already in `taken` get the receipt
+    id (then a counter) appended; the chosen name is added to `taken`.
+    """
+    base = f"{year}-{month:02d}/{_UNSAFE_NAME.sub('_', receipt.get('receipt_number') or receipt.get('id'))}"
+    name = f"{base}.pdf"
+    if taken is not None:
+        suffix, counter = _UNSAFE_NAME.sub('_', str(receipt.get('id'))), 1
+        while name in taken:
+            name = f"{base}_{suffix}.pdf" if counter == 1 else f"{base}_{suffix}_{counter}.pdf"
+            counter += 1
+        taken.add(name)
+    return name
+
+
+def stream_year_archive(user_id, year, settings, locale, first_month=1, last_month=12, pool=None):
+    """
+    Yield a ZIP of every receipt PDF of `year` (months first_month..last_month)
+    followed by an index CSV.
+
+    Receipts are loaded one month at a time, with their clients and companies
+    in bulk, and rendered in parallel across `pool`; each PDF is written to the
+    archive as soon as it is ready and the index is spooled to a temporary
+    file, so memory stays bounded by one month of rows plus the render window.
+    Export renders are not stored in the render cache. A broken download can
+    be resumed from the month it stopped in.
+    """
+    from models import Receipt
+
+    def entries():
+        with tempfile.TemporaryFile() as spool:
+            # utf-8-sig so spreadsheet software detects the encoding
+            index = io.TextIOWrapper(spool, encoding='utf-8-sig', newline='')
+            rows = ReceiptCsv(index, locale, extra_columns=(t('receipts.export_file', locale),))
+            for month in range(first_month, last_month + 1):
+                start, end = month_range(year, month)
+                receipts = Receipt.get_many(user_id, start=start, end=end)
+                if not receipts:
+                    continue
+                jobs = with_related(user_id, receipts)
+                rendered = render_pdf_batch(jobs, settings, locale, pool=pool, cache_results=False)
+                taken = set()
+                for (receipt, client, company), (_, data) in zip(jobs, rendered):
+                    name = archive_entry_name(year, month, receipt, taken)
+                    rows.write(receipt, client, company, name)
+                    yield name, data
+            index.flush()
+            spool.seek(0)
+            yield f"index_{year}.csv", spool
+
+    return stream_zip(entries())
@@ -0,0 +1,377 @@
+import os
+import time
+import atexit
+import socket
+import logging
+import threading
+from io import TextIOWrapper
+from datetime import datetime, timedelta
+from flask import current_app
+
+from services.render_pool import RenderPool, RenderPoolError
+from services.thermal import compose_thermal_roll, warm_thermal_worker, FORMAT_EXTENSIONS, OUTPUT_FORMATS
+from services.documents import render_pdf_batch, render_thermal_batch
+from services.statement import render_client_statement, statement_period, statement_filename
+from services.escpos import clamp_density
+from services.export import ReceiptCsv, with_related
+from utils.zipstream import stream_zip
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('pdf', 'thermal_batch', 'statement', 'export')
+MAX_JOB_RECEIPTS = 5000
+# A PNG roll is composed in memory: keep it to the size of an interactive batch
+MAX_ROLL_RECEIPTS = 200
+THERMAL_MIMETYPES = {'png': 'image/png', 'escpos': 'application/octet-stream'}
+# Progress rows are written at most this often (seconds); they double as the heartbeat
+PROGRESS_INTERVAL = 1.0
+MAINTENANCE_INTERVAL = 60
+
+
+class JobError(Exception):
+    """A job request or its parameters cannot be served; the message is shown to the user."""
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise JobError(f"Invalid date: {value}")
+
+
+def _receipt_ids(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(rid).strip() for rid in value or () if str(rid).strip()]
+
+
+def prepare_job_params(kind, data, settings, locale):
+    """
+    Validate a job request and freeze everything request-dependent (settings,
+    locale, statement period) into JSON-serialisable params.
+    """
+    if kind not in JOB_KINDS:
+        raise JobError(f"Unknown job kind: {kind}")
+
+    start = _parse_day(data.get('start'))
+    end = _parse_day(data.get('end'))
+    params = {
+        'settings': settings,
+        'locale': locale,
+        'start': start.strftime('%Y-%m-%d') if start else None,
+        'end': end.strftime('%Y-%m-%d') if end else None,
+    }
+
+    if kind == 'statement':
+        if not data.get('client_id'):
+            raise JobError("client_id is required")
+        params['client_id'] = data['client_id']
+        params['period'] = statement_period(start, end, locale)
+        return params
+
+    params['ids'] = _receipt_ids(data.get('ids'))
+    if kind in ('pdf', 'thermal_batch') and not params['ids'] and not start and not end:
+        raise JobError("ids or a start/end date is required")
+
+    if kind == 'thermal_batch':
+        output_format = data.get('format', 'png')
+        params['format'] = output_format if output_format in OUTPUT_FORMATS else 'png'
+        params['output'] = 'roll' if data.get('output') == 'roll' else 'zip'
+        params['density'] = clamp_density(data.get('density', settings.get('thermal_density', 0)))
+    return params
+
+
+def _criteria(params):
+    """Receipt.get_many arguments of a job: ids and/or a day range (end day included)."""
+    end = _parse_day(params.get('end'))
+    return {
+        'receipt_ids': params.get('ids') or None,
+        'start': _parse_day(params.get('start')),
+        'end': end + timedelta(days=1) if end else None,
+    }
+
+
+def _select_receipts(job, params, limit=MAX_JOB_RECEIPTS):
+    """(receipt, client, company) triples for the job, in three queries."""
+    from models import Receipt
+
+    user_id = job['user_id']
+    receipts = Receipt.get_many(user_id, limit=limit + 1 if limit else None, **_criteria(params))
+    if limit and len(receipts) > limit:
+        raise JobError(f"Too many receipts (more than {limit}), narrow the date range")
+    if not receipts:
+        raise JobError("No receipts match")
+
+    return with_related(user_id, receipts)
+
+
+def _counted(items, total, progress):
+    # Also the heartbeat: written before the first render and after each one
+    progress(0, total)
+    for done, item in enumerate(items, 1):
+        yield item
+        progress(done, total)
+
+
+def _write_zip(output, entries):
+    for chunk in stream_zip(entries):
+        output.write(chunk)
+
+
+def _batch_name():
+    return f"recus_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def _entry_name(receipt, ext):
+    return f"{receipt.get('receipt_number', receipt.get('id'))}.{ext}"
+
+
+def _run_pdf_job(job, params, output, progress, pool):
+    jobs = _select_receipts(job, params)
+    rendered = _counted(render_pdf_batch(jobs, params['settings'], params['locale'], pool=pool), len(jobs), progress)
+    if len(jobs) == 1:
+        receipt, data = next(rendered)
+        output.write(data)
+        progress(1, 1)
+        return _entry_name(receipt, 'pdf'), 'application/pdf'
+
+    _write_zip(output, ((_entry_name(receipt, 'pdf'), data) for receipt, data in rendered))
+    return f"{_batch_name()}.zip", 'application/zip'
+
+
+def _run_thermal_batch_job(job, params, output, progress, pool):
+    jobs = _select_receipts(job, params)
+    output_format = params['format']
+    ext = FORMAT_EXTENSIONS[output_format]
+    if params['output'] == 'roll' and output_format == 'png' and len(jobs) > MAX_ROLL_RECEIPTS:
+        raise JobError(f"A PNG roll is limited to {MAX_ROLL_RECEIPTS} receipts, use a ZIP archive")
+
+    rendered = _counted(
+        render_thermal_batch(jobs, params['settings'], output_format=output_format, density=params['density'], pool=pool),
+        len(jobs), progress
+    )
+    if params['output'] == 'zip':
+        _write_zip(output, ((_entry_name(receipt, ext), data) for receipt, data in rendered))
+        return f"{_batch_name()}.zip", 'application/zip'
+
+    if output_format == 'escpos':
+        # Each receipt stream already ends with its own cut command
+        for _, data in rendered:
+            output.write(data)
+    else:
+        output.write(compose_thermal_roll([data for _, data in rendered]))
+    return f"{_batch_name()}.{ext}", THERMAL_MIMETYPES[output_format]
+
+
+def _run_statement_job(job, params, output, progress, pool):
+    from models import Client, Receipt
+
+    client = Client.get_by_id(params['client_id'], user_id=job['user_id'])
+    if not client:
+        raise JobError("Client not found")
+    start = _parse_day(params.get('start'))
+    end = _parse_day(params.get('end'))
+    end = end + timedelta(days=1) if end else None
+    total = Receipt.get_totals(job['user_id'], {'client_id': client['id'], 'start': start, 'end': end})['count']
+    # Drawn here rather than in the pool: the canvas takes the rows as the query streams
+    # them, so memory stays constant however long the statement is, whereas a worker
+    # process would need the whole list pickled to it
+    receipts = Receipt.iter_for_client(job['user_id'], client['id'], start=start, end=end)
+    render_client_statement(_counted(receipts, total, progress), client, output,
+                            period=params['period'], locale=params['locale'])
+    return statement_filename(client), 'application/pdf'
+
+
+def _run_export_job(job, params, output, progress, pool):
+    from models import Receipt
+
+    user_id = job['user_id']
+    criteria = _criteria(params)
+    total = Receipt.count_many(user_id, **criteria)
+    if not total:
+        raise JobError("No receipts match")
+
+    # Chunk by chunk with their clients and companies: memory does not grow with the range
+    rows_in_chunks = (row for chunk in Receipt.iter_many(user_id, **criteria) for row in with_related(user_id, chunk))
+    # utf-8-sig so spreadsheet software detects the encoding
+    text = TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    rows = ReceiptCsv(text, params['locale'])
+    for receipt, client, company in _counted(rows_in_chunks, total, progress):
+        rows.write(receipt, client, company)
+    text.flush()
+    text.detach()
+    return f"{_batch_name()}.csv", 'text/csv'
+
+
+JOB_HANDLERS = {
+    'pdf': _run_pdf_job,
+    'thermal_batch': _run_thermal_batch_job,
+    'statement': _run_statement_job,
+    'export': _run_export_job,
+}
+
+
+class JobRunner:
+    """
+    Dispatcher for long document jobs persisted in the `document_jobs` table.
+
+    A daemon thread claims queued jobs one at a time and runs their handler; the
+    CPU-bound rendering happens in a dedicated process pool, separate from the
+    interactive render pool, so exports never delay a single download. Because
+    the queue lives in the database, jobs survive a web-worker restart: queued
+    jobs are picked up by any dispatcher, and running jobs whose heartbeat
+    stopped are requeued (up to `max_attempts`). Finished results are kept on
+    disk for `ttl`, then removed along with their row.
+    """
+
+    def __init__(self, app, directory, pool, ttl=timedelta(hours=24), stale_after=600,
+                 poll_interval=2.0, max_attempts=3, enabled=True):
+        self.app = app
+        self.directory = os.path.abspath(directory)
+        self.pool = pool
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.enabled = enabled
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_maintenance = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_started(self):
+        """Start the dispatcher thread in this process (cheap when already running)."""
+        if not self.enabled:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self.run_forever, name='document-jobs', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, user_id, kind, params):
+        from models import DocumentJob
+
+        job = DocumentJob.create(user_id, kind, params)
+        self.ensure_started()
+        self._wakeup.set()
+        return job
+
+    def run_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    ran = self.run_once()
+            except Exception:
+                logger.exception("Document job dispatcher error")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self):
+        """Housekeeping when due, then at most one job; returns True when a job ran."""
+        from models import DocumentJob
+
+        if time.monotonic() - self._last_maintenance > MAINTENANCE_INTERVAL:
+            self.maintenance()
+        job = DocumentJob.claim_next(self.worker_id)
+        if job is None:
+            return False
+        self.execute(job)
+        return True
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.out")
+
+    def execute(self, job):
+        path = self.result_path(job['id'])
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as output:
+                name, mimetype = JOB_HANDLERS[job['kind']](job, job['params'], output, self._progress(job['id']), self.pool)
+            os.replace(tmp_path, path)
+        except (JobError, RenderPoolError) as e:
+            self._finish(job, status='failed', error=str(e))
+        except Exception:
+            logger.exception("Document job %s (%s) failed", job['id'], job['kind'])
+            self._finish(job, status='failed', error="Internal error while building the document")
+        else:
+            self._finish(job, status='done', result_path=path, result_name=name, mimetype=mimetype)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _finish(self, job, **fields):
+        from models import DocumentJob
+
+        now = datetime.utcnow()
+        DocumentJob.update(job['id'], finished_at=now, expires_at=now + self.ttl, **fields)
+
+    def _progress(self, job_id):
+        from models import DocumentJob
+
+        last_write = [0.0]
+
+        def progress(done, total):
+            now = time.monotonic()
+            if done < total and now - last_write[0] < PROGRESS_INTERVAL:
+                return
+            last_write[0] = now
+            DocumentJob.update(job_id, progress=done, total=total)
+        return progress
+
+    def maintenance(self):
+        """Requeue jobs of dead workers and delete expired jobs with their results."""
+        from models import DocumentJob
+
+        self._last_maintenance = time.monotonic()
+        now = datetime.utcnow()
+        DocumentJob.requeue_stale(now - timedelta(seconds=self.stale_after), self.max_attempts)
+        for job in DocumentJob.pop_expired(now):
+            if job['result_path']:
+                try:
+                    os.remove(job['result_path'])
+                except OSError:
+                    pass
+
+
+def init_job_runner(app):
+    """
+    Attach the app-scoped JobRunner. Web workers only accept jobs by default;
+    scripts/run_jobs.py runs them, so N pre-fork workers do not each start a
+    dispatcher and a job pool next to the render pool. JOBS_ENABLED=1 runs a
+    dispatcher thread in the web process (single-process deployments).
+    """
+    pool = RenderPool(
+        max_workers=int(os.environ.get('JOB_POOL_WORKERS', 0)) or max(1, (os.cpu_count() or 2) // 2),
+        timeout=float(os.environ.get('JOB_TASK_TIMEOUT', 300)),
+        initializer=warm_thermal_worker
+    )
+    runner = JobRunner(
+        app,
+        directory=os.environ.get('JOB_RESULTS_DIR', os.path.join(app.instance_path, 'jobs')),
+        pool=pool,
+        ttl=timedelta(hours=float(os.environ.get('JOB_RESULT_TTL_HOURS', 24))),
+        stale_after=int(os.environ.get('JOB_STALE_SECONDS', 600)),
+        enabled=app.config.get('JOBS_ENABLED', os.environ.get('JOBS_ENABLED', '0') == '1')
+    )
+    app.extensions['job_runner'] = runner
+    # With JOBS_ENABLED=1, started on the first request (one dispatcher per worker after a fork)
+    app.before_request(runner.ensure_started)
+    atexit.register(pool.shutdown)
+    return runner
+
+
+def get_job_runner():
+    return current_app.extensions['job_runner']
@@ -0,0 +1,70 @@
+import os
+from PIL import Image
+from utils.files import logo_variant_path
+from services.thermal import SUPPORTED_WIDTHS, get_thermal_resources
+from services.dither import dither
+
+# 50 x 25 mm box of the PDF header at 300 dpi
+PDF_LOGO_BOX = (590, 295)
+THUMBNAIL_BOX = (96, 96)
+
+def thermal_variant(width):
+    return f"thermal{width}"
+
+def flatten(img):
+    """Composite transparent logos onto white; converting RGBA straight to RGB turns them black."""
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, 'white')
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+def build_thermal_logo(img, thermal_width_mm):
+    """Resize to the logo band of one paper width and dither to 1-bit."""
+    res = get_thermal_resources(thermal_width_mm)
+    size = res.logo_size(img.width, img.height)
+    return dither(flatten(img).convert('L').resize(size, Image.LANCZOS))
+
+def build_logo_variants(logo_path, force=False):
+    """
+    Write the derived files of a stored logo next to it: one dithered bitmap per
+    thermal width, a flattened PDF copy and a web thumbnail. Existing variants are
+    kept unless `force` is set, so re-uploads and backfills are cheap.
+    """
+    with Image.open(logo_path) as source:
+        source.load()
+        img = flatten(source)
+
+    variants = {}
+    for width in SUPPORTED_WIDTHS:
+        variants[thermal_variant(width)] = lambda width=width: build_thermal_logo(img, width)
+
+    def pdf_variant():
+        pdf = img.copy()
+        pdf.thumbnail(PDF_LOGO_BOX)
+        return pdf
+
+    def thumbnail_variant():
+        thumbnail = img.copy()
+        thumbnail.thumbnail(THUMBNAIL_BOX)
+        return thumbnail
+
+    variants['pdf'] = pdf_variant
+    variants['thumb'] = thumbnail_variant
+
+    paths = {}
+    for name, build in variants.items():
+        path = logo_variant_path(logo_path, name)
+        if force or not os.path.exists(path):
+            build().save(path, 'PNG', optimize=True)
+        paths[name] = path
+    return paths
+
+def logo_variant(logo_path, variant):
+    """Path of a ready variant, or the original logo when it was never generated."""
+    if not logo_path:
+        return logo_path
+    path = logo_variant_path(logo_path, variant)
+    return path if os.path.exists(path) else logo_path
@@ -0,0 +1,71 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+DEFAULT_NUMBER_FORMAT = 'REC-{YYYY}{MM}{DD}-{N}'
+# Counter reset period -> tokens the template must contain for numbers to stay unique
+RESET_PERIODS = {
+    'never': (),
+    'yearly': ('{YYYY}',),
+    'monthly': ('{YYYY}', '{MM}'),
+    'daily': ('{YYYY}', '{MM}', '{DD}'),
+}
+
+_TOKEN = re.compile(r'(\{YYYY\}|\{MM\}|\{DD\}|\{N\})')
+_FIELDS = {'{YYYY}': '{0:%Y}', '{MM}': '{0:%m}', '{DD}': '{0:%d}', '{N}': '{1:04d}'}
+_PATTERNS = {'{YYYY}': r'\d{4}', '{MM}': r'\d{2}', '{DD}': r'\d{2}', '{N}': r'(\d+)'}
+
+
+@lru_cache(maxsize=256)
+def compile_number_format(template):
+    """
+    Turn a receipt number template into a str.format pattern taking (date, n),
+    so numbering a receipt is a single format call instead of four replaces.
+    """
+    parts = _TOKEN.split(template or DEFAULT_NUMBER_FORMAT)
+    return ''.join(
+        _FIELDS[part] if index % 2 else part.replace('{', '{{').replace('}', '}}')
+        for index, part in enumerate(parts)
+    )
+
+
+def format_receipt_number(template, n, now=None):
+    return compile_number_format(template).format(now or datetime.now(), n)
+
+
+@lru_cache(maxsize=256)
+def number_pattern(template):
+    """
+    Regex matching the numbers a template produces, any date, with the counter
+    as group 1, plus the literal text before the first token (for a LIKE prefix).
+    """
+    parts = _TOKEN.split(template or DEFAULT_NUMBER_FORMAT)
+    pattern = ''.join(
+        _PATTERNS[part] if index % 2 else re.escape(part)
+        for index, part in enumerate(parts)
+    )
+    return re.compile(pattern + r'\Z'), parts[0]
+
+
+def effective_reset(template, reset):
+    """The reset period actually applied: a counter cannot restart if the template does not show the period."""
+    template = template or DEFAULT_NUMBER_FORMAT
+    tokens = RESET_PERIODS.get(reset)
+    if tokens is None or not all(token in template for token in tokens):
+        return 'never'
+    return reset
+
+
+def period_bounds(reset, now):
+    """(key, start, end) of the counter period containing `now`; start/end are None for 'never'."""
+    if reset == 'daily':
+        start = datetime(now.year, now.month, now.day)
+        end = datetime.fromordinal(start.toordinal() + 1)
+        return now.strftime('%Y-%m-%d'), start, end
+    if reset == 'monthly':
+        start = datetime(now.year, now.month, 1)
+        end = datetime(now.year + 1, 1, 1) if now.month == 12 else datetime(now.year, now.month + 1, 1)
+        return now.strftime('%Y-%m'), start, end
+    if reset == 'yearly':
+        return now.strftime('%Y'), datetime(now.year, 1, 1), datetime(now.year + 1, 1, 1)
+    return '', None, None
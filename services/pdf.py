@@ -1,23 +1,131 @@
 import os
+import copy
+from functools import lru_cache
 from io import BytesIO
+from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from utils.i18n import t
-import qrcode
+from utils.i18n import t, get_locale
+from services.logos import logo_variant
+from services.qr import qr_png, qr_modules
 from urllib.parse import urlparse
 
-def generate_receipt_pdf(receipt, client, company, settings):
-    site_url = settings.get('site_url', '')
+PDF_RENDERERS = ('canvas', 'platypus')
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+PAGE_MARGIN = 20*mm
+
+MONTHS_FR = ['janvier', 'fevrier', 'mars', 'avril', 'mai', 'juin',
+             'juillet', 'aout', 'septembre', 'octobre', 'novembre', 'decembre']
+
+# Styles do not depend on the receipt or the locale: build them once per process
+_sample_styles = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle('Title', parent=_sample_styles['Heading1'], fontSize=26, spaceAfter=10, alignment=1)
+TEXT_STYLE = ParagraphStyle('Text', parent=_sample_styles['Normal'], fontSize=14, alignment=1, spaceAfter=8)
+RECEIPT_TITLE_STYLE = ParagraphStyle('ReceiptTitle', fontSize=22, spaceAfter=10, alignment=1)
+TOTAL_STYLE = ParagraphStyle('TotalStyle', fontSize=26, spaceAfter=10, alignment=1, textColor=colors.HexColor('#1E40AF'))
+THANK_YOU_STYLE = ParagraphStyle('ThankYou', fontSize=14, alignment=1, textColor=colors.grey)
+SITE_URL_STYLE = ParagraphStyle('SiteUrl', fontSize=14, alignment=1, textColor=colors.HexColor('#3B82F6'))
+
+ITEMS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('FONTSIZE', (0, 1), (-1, -1), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#E5E7EB')),
+])
+ITEMS_COL_WIDTHS = [120*mm, 40*mm]
 
+# Per-process registry of translated labels by locale (the set of locales is fixed)
+_labels_cache = {}
+# Footer flowables by (locale, site_url); bounded because site_url may come from the Host header
+FOOTER_CACHE_SIZE = 16
+
+class PdfLabels:
+    """Translated strings and the flowables made only of them, for one locale."""
+
+    def __init__(self, locale):
+        self.locale = locale
+        self.description = t('receipts.description', locale)
+        self.amount = t('receipts.amount', locale)
+        self.client = t('clients.client', locale)
+        self.payment_method = t('receipts.payment_method', locale)
+        self.receipt = t('receipts.receipt', locale)
+        self.thank_you = t('receipts.thank_you', locale)
+        self.payment_methods = {
+            'cash': t('receipts.payment_methods.cash', locale),
+            'card': t('receipts.payment_methods.card', locale),
+            'transfer': t('receipts.payment_methods.transfer', locale),
+            'check': t('receipts.payment_methods.check', locale)
+        }
+        self.receipt_title = Paragraph(f"<b>{self.receipt}</b>", RECEIPT_TITLE_STYLE)
+        self.thank_you_paragraph = Paragraph(self.thank_you, THANK_YOU_STYLE)
+
+def get_pdf_labels(locale):
+    labels = _labels_cache.get(locale)
+    if labels is None:
+        labels = PdfLabels(locale)
+        _labels_cache[locale] = labels
+    return labels
+
+def _site_domain(site_url):
     try:
         domain = urlparse(site_url).netloc
         if not domain:
             domain = site_url
     except:
         domain = site_url
+    return domain
+
+def get_pdf_footer(labels, site_url):
+    """Prototype flowables of the thank-you / QR / site block; copy before use."""
+    return _footer(labels.locale, site_url)
+
+@lru_cache(maxsize=FOOTER_CACHE_SIZE)
+def _footer(locale, site_url):
+    qr_image = Image(BytesIO(qr_png(site_url, box_size=10)), width=30*mm, height=30*mm)
+    qr_image.hAlign = 'CENTER'
+    return (
+        Spacer(1, 15*mm),
+        get_pdf_labels(locale).thank_you_paragraph,
+        Spacer(1, 10*mm),
+        qr_image,
+        Spacer(1, 3*mm),
+        Paragraph(_site_domain(site_url), SITE_URL_STYLE),
+    )
+
+def _format_date(created_at):
+    if not created_at:
+        return ''
+    try:
+        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return f"{dt.day} {MONTHS_FR[dt.month-1]} {dt.year} a {dt.strftime('%H:%M')}"
+    except:
+        return created_at[:16]
+
+def generate_receipt_pdf(receipt, client, company, settings, locale=None):
+    labels = get_pdf_labels(locale or get_locale())
+    if settings.get('pdf_renderer', 'canvas') == 'canvas':
+        layout = _layout_canvas_receipt(receipt, client, company, settings, labels)
+        if layout.fits():
+            return layout.render()
+    return _build_platypus_receipt(receipt, client, company, settings, labels)
+
+def _generate_receipt_pdf_task(receipt, client, company, settings, locale=None):
+    """Pool entry point: the PDF as bytes (the locale must be given, there is no session)."""
+    return generate_receipt_pdf(receipt, client, company, settings, locale=locale).getvalue()
+
+def _build_platypus_receipt(receipt, client, company, settings, labels):
+    site_url = settings.get('site_url', '')
     
     buffer = BytesIO()
     doc = SimpleDocTemplate(
@@ -29,18 +137,11 @@ def generate_receipt_pdf(receipt, client, company, settings):
         bottomMargin=20*mm
     )
     
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=26, spaceAfter=10, alignment=1)
-    text_style = ParagraphStyle('Text', parent=styles['Normal'], fontSize=14, alignment=1, spaceAfter=8)
-    text_style_left = ParagraphStyle('TextLeft', parent=styles['Normal'], fontSize=14, spaceAfter=8)
-    receipt_title_style = ParagraphStyle('ReceiptTitle', fontSize=22, spaceAfter=10, alignment=1)
-    total_style = ParagraphStyle('TotalStyle', fontSize=26, spaceAfter=10, alignment=1, textColor=colors.HexColor('#1E40AF'))
-    
     elements = []
     
     if company and company.get('logo') and os.path.exists(company['logo']):
         try:
-            img = Image(company['logo'], width=50*mm, height=25*mm)
+            img = Image(logo_variant(company['logo'], 'pdf'), width=50*mm, height=25*mm)
             img.hAlign = 'CENTER'
             elements.append(img)
             elements.append(Spacer(1, 5*mm))
@@ -49,101 +150,258 @@ def generate_receipt_pdf(receipt, client, company, settings):
     
     if company and company.get('name'):
         company_name_upper = company['name'].upper()
-        elements.append(Paragraph(f"<b>{company_name_upper}</b>", title_style))
+        elements.append(Paragraph(f"<b>{company_name_upper}</b>", TITLE_STYLE))
     
     if company:
         if company.get('address'):
             address_text = company['address'].replace('\n', '<br/>')
-            elements.append(Paragraph(address_text, text_style))
+            elements.append(Paragraph(address_text, TEXT_STYLE))
         if company.get('phone'):
-            elements.append(Paragraph(f"Tel: {company['phone']}", text_style))
+            elements.append(Paragraph(f"Tel: {company['phone']}", TEXT_STYLE))
         if company.get('tax_id'):
-            elements.append(Paragraph(f"ICE/SIRET: {company['tax_id']}", text_style))
+            elements.append(Paragraph(f"ICE/SIRET: {company['tax_id']}", TEXT_STYLE))
     
     elements.append(Spacer(1, 15*mm))
     
-    elements.append(Paragraph(f"<b>{t('receipts.receipt')}</b>", receipt_title_style))
-    elements.append(Paragraph(f"<b>N: {receipt.get('receipt_number', '')}</b>", receipt_title_style))
-    
-    created_at = receipt.get('created_at', '')
-    if created_at:
-        from datetime import datetime as dt_module
-        try:
-            dt = dt_module.fromisoformat(created_at.replace('Z', '+00:00'))
-            months_fr = ['janvier', 'fevrier', 'mars', 'avril', 'mai', 'juin', 
-                        'juillet', 'aout', 'septembre', 'octobre', 'novembre', 'decembre']
-            date_str = f"{dt.day} {months_fr[dt.month-1]} {dt.year} a {dt.strftime('%H:%M')}"
-        except:
-            date_str = created_at[:16]
-    else:
-        date_str = ''
-    elements.append(Paragraph(f"Date: {date_str}", text_style))
+    elements.append(copy.copy(labels.receipt_title))
+    elements.append(Paragraph(f"<b>N: {receipt.get('receipt_number', '')}</b>", RECEIPT_TITLE_STYLE))
+    elements.append(Paragraph(f"Date: {_format_date(receipt.get('created_at', ''))}", TEXT_STYLE))
     elements.append(Spacer(1, 10*mm))
     
     if client:
-        elements.append(Paragraph(f"<b>{t('clients.client')}:</b> {client.get('name', '')}", text_style))
+        elements.append(Paragraph(f"<b>{labels.client}:</b> {client.get('name', '')}", TEXT_STYLE))
         if client.get('email'):
-            elements.append(Paragraph(f"Email: {client.get('email')}", text_style))
+            elements.append(Paragraph(f"Email: {client.get('email')}", TEXT_STYLE))
         if client.get('whatsapp'):
-            elements.append(Paragraph(f"WhatsApp: {client.get('whatsapp')}", text_style))
+            elements.append(Paragraph(f"WhatsApp: {client.get('whatsapp')}", TEXT_STYLE))
     
     elements.append(Spacer(1, 10*mm))
     
     table_data = [
-        [t('receipts.description'), t('receipts.amount')]
+        [labels.description, labels.amount],
+        [receipt.get('description', ''), f"{receipt.get('amount', '0')} MAD"]
     ]
-    table_data.append([receipt.get('description', ''), f"{receipt.get('amount', '0')} MAD"])
-    
-    table = Table(table_data, colWidths=[120*mm, 40*mm])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('FONTSIZE', (0, 1), (-1, -1), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#E5E7EB')),
-    ]))
+    table = Table(table_data, colWidths=ITEMS_COL_WIDTHS)
+    table.setStyle(ITEMS_TABLE_STYLE)
     elements.append(table)
     
     elements.append(Spacer(1, 8*mm))
     
-    elements.append(Paragraph(f"<b>TOTAL: {receipt.get('amount', '0')} MAD</b>", total_style))
+    elements.append(Paragraph(f"<b>TOTAL: {receipt.get('amount', '0')} MAD</b>", TOTAL_STYLE))
     
     elements.append(Spacer(1, 5*mm))
     
-    payment_methods = {
-        'cash': t('receipts.payment_methods.cash'),
-        'card': t('receipts.payment_methods.card'),
-        'transfer': t('receipts.payment_methods.transfer'),
-        'check': t('receipts.payment_methods.check')
-    }
-    payment_text = payment_methods.get(receipt.get('payment_method', ''), receipt.get('payment_method', ''))
-    elements.append(Paragraph(f"<b>{t('receipts.payment_method')}:</b> {payment_text}", text_style))
-    
-    elements.append(Spacer(1, 15*mm))
-    elements.append(Paragraph(t('receipts.thank_you'), ParagraphStyle('ThankYou', fontSize=14, alignment=1, textColor=colors.grey)))
-    
-    elements.append(Spacer(1, 10*mm))
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=1)
-    qr.add_data(site_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    payment_text = labels.payment_methods.get(receipt.get('payment_method', ''), receipt.get('payment_method', ''))
+    elements.append(Paragraph(f"<b>{labels.payment_method}:</b> {payment_text}", TEXT_STYLE))
     
-    qr_buffer = BytesIO()
-    qr_img.save(qr_buffer, format='PNG')
-    qr_buffer.seek(0)
-    
-    qr_image = Image(qr_buffer, width=30*mm, height=30*mm)
-    qr_image.hAlign = 'CENTER'
-    elements.append(qr_image)
-    
-    elements.append(Spacer(1, 3*mm))
-    elements.append(Paragraph(domain, ParagraphStyle('SiteUrl', fontSize=14, alignment=1, textColor=colors.HexColor('#3B82F6'))))
+    # Static block: shallow copies share the parsed text but not per-build layout state
+    elements.extend(copy.copy(flowable) for flowable in get_pdf_footer(labels, site_url))
     
     doc.build(elements)
     buffer.seek(0)
     
     return buffer
+
+# Direct canvas renderer: same content at fixed coordinates, no platypus layout pass.
+# Vertical metrics follow the platypus styles above so both renderers paginate alike.
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FRAME_PADDING = 6
+CONTENT_WIDTH = PAGE_WIDTH - 2 * (PAGE_MARGIN + FRAME_PADDING)
+TABLE_LEFT = (PAGE_WIDTH - sum(ITEMS_COL_WIDTHS)) / 2
+TABLE_CELL_PADDING = 6
+TABLE_LEADING = 12
+HEADER_ROW_HEIGHT = 10 + TABLE_LEADING + 12
+BLUE = colors.HexColor('#3B82F6')
+DARK_BLUE = colors.HexColor('#1E40AF')
+GRID_GREY = colors.HexColor('#E5E7EB')
+
+class CanvasLayout:
+    """
+    Draw operations positioned top-down in a first pass, so a receipt that would
+    run past the bottom margin can be handed to platypus before anything is drawn.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self.y = PAGE_HEIGHT - PAGE_MARGIN - FRAME_PADDING
+
+    def fits(self):
+        return self.y >= PAGE_MARGIN + FRAME_PADDING
+
+    def space(self, height):
+        self.y -= height
+
+    def paragraph(self, text, style, font=None, space_after=None):
+        """Centered text wrapped to the content width, laid out like a Paragraph."""
+        font = font or style.fontName
+        size = style.fontSize
+        lines = []
+        for part in text.split('\n'):
+            lines.extend(simpleSplit(part, font, size, CONTENT_WIDTH) or [''])
+        baseline = self.y - size
+        for line in lines:
+            self.ops.append(('centered', baseline, line, font, size, style.textColor))
+            baseline -= style.leading
+        self.y -= style.leading * len(lines)
+        self.y -= style.spaceAfter if space_after is None else space_after
+
+    def labelled(self, label, value, style=TEXT_STYLE):
+        """Centered '<b>label:</b> value' line."""
+        label = f"{label}: "
+        size = style.fontSize
+        label_width = stringWidth(label, FONT_BOLD, size)
+        value_width = stringWidth(value, FONT, size)
+        if label_width + value_width > CONTENT_WIDTH:
+            self.paragraph(label.strip(), style, FONT_BOLD, space_after=0)
+            self.paragraph(value, style)
+            return
+        x = (PAGE_WIDTH - label_width - value_width) / 2
+        baseline = self.y - size
+        self.ops.append(('text', x, baseline, label, FONT_BOLD, size, style.textColor))
+        self.ops.append(('text', x + label_width, baseline, value, FONT, size, style.textColor))
+        self.y -= style.leading + style.spaceAfter
+
+    def image(self, image, width, height):
+        self.y -= height
+        self.ops.append(('image', image, (PAGE_WIDTH - width) / 2, self.y, width, height))
+
+    def qr_code(self, payload, size):
+        # Vector modules: no image to compress per document and sharp at any zoom
+        self.y -= size
+        self.ops.append(('qr', qr_modules(payload), (PAGE_WIDTH - size) / 2, self.y, size))
+
+    def items_table(self, header, row):
+        cells = [
+            simpleSplit(text, FONT, 14, width - 2 * TABLE_CELL_PADDING) or ['']
+            for text, width in zip(row, ITEMS_COL_WIDTHS)
+        ]
+        row_height = 10 + TABLE_LEADING * max(len(lines) for lines in cells) + 3
+        self.ops.append(('table', self.y, header, cells, row_height))
+        self.y -= HEADER_ROW_HEIGHT + row_height
+
+    def render(self):
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        for op in self.ops:
+            kind = op[0]
+            if kind == 'centered':
+                _, y, text, font, size, color = op
+                c.setFont(font, size)
+                c.setFillColor(color)
+                c.drawCentredString(PAGE_WIDTH / 2, y, text)
+            elif kind == 'text':
+                _, x, y, text, font, size, color = op
+                c.setFont(font, size)
+                c.setFillColor(color)
+                c.drawString(x, y, text)
+            elif kind == 'image':
+                _, image, x, y, width, height = op
+                c.drawImage(image, x, y, width, height)
+            elif kind == 'qr':
+                _draw_qr_code(c, *op[1:])
+            else:
+                _draw_items_table(c, *op[1:])
+        c.showPage()
+        c.save()
+        buffer.seek(0)
+        return buffer
+
+def _draw_qr_code(c, modules, x, y, size):
+    count, runs = modules
+    module = size / count
+    top = y + size
+    path = c.beginPath()
+    for row, column, length in runs:
+        path.rect(x + column * module, top - (row + 1) * module, length * module, module)
+    c.setFillColor(colors.black)
+    c.drawPath(path, stroke=0, fill=1)
+
+def _draw_items_table(c, top, header, cells, row_height):
+    widths = ITEMS_COL_WIDTHS
+    total_width = sum(widths)
+    header_bottom = top - HEADER_ROW_HEIGHT
+    bottom = header_bottom - row_height
+
+    c.setFillColor(BLUE)
+    c.rect(TABLE_LEFT, header_bottom, total_width, HEADER_ROW_HEIGHT, stroke=0, fill=1)
+
+    c.setFont(FONT, 14)
+    x = TABLE_LEFT
+    for title, lines, width in zip(header, cells, widths):
+        center = x + width / 2
+        # Cells are bottom-aligned above their bottom padding, like the platypus table
+        c.setFillColor(colors.white)
+        c.drawCentredString(center, header_bottom + 12, title)
+        c.setFillColor(colors.black)
+        baseline = bottom + 3 + TABLE_LEADING * (len(lines) - 1)
+        for line in lines:
+            c.drawCentredString(center, baseline, line)
+            baseline -= TABLE_LEADING
+        x += width
+
+    c.setStrokeColor(GRID_GREY)
+    c.setLineWidth(1)
+    c.rect(TABLE_LEFT, bottom, total_width, top - bottom, stroke=1, fill=0)
+    c.line(TABLE_LEFT, header_bottom, TABLE_LEFT + total_width, header_bottom)
+    c.line(TABLE_LEFT + widths[0], top, TABLE_LEFT + widths[0], bottom)
+
+def _layout_canvas_receipt(receipt, client, company, settings, labels):
+    site_url = settings.get('site_url', '')
+    layout = CanvasLayout()
+
+    if company and company.get('logo') and os.path.exists(company['logo']):
+        try:
+            logo = ImageReader(logo_variant(company['logo'], 'pdf'))
+            layout.image(logo, 50*mm, 25*mm)
+            layout.space(5*mm)
+        except:
+            pass
+
+    if company and company.get('name'):
+        layout.paragraph(company['name'].upper(), TITLE_STYLE, FONT_BOLD)
+
+    if company:
+        if company.get('address'):
+            layout.paragraph(company['address'], TEXT_STYLE)
+        if company.get('phone'):
+            layout.paragraph(f"Tel: {company['phone']}", TEXT_STYLE)
+        if company.get('tax_id'):
+            layout.paragraph(f"ICE/SIRET: {company['tax_id']}", TEXT_STYLE)
+
+    layout.space(15*mm)
+
+    layout.paragraph(labels.receipt, RECEIPT_TITLE_STYLE, FONT_BOLD)
+    layout.paragraph(f"N: {receipt.get('receipt_number', '')}", RECEIPT_TITLE_STYLE, FONT_BOLD)
+    layout.paragraph(f"Date: {_format_date(receipt.get('created_at', ''))}", TEXT_STYLE)
+    layout.space(10*mm)
+
+    if client:
+        layout.labelled(labels.client, client.get('name', '') or '')
+        if client.get('email'):
+            layout.paragraph(f"Email: {client.get('email')}", TEXT_STYLE)
+        if client.get('whatsapp'):
+            layout.paragraph(f"WhatsApp: {client.get('whatsapp')}", TEXT_STYLE)
+
+    layout.space(10*mm)
+
+    layout.items_table(
+        (labels.description, labels.amount),
+        (receipt.get('description', '') or '', f"{receipt.get('amount', '0')} MAD")
+    )
+
+    layout.space(8*mm)
+    layout.paragraph(f"TOTAL: {receipt.get('amount', '0')} MAD", TOTAL_STYLE, FONT_BOLD)
+    layout.space(5*mm)
+
+    payment_text = labels.payment_methods.get(receipt.get('payment_method', ''), receipt.get('payment_method', ''))
+    layout.labelled(labels.payment_method, payment_text or '')
+
+    layout.space(15*mm)
+    layout.paragraph(labels.thank_you, THANK_YOU_STYLE)
+    layout.space(10*mm)
+    layout.qr_code(site_url, 30*mm)
+    layout.space(3*mm)
+    layout.paragraph(_site_domain(site_url), SITE_URL_STYLE)
+
+    return layout
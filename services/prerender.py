@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import logging
+import threading
+from flask import current_app, has_app_context, has_request_context
+
+from services.render_pool import RenderPoolError
+from services.documents import cached_receipt_pdf, cached_thermal_receipt
+
+logger = logging.getLogger(__name__)
+
+
+class PrerenderQueue:
+    """
+    Local queue of documents to render right after a receipt is created, so the
+    PDF / thermal download that usually follows is served from the render cache.
+
+    One daemon thread drains the queue inside an app context. Pre-rendering is
+    best effort: when the queue is full the job is dropped, and when the render
+    pool is busy the thermal ticket is left for the download to render.
+    The worker thread is started lazily and restarted after a fork.
+    """
+
+    def __init__(self, app, maxsize=100, enabled=True):
+        self.app = app
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = {'enqueued': 0, 'rendered': 0, 'skipped': 0, 'failed': 0, 'dropped': 0}
+        self._last_duration = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='prerender', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def enqueue(self, receipt_id, owner_id, settings, locale):
+        """Queue a job; returns False when disabled or the queue is full."""
+        if not self.enabled:
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((receipt_id, owner_id, settings, locale, time.time()))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                started = time.perf_counter()
+                with self.app.app_context():
+                    self._process(*job[:4])
+                self._last_duration = time.perf_counter() - started
+            except Exception:
+                self._count('failed')
+                logger.exception("Pre-render of receipt %s failed", job[0])
+            finally:
+                self._queue.task_done()
+
+    def _process(self, receipt_id, owner_id, settings, locale):
+        from models import Receipt
+
+        receipt = Receipt.get_bundle(receipt_id, user_id=owner_id)
+        if not receipt:
+            return
+        client, company = receipt.client, receipt.company
+
+        cached_receipt_pdf(receipt, client, company, settings, locale)
+        try:
+            cached_thermal_receipt(receipt, client, company, settings)
+        except RenderPoolError:
+            # Interactive renders have priority over speculative ones
+            self._count('skipped')
+            return
+        self._count('rendered')
+
+    def stats(self):
+        with self._queue.mutex:
+            depth = len(self._queue.queue)
+            oldest = self._queue.queue[0][-1] if depth else None
+        return dict(
+            self._counters,
+            enabled=self.enabled,
+            depth=depth,
+            oldest_age=round(time.time() - oldest, 3) if oldest else 0,
+            last_duration=round(self._last_duration, 3) if self._last_duration is not None else None,
+        )
+
+
+def init_prerender_queue(app):
+    """Attach the app-scoped PrerenderQueue (PRERENDER_ENABLED=0 turns it off)."""
+    enabled = app.config.get('PRERENDER_ENABLED', os.environ.get('PRERENDER_ENABLED', '1') != '0')
+    prerender = PrerenderQueue(
+        app,
+        maxsize=int(os.environ.get('PRERENDER_QUEUE_SIZE', 100)),
+        enabled=enabled
+    )
+    app.extensions['prerender_queue'] = prerender
+    return prerender
+
+
+def get_prerender_queue():
+    return current_app.extensions.get('prerender_queue')
+
+
+def enqueue_prerender(receipt):
+    """
+    Schedule PDF + thermal pre-rendering of a freshly created receipt.
+
+    Settings and locale are captured here, inside the request, so the cache keys
+    match the ones the download routes compute (site_url may come from the
+    request URL when it is not configured).
+    """
+    if not has_app_context():
+        return False
+    prerender = get_prerender_queue()
+    if prerender is None or not prerender.enabled:
+        return False
+
+    from models import Settings
+    from utils.i18n import get_locale
+
+    owner_id = receipt.get('user_id')
+    locale = get_locale() if has_request_context() else 'fr'
+    return prerender.enqueue(receipt['id'], owner_id, Settings.get(user_id=owner_id), locale)
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+from functools import lru_cache
+import qrcode
+
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 128))
+
+def _build(payload, box_size, border, size=None):
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").get_image()
+    if size:
+        img = img.resize((size, size))
+    return img
+
+def _encode(img, fmt):
+    if fmt == 'png':
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    return img
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _cached(payload, box_size, size, fmt, border):
+    img = _build(payload, box_size, border, size)
+    return _encode(img, fmt)
+
+def qr_image(payload, box_size=3, size=None, border=1):
+    """
+    QR code as a mode '1' PIL image, optionally resized to `size` x `size`.
+    Cached images are shared between callers and must be treated as read-only.
+    """
+    return _cached(payload, box_size, size, 'image', border)
+
+def qr_png(payload, box_size=10, size=None, border=1):
+    """Same as qr_image, returned as PNG bytes."""
+    return _cached(payload, box_size, size, 'png', border)
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_modules(payload, border=1):
+    """
+    Dark modules as horizontal runs (row, column, length) plus the side length in
+    modules, for renderers that draw the code as vector rectangles.
+    """
+    qr = qrcode.QRCode(version=1, border=border)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    runs = []
+    for row, cells in enumerate(matrix):
+        start = None
+        for column, dark in enumerate(cells + [False]):
+            if dark and start is None:
+                start = column
+            elif not dark and start is not None:
+                runs.append((row, start, column - start))
+                start = None
+    return len(matrix), tuple(runs)
+
+def qr_cache_info():
+    return _cached.cache_info()
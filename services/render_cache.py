@@ -0,0 +1,165 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+import re
+from flask import current_app
+
+# Bump when the PDF/thermal layout changes so old artifacts are never served
+RENDER_VERSION = 3
+
+RECEIPT_FIELDS = ('id', 'receipt_number', 'description', 'amount', 'payment_method', 'created_at')
+CLIENT_FIELDS = ('id', 'name', 'email', 'whatsapp')
+COMPANY_FIELDS = ('id', 'name', 'address', 'phone', 'tax_id', 'logo')
+SETTINGS_FIELDS = ('thermal_width', 'site_url', 'pdf_renderer')
+
+_SAFE_NAMESPACE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def _pick(record, fields):
+    if not record:
+        return None
+    return {field: record.get(field) for field in fields}
+
+def _logo_mtime(company):
+    logo = company.get('logo') if company else None
+    if logo:
+        try:
+            return os.path.getmtime(logo)
+        except OSError:
+            return None
+    return None
+
+def render_key(kind, receipt, client, company, settings, locale='', **options):
+    """
+    Content hash of everything that influences a rendered document.
+    Editing a company, replacing its logo file or changing the thermal width /
+    site URL yields a new key, so stale artifacts are simply never looked up again.
+    """
+    payload = {
+        'v': RENDER_VERSION,
+        'kind': kind,
+        'receipt': _pick(receipt, RECEIPT_FIELDS),
+        'client': _pick(client, CLIENT_FIELDS),
+        'company': _pick(company, COMPANY_FIELDS),
+        'logo_mtime': _logo_mtime(company),
+        'settings': _pick(settings, SETTINGS_FIELDS),
+        'locale': locale,
+        'options': options,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class RenderCache:
+    """
+    Size-bounded on-disk cache of rendered documents.
+
+    Files are grouped by namespace (the company id) so a company edit can drop
+    its artifacts at once. Recency is tracked through file mtimes: hits touch
+    the file and eviction removes the least recently used files first.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _namespace_dir(self, namespace):
+        if not namespace:
+            namespace = '_'
+        elif not _SAFE_NAMESPACE.match(namespace):
+            # Never let an id coming from a URL escape the cache directory
+            namespace = hashlib.sha1(namespace.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, namespace)
+
+    def path_for(self, key, ext, namespace=None):
+        return os.path.join(self._namespace_dir(namespace), f"{key}.{ext}")
+
+    def get(self, key, ext, namespace=None, touch=True):
+        """Path of a cached file or None; touch=False leaves its recency unchanged."""
+        path = self.path_for(key, ext, namespace)
+        if not touch:
+            return path if os.path.exists(path) else None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, ext, data, namespace=None):
+        path = self.path_for(key, ext, namespace)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            # An overwrite replaces the old entry's bytes rather than adding to them
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def get_or_render(self, key, ext, render, namespace=None):
+        """Return a file path for `key`, calling `render()` (-> bytes) on a miss."""
+        path = self.get(key, ext, namespace)
+        if path is None:
+            path = self.put(key, ext, render(), namespace)
+        return path
+
+    def invalidate(self, namespace):
+        shutil.rmtree(self._namespace_dir(namespace), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self, keep=None):
+        # Rescan: other worker processes share the directory
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+def init_render_cache(app):
+    cache = RenderCache(
+        directory=os.environ.get('RENDER_CACHE_DIR', os.path.join(app.instance_path, 'render_cache')),
+        max_bytes=int(os.environ.get('RENDER_CACHE_MAX_MB', 256)) * 1024 * 1024
+    )
+    app.extensions['render_cache'] = cache
+    return cache
+
+def get_render_cache():
+    return current_app.extensions['render_cache']
@@ -0,0 +1,157 @@
+import os
+import atexit
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+
+class RenderPoolError(Exception):
+    """Base error for render jobs that could not be served right now."""
+
+    def __init__(self, message, retry_after=2):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RenderPoolBusy(RenderPoolError):
+    """Raised when every worker is busy and the pending queue is full."""
+
+
+class RenderTimeout(RenderPoolError):
+    """Raised when a render job did not finish within the per-job timeout."""
+
+
+class RenderPool:
+    """
+    Long-lived process pool for CPU-bound document rendering.
+
+    Worker processes are started lazily on the first submission and reused
+    across requests, so a render no longer pays process spawn and PIL/qrcode
+    imports. The number of in-flight jobs (running + queued) is bounded: once
+    `max_workers + max_pending` jobs are outstanding, `submit` fails fast with
+    RenderPoolBusy instead of piling up work behind the counter rush.
+
+    A job that is still running when its timeout expires cannot be cancelled,
+    so the executor is recycled: its workers are terminated and the next
+    submission starts a fresh pool. Other jobs in flight on the old executor
+    fail with a retryable RenderPoolError.
+
+    The executor is bound to the process that created it; after a fork
+    (pre-fork servers such as gunicorn) a fresh executor is created.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=30, initializer=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = self.max_workers * 2 if max_pending is None else max_pending
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        # Executor that owns each outstanding future, for recycling on timeout
+        self._owners = weakref.WeakKeyDictionary()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=self.initializer
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` on a worker, or raise RenderPoolBusy."""
+        if not self._slots.acquire(blocking=False):
+            raise RenderPoolBusy("Render queue is full", retry_after=self._retry_after())
+
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                # A worker died (OOM, segfault in a native lib); start over once
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._owners[future] = executor
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Submit a job and wait for its result (releases the GIL while waiting)."""
+        return self.result(self.submit(fn, *args, **kwargs), timeout=timeout)
+
+    def result(self, future, timeout=None):
+        """Wait for a submitted job, turning a timeout into RenderTimeout."""
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel() and not future.done():
+                # Already running: only killing its worker frees the slot
+                self._recycle_executor(self._owners.get(future))
+            raise RenderTimeout("Render job timed out", retry_after=self._retry_after())
+        except BrokenProcessPool:
+            raise RenderPoolError("Render worker was restarted", retry_after=self._retry_after())
+
+    def _recycle_executor(self, executor):
+        """Shut down an executor with a hung job and terminate its workers."""
+        if executor is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if hasattr(executor, 'terminate_workers'):
+            # Python 3.14+: public API, fails pending futures and shuts down
+            executor.terminate_workers()
+            return
+        # Older versions have no public way to reach the workers: `_processes` is a
+        # CPython implementation detail (pid -> Process), so read it defensively
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        # Waiting lets the executor fail the killed jobs, releasing their slots; without
+        # workers to kill it would wait for the hung job, so only wait when some were
+        executor.shutdown(wait=bool(processes), cancel_futures=True)
+
+    def _retry_after(self):
+        # Rough hint: a full queue drains in about one job duration per worker round
+        return max(1, int(self.timeout // 10))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def init_render_pool(app, initializer=None):
+    """Attach an app-scoped RenderPool and make sure it is shut down on exit."""
+    pool = RenderPool(
+        max_workers=int(os.environ.get('RENDER_POOL_WORKERS', 0)) or None,
+        max_pending=int(os.environ['RENDER_POOL_MAX_PENDING']) if os.environ.get('RENDER_POOL_MAX_PENDING') else None,
+        timeout=float(os.environ.get('RENDER_JOB_TIMEOUT', 30)),
+        initializer=initializer
+    )
+    app.extensions['render_pool'] = pool
+    atexit.register(pool.shutdown)
+    return pool
+
+
+def get_render_pool():
+    return current_app.extensions['render_pool']
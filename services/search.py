@@ -0,0 +1,298 @@
+import re
+import unicodedata
+
+from sqlalchemy import text
+
+SEARCH_PAGE_SIZE = 20
+MAX_QUERY_TERMS = 8
+# SQLite ranks matches by blocks of this many, newest block first
+RANK_WINDOW = 200
+
+# Letters and digits only: both index tokenizers split on everything else
+_TERM = re.compile(r'[^\W_]+')
+
+# Relevance of a term found in each searchable field (SQLite ranking)
+FIELD_WEIGHTS = (('receipt_number', 10), ('client', 6), ('amount', 4), ('company', 3), ('description', 2))
+
+
+def owner_token(user_id):
+    """Indexed with every SQLite document so a match is restricted to one user inside the index itself"""
+    return 'u' + user_id.replace('-', '').lower()
+
+
+def query_terms(query):
+    return _TERM.findall((query or '').lower())[:MAX_QUERY_TERMS]
+
+
+def is_prefix(terms, position):
+    """
+    Only the last word is matched as a prefix (the one still being typed), and
+    only from two characters: longer prefixes than the index precomputes and
+    single letters expand to a large part of the vocabulary.
+    """
+    return position == len(terms) - 1 and len(terms[position]) > 1
+
+
+def fold(value):
+    """Lowercase words without diacritics, as the SQLite tokenizer indexes them"""
+    value = (value or '').lower()
+    if value.isascii():
+        return _TERM.findall(value)
+    decomposed = unicodedata.normalize('NFKD', value)
+    return _TERM.findall(''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+# Receipts joined to the client and company they show (same ownership rule as Receipt.get_bundle)
+_SOURCE = """
+    FROM receipts r
+    LEFT JOIN clients c ON c.id = r.client_id AND c.user_id = r.user_id
+    LEFT JOIN companies co ON co.id = r.company_id AND co.user_id = r.user_id
+"""
+
+# Restriction of a reindex: one receipt, or every receipt of a user's client / company
+_SCOPES = {
+    'receipt': "r.id = :receipt_id",
+    'client': "r.user_id = :user_id AND r.client_id = :client_id",
+    'company': "r.user_id = :user_id AND r.company_id = :company_id",
+    'all': "1 = 1",
+}
+
+
+class SqliteReceiptIndex:
+    """
+    FTS5 table `receipt_search`, one row per receipt. FTS rowids are allocated
+    in `receipt_search_docs` (receipt id -> doc), so updates and deletes are
+    rowid lookups rather than scans of an unindexed id column.
+    """
+
+    def exists(self, session):
+        return session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'receipt_search'"
+        )).first() is not None
+
+    def create(self, session):
+        session.execute(text(
+            "CREATE TABLE IF NOT EXISTS receipt_search_docs ("
+            "doc INTEGER PRIMARY KEY, receipt_id VARCHAR(36) NOT NULL UNIQUE)"
+        ))
+        session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS receipt_search USING fts5("
+            "owner, receipt_number, description, amount, client, company, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+
+    def _document(self):
+        digits = "coalesce(c.whatsapp, '')"
+        for separator in (' ', '-', '+', '.', '(', ')'):
+            digits = f"replace({digits}, '{separator}', '')"
+        return (
+            "'u' || lower(replace(r.user_id, '-', '')), r.receipt_number, r.description, "
+            "printf('%.2f', r.amount), "
+            f"coalesce(c.name, '') || ' ' || coalesce(c.email, '') || ' ' || coalesce(c.whatsapp, '') || ' ' || {digits} "
+            # Last nine digits: the number without country code or trunk 0
+            f"|| ' ' || substr({digits}, -9), "
+            "coalesce(co.name, '')"
+        )
+
+    def add(self, session, scope, params):
+        where = _SCOPES[scope]
+        session.execute(text(
+            f"INSERT OR IGNORE INTO receipt_search_docs (receipt_id) SELECT r.id FROM receipts r WHERE {where}"
+        ), params)
+        session.execute(text(
+            "INSERT INTO receipt_search (rowid, owner, receipt_number, description, amount, client, company) "
+            f"SELECT d.doc, {self._document()} {_SOURCE} JOIN receipt_search_docs d ON d.receipt_id = r.id WHERE {where}"
+        ), params)
+
+    def refresh(self, session, scope, params):
+        session.execute(text(
+            "DELETE FROM receipt_search WHERE rowid IN ("
+            f"SELECT d.doc FROM receipts r JOIN receipt_search_docs d ON d.receipt_id = r.id WHERE {_SCOPES[scope]})"
+        ), params)
+        self.add(session, scope, params)
+
+    def remove(self, session, receipt_id):
+        session.execute(text(
+            "DELETE FROM receipt_search WHERE rowid = "
+            "(SELECT doc FROM receipt_search_docs WHERE receipt_id = :receipt_id)"
+        ), {'receipt_id': receipt_id})
+        session.execute(text("DELETE FROM receipt_search_docs WHERE receipt_id = :receipt_id"),
+                        {'receipt_id': receipt_id})
+
+    def clear(self, session):
+        session.execute(text("DELETE FROM receipt_search"))
+        session.execute(text("DELETE FROM receipt_search_docs"))
+
+    def search(self, session, user_id, terms, limit, offset):
+        """
+        Matches are walked newest first (docs are numbered in creation order, so
+        LIMIT stops the walk early) and ranked on the fields they match
+        (FIELD_WEIGHTS) within blocks of RANK_WINDOW, newest first among equals.
+        Ranking is therefore not global: a better match older than the first
+        RANK_WINDOW matches comes on a later page. Global ranking (bm25) reads
+        the complete doclist of every term, ~100 ms once an account holds
+        hundreds of thousands of receipts.
+        """
+        match = ' '.join(f'"{term}"*' if is_prefix(terms, position) else f'"{term}"'
+                         for position, term in enumerate(terms))
+        expression = f'owner : {owner_token(user_id)} AND {{receipt_number description amount client company}} : ({match})'
+        start = offset - offset % RANK_WINDOW
+        end = offset + limit + (-(offset + limit)) % RANK_WINDOW
+        rows = session.execute(text(
+            "SELECT d.receipt_id, s.receipt_number, s.description, s.amount, s.client, s.company FROM ("
+            "SELECT rowid, receipt_number, description, amount, client, company FROM receipt_search "
+            "WHERE receipt_search MATCH :expression ORDER BY rowid DESC LIMIT :count OFFSET :start"
+            ") s JOIN receipt_search_docs d ON d.doc = s.rowid ORDER BY s.rowid DESC"
+        ), {'expression': expression, 'count': end - start, 'start': start}).all()
+
+        ranked = []
+        for block in range(0, len(rows), RANK_WINDOW):
+            ranked.extend(sorted(rows[block:block + RANK_WINDOW], key=lambda row: -self._score(row, terms)))
+        return [row.receipt_id for row in ranked[offset - start:offset - start + limit]]
+
+    def _score(self, row, terms):
+        fields = [(fold(getattr(row, name)), weight) for name, weight in FIELD_WEIGHTS]
+        score = 0
+        for position, term in enumerate(terms):
+            prefix = is_prefix(terms, position)
+            term = ''.join(fold(term))
+            score += max((weight for words, weight in fields
+                          if any(word.startswith(term) if prefix else word == term for word in words)), default=0)
+        return score
+
+
+class PostgresReceiptIndex:
+    """
+    `receipt_search` table of weighted tsvectors with a GIN index, one row per
+    receipt. The owner is a plain indexed column rather than a token of the
+    document, so matches of other accounts are never read or ranked.
+    """
+
+    def exists(self, session):
+        # Tables created before the user_id column are upgraded and refilled by create/add
+        return session.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'receipt_search' AND column_name = 'user_id'"
+        )).first() is not None
+
+    def create(self, session):
+        session.execute(text(
+            "CREATE TABLE IF NOT EXISTS receipt_search ("
+            "receipt_id VARCHAR(36) PRIMARY KEY, user_id VARCHAR(36), document TSVECTOR NOT NULL)"
+        ))
+        session.execute(text("ALTER TABLE receipt_search ADD COLUMN IF NOT EXISTS user_id VARCHAR(36)"))
+        session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_search_document ON receipt_search USING GIN (document)"
+        ))
+        session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_search_user ON receipt_search (user_id)"
+        ))
+
+    def _document(self):
+        def words(value):
+            # Split like the query side does (e-mails, phone numbers and amounts into their parts)
+            return f"to_tsvector('simple', regexp_replace({value}, '[^[:alnum:]]+', ' ', 'g'))"
+        digits = "regexp_replace(coalesce(c.whatsapp, ''), '[^0-9]', '', 'g')"
+        client = ("coalesce(c.name, '') || ' ' || coalesce(c.email, '') || ' ' || coalesce(c.whatsapp, '') "
+                  f"|| ' ' || {digits} || ' ' || right({digits}, 9)")
+        company = "coalesce(co.name, '') || ' ' || r.amount::text"
+        description = "coalesce(r.description, '')"
+        return (
+            f"setweight({words('r.receipt_number')}, 'A') || "
+            f"setweight({words(client)}, 'B') || "
+            f"setweight({words(company)}, 'C') || "
+            f"setweight({words(description)}, 'D')"
+        )
+
+    def add(self, session, scope, params):
+        session.execute(text(
+            f"INSERT INTO receipt_search (receipt_id, user_id, document) SELECT r.id, r.user_id, {self._document()} "
+            f"{_SOURCE} WHERE {_SCOPES[scope]} "
+            "ON CONFLICT (receipt_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document"
+        ), params)
+
+    refresh = add
+
+    def remove(self, session, receipt_id):
+        session.execute(text("DELETE FROM receipt_search WHERE receipt_id = :receipt_id"),
+                        {'receipt_id': receipt_id})
+
+    def clear(self, session):
+        session.execute(text("TRUNCATE receipt_search"))
+
+    def search(self, session, user_id, terms, limit, offset):
+        expression = ' & '.join(f'{term}:*' if is_prefix(terms, position) else term
+                                for position, term in enumerate(terms))
+        rows = session.execute(text(
+            "SELECT receipt_id FROM receipt_search, to_tsquery('simple', :expression) query "
+            "WHERE user_id = :user_id AND document @@ query "
+            "ORDER BY ts_rank(document, query) DESC, receipt_id LIMIT :limit OFFSET :offset"
+        ), {'expression': expression, 'user_id': user_id, 'limit': limit, 'offset': offset})
+        return [row[0] for row in rows]
+
+
+def get_search_index(engine=None):
+    from init_db import db
+
+    engine = engine or db.engine
+    return PostgresReceiptIndex() if engine.dialect.name == 'postgresql' else SqliteReceiptIndex()
+
+
+def ensure_search_schema():
+    """Create the search index of the current database, filling it from existing receipts the first time"""
+    from init_db import db
+
+    index = get_search_index()
+    if index.exists(db.session):
+        return False
+    index.create(db.session)
+    index.add(db.session, 'all', {})
+    db.session.commit()
+    return True
+
+
+# Called by the model wrappers inside their write transactions (after a flush)
+
+def index_receipt(receipt_id):
+    from init_db import db
+    get_search_index().add(db.session, 'receipt', {'receipt_id': receipt_id})
+
+
+def unindex_receipt(receipt_id):
+    from init_db import db
+    get_search_index().remove(db.session, receipt_id)
+
+
+def reindex_client_receipts(user_id, client_id):
+    from init_db import db
+    get_search_index().refresh(db.session, 'client', {'user_id': user_id, 'client_id': client_id})
+
+
+def reindex_company_receipts(user_id, company_id):
+    from init_db import db
+    get_search_index().refresh(db.session, 'company', {'user_id': user_id, 'company_id': company_id})
+
+
+def rebuild_search_index():
+    from init_db import db
+
+    index = get_search_index()
+    index.clear(db.session)
+    index.add(db.session, 'all', {})
+    db.session.commit()
+
+
+def search_receipt_ids(user_id, query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Ids of a user's receipts matching every word of `query` (the last one as a
+    prefix), ranked on the fields they match, and whether a further page exists.
+    PostgreSQL ranks all matches; SQLite ranks them by blocks, see its index.
+    """
+    from init_db import db
+
+    terms = query_terms(query)
+    if not terms or not user_id:
+        return [], False
+    page = max(page, 1)
+    ids = get_search_index().search(db.session, user_id, terms, per_page + 1, (page - 1) * per_page)
+    return ids[:per_page], len(ids) > per_page
@@ -0,0 +1,218 @@
+from decimal import Decimal
+from datetime import datetime
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from utils.i18n import t, get_locale
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 15*mm
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FONT_SIZE = 9
+ROW_HEIGHT = 14
+HEADER_BLUE = colors.HexColor('#3B82F6')
+ROW_SHADE = colors.HexColor('#F3F4F6')
+TOTAL_BLUE = colors.HexColor('#1E40AF')
+
+# (key, width, align); the description column takes the remaining width
+COLUMNS = (
+    ('date', 24*mm, 'left'),
+    ('receipt_number', 42*mm, 'left'),
+    ('description', None, 'left'),
+    ('payment_method', 26*mm, 'left'),
+    ('amount', 28*mm, 'right'),
+)
+CELL_PADDING = 3
+
+def _column_layout():
+    fixed = sum(width for _, width, _ in COLUMNS if width)
+    x = MARGIN
+    layout = []
+    for key, width, align in COLUMNS:
+        width = width or (PAGE_WIDTH - 2 * MARGIN - fixed)
+        layout.append((key, x, width, align))
+        x += width
+    return layout
+
+COLUMN_LAYOUT = _column_layout()
+
+def _fit(text, width, font=FONT, size=FONT_SIZE):
+    """Cut `text` with an ellipsis so it fits on one table line."""
+    text = ' '.join((text or '').split())
+    if stringWidth(text, font, size) <= width:
+        return text
+    # Binary search on the prefix length: a handful of measurements per cell
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if stringWidth(text[:middle] + '...', font, size) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + '...'
+
+def _money(value):
+    return f"{value:,.2f} MAD".replace(',', ' ')
+
+class StatementPdf:
+    """
+    Client statement drawn page by page: each receipt is placed as it arrives
+    and only the running totals are kept, so the caller can feed a streamed
+    query of any length.
+    """
+
+    def __init__(self, output, client, period, locale=None):
+        locale = locale or get_locale()
+        self.labels = {
+            'title': t('clients.statement_title', locale),
+            'page': t('clients.statement_page', locale),
+            'page_total': t('clients.statement_page_total', locale),
+            'carried': t('clients.statement_carried', locale),
+            'grand_total': t('clients.statement_grand_total', locale),
+            'count': t('clients.statement_count', locale),
+            'empty': t('receipts.no_receipts', locale),
+            'date': t('receipts.date', locale),
+            'receipt_number': t('receipts.receipt_number', locale),
+            'description': t('receipts.description', locale),
+            'payment_method': t('receipts.payment_method', locale),
+            'amount': t('receipts.amount', locale),
+        }
+        self.payment_methods = {
+            method: t(f'receipts.payment_methods.{method}', locale)
+            for method in ('cash', 'card', 'transfer', 'check')
+        }
+        self.client = client
+        self.period = period
+        self.canvas = canvas.Canvas(output, pagesize=A4)
+        self.canvas.setTitle(f"{self.labels['title']} - {client.get('name', '')}")
+        self.page = 0
+        self.count = 0
+        self.total = Decimal('0')
+        self.page_total = Decimal('0')
+        self.y = None
+
+    def _start_page(self):
+        c = self.canvas
+        self.page += 1
+        self.page_total = Decimal('0')
+        top = PAGE_HEIGHT - MARGIN
+
+        c.setFillColor(colors.black)
+        c.setFont(FONT_BOLD, 16)
+        c.drawString(MARGIN, top - 16, self.labels['title'])
+        c.setFont(FONT, 9)
+        c.drawRightString(PAGE_WIDTH - MARGIN, top - 16, f"{self.labels['page']} {self.page}")
+        c.setFont(FONT_BOLD, 11)
+        c.drawString(MARGIN, top - 34, self.client.get('name', ''))
+        c.setFont(FONT, 9)
+        contact = '  '.join(v for v in (self.client.get('email'), self.client.get('whatsapp')) if v)
+        c.drawString(MARGIN, top - 47, contact)
+        c.drawRightString(PAGE_WIDTH - MARGIN, top - 34, self.period)
+
+        self.y = top - 70
+        if self.page > 1:
+            self._total_line(self.labels['carried'], self.total)
+
+        c.setFillColor(HEADER_BLUE)
+        c.rect(MARGIN, self.y - ROW_HEIGHT, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, stroke=0, fill=1)
+        c.setFillColor(colors.white)
+        c.setFont(FONT_BOLD, FONT_SIZE)
+        for key, x, width, align in COLUMN_LAYOUT:
+            self._cell(self.labels[key], x, width, align, FONT_BOLD)
+        self.y -= ROW_HEIGHT
+        c.setFont(FONT, FONT_SIZE)
+        c.setFillColor(colors.black)
+
+    def _cell(self, text, x, width, align, font=FONT):
+        baseline = self.y - ROW_HEIGHT + 4
+        text = _fit(text, width - 2 * CELL_PADDING, font)
+        if align == 'right':
+            self.canvas.drawRightString(x + width - CELL_PADDING, baseline, text)
+        else:
+            self.canvas.drawString(x + CELL_PADDING, baseline, text)
+
+    def _total_line(self, label, value, color=colors.black):
+        c = self.canvas
+        c.setFillColor(color)
+        c.setFont(FONT_BOLD, FONT_SIZE + 1)
+        baseline = self.y - ROW_HEIGHT + 4
+        c.drawRightString(PAGE_WIDTH - MARGIN - 30*mm, baseline, label)
+        c.drawRightString(PAGE_WIDTH - MARGIN - CELL_PADDING, baseline, _money(value))
+        c.setFillColor(colors.black)
+        c.setFont(FONT, FONT_SIZE)
+        self.y -= ROW_HEIGHT
+
+    def _end_page(self):
+        self.y -= 4
+        self._total_line(self.labels['page_total'], self.page_total)
+        self.canvas.showPage()
+
+    def add(self, receipt):
+        # Keep room for the page subtotal and, on the last page, the grand total
+        if self.y is None or self.y - ROW_HEIGHT < MARGIN + 3 * ROW_HEIGHT:
+            if self.y is not None:
+                self._end_page()
+            self._start_page()
+
+        amount = receipt.get('amount') or Decimal('0')
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        created_at = receipt.get('created_at')
+        if isinstance(created_at, datetime):
+            created_at = created_at.strftime('%d/%m/%Y')
+        method = receipt.get('payment_method', '')
+
+        if self.count % 2:
+            self.canvas.setFillColor(ROW_SHADE)
+            self.canvas.rect(MARGIN, self.y - ROW_HEIGHT, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, stroke=0, fill=1)
+            self.canvas.setFillColor(colors.black)
+        values = {
+            'date': created_at or '',
+            'receipt_number': receipt.get('receipt_number', ''),
+            'description': receipt.get('description', ''),
+            'payment_method': self.payment_methods.get(method, method),
+            'amount': _money(amount),
+        }
+        for key, x, width, align in COLUMN_LAYOUT:
+            self._cell(values[key], x, width, align)
+        self.y -= ROW_HEIGHT
+
+        self.count += 1
+        self.total += amount
+        self.page_total += amount
+
+    def finish(self):
+        if self.y is None:
+            self._start_page()
+            self.canvas.drawString(MARGIN + CELL_PADDING, self.y - ROW_HEIGHT + 4, self.labels['empty'])
+            self.y -= ROW_HEIGHT
+        self.y -= 4
+        self._total_line(self.labels['page_total'], self.page_total)
+        self._total_line(f"{self.labels['grand_total']} ({self.count} {self.labels['count']})", self.total, TOTAL_BLUE)
+        self.canvas.showPage()
+        self.canvas.save()
+        return self.count, self.total
+
+def statement_period(start, end, locale=None):
+    """Human readable period line of a statement; `end` is inclusive."""
+    if start and end:
+        return f"{start.strftime('%d/%m/%Y')} - {end.strftime('%d/%m/%Y')}"
+    if start:
+        return f"{t('receipts.batch_from', locale)} {start.strftime('%d/%m/%Y')}"
+    if end:
+        return f"{t('receipts.batch_to', locale)} {end.strftime('%d/%m/%Y')}"
+    return t('clients.statement_all_time', locale)
+
+def statement_filename(client, day=None):
+    safe_name = ''.join(ch if ch.isalnum() else '_' for ch in client.get('name', ''))[:40] or 'client'
+    return f"releve_{safe_name}_{(day or datetime.now()).strftime('%Y%m%d')}.pdf"
+
+def render_client_statement(receipts, client, output, period='', locale=None):
+    """Write the statement PDF of an iterable of receipts to `output`; returns (count, total)."""
+    statement = StatementPdf(output, client, period, locale)
+    for receipt in receipts:
+        statement.add(receipt)
+    return statement.finish()
@@ -1,120 +1,233 @@
 import os
 from io import BytesIO
-from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
-import qrcode
 from urllib.parse import urlparse  # Ajout pour extraire le domaine proprement
+from services.render_pool import get_render_pool
+from services import escpos
+from services.qr import qr_image
+from services.dither import dither
+from utils.files import logo_variant_path
+
+FONT_REGULAR_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+FONT_BOLD_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+THERMAL_DPI = 203
+THERMAL_MARGIN = 8
+SUPPORTED_WIDTHS = (48, 57, 58, 80)
+OUTPUT_FORMATS = ('png', 'escpos')
+FORMAT_EXTENSIONS = {'png': 'png', 'escpos': 'bin'}
+ROLL_CUT_GAP = 40
+
+# Thermal printers are monochrome: greyscale keeps anti-aliased text at a third of
+# the RGB memory, '1' halves the PNG further. Low zlib levels trade a few KB for speed.
+PNG_MODE = os.environ.get('THERMAL_PNG_MODE', 'L')
+if PNG_MODE not in ('1', 'L', 'RGB'):
+    PNG_MODE = 'L'
+PNG_COMPRESS_LEVEL = int(os.environ.get('THERMAL_PNG_COMPRESS_LEVEL', 1))
+
+PAYMENT_METHODS = {
+    'cash': 'Especes',
+    'card': 'Carte',
+    'transfer': 'Virement',
+    'check': 'Cheque'
+}
+THANK_YOU_TEXT = "Merci pour votre confiance!"
+TOTAL_PREFIX = "TOTAL: "
+
+# Per-process registries: fonts by (path, size) and layout resources by thermal width
+_fonts_cache = {}
+_resources_cache = {}
+
+def _load_font(path, size):
+    key = (path, size)
+    font = _fonts_cache.get(key)
+    if font is None:
+        try:
+            font = ImageFont.truetype(path, size)
+        except Exception:
+            font = ImageFont.load_default()
+        _fonts_cache[key] = font
+    return font
 
-def _generate_thermal_receipt_task(receipt, client, company, settings):
-    # Utiliser l'URL passée dans les settings en priorité, sinon chercher dans l'environnement
-    site_url = settings.get('site_url', '')
-
-    thermal_width_mm = int(settings.get('thermal_width', 58))
-
-    dpi = 203
-    width_px = int(thermal_width_mm * dpi / 25.4)
-
-    margin = 8
-
-    if thermal_width_mm <= 48:
-        font_size_title = 16
-        font_size_text = 14
-        line_height = 24
-        qr_size = 80
-        logo_height = 50
-    elif thermal_width_mm <= 58:
-        font_size_title = 20
-        font_size_text = 16
-        line_height = 28
-        qr_size = 100
-        logo_height = 60
-    else:
-        font_size_title = 26
-        font_size_text = 20
-        line_height = 34
-        qr_size = 120
-        logo_height = 80
+class ThermalResources:
+    """
+    Fonts, layout profile and pre-measured constant strings for one paper width.
+    Built once per process so a render only measures the variable text.
+    """
 
-    lines_needed = 45
-    height_px = lines_needed * line_height + 200 + qr_size + logo_height
+    def __init__(self, thermal_width_mm):
+        self.thermal_width_mm = thermal_width_mm
+        self.width_px = int(thermal_width_mm * THERMAL_DPI / 25.4)
+        self.margin = THERMAL_MARGIN
+
+        if thermal_width_mm <= 48:
+            self.font_size_title = 16
+            self.font_size_text = 14
+            self.line_height = 24
+            self.qr_size = 80
+            self.logo_height = 50
+        elif thermal_width_mm <= 58:
+            self.font_size_title = 20
+            self.font_size_text = 16
+            self.line_height = 28
+            self.qr_size = 100
+            self.logo_height = 60
+        else:
+            self.font_size_title = 26
+            self.font_size_text = 20
+            self.line_height = 34
+            self.qr_size = 120
+            self.logo_height = 80
+
+        self.fonts = {
+            'title': _load_font(FONT_BOLD_PATH, self.font_size_title),
+            'text': _load_font(FONT_REGULAR_PATH, self.font_size_text),
+            'text_bold': _load_font(FONT_BOLD_PATH, self.font_size_text),
+        }
+
+        # Approximate characters per line used to wrap the description
+        self.max_chars = max(10, (self.width_px - 2 * self.margin) // (self.font_size_text // 2))
+
+        self._measures = {}
+        self._premeasure('text', THANK_YOU_TEXT)
+        self._premeasure('title', TOTAL_PREFIX)
+        for label in PAYMENT_METHODS.values():
+            self._premeasure('text', f"Paiement: {label}")
+
+    def _premeasure(self, font_name, text):
+        self._measures[(font_name, text)] = self._measure(font_name, text)
+
+    def _measure(self, font_name, text):
+        bbox = self.fonts[font_name].getbbox(text)
+        return bbox[2] - bbox[0]
+
+    def logo_size(self, width, height):
+        """Size a logo of `width` x `height` to the logo band, never wider than the paper."""
+        aspect = width / height
+        logo_w = int(self.logo_height * aspect)
+        if logo_w > self.width_px - 2 * self.margin:
+            logo_w = self.width_px - 2 * self.margin
+            return logo_w, int(logo_w / aspect)
+        return logo_w, self.logo_height
+
+    def measure(self, text, font_name='text'):
+        """Width in pixels of `text`; constant strings come from the pre-measured table."""
+        width = self._measures.get((font_name, text))
+        if width is None:
+            width = self._measure(font_name, text)
+        return width
+
+def get_thermal_resources(thermal_width_mm):
+    resources = _resources_cache.get(thermal_width_mm)
+    if resources is None:
+        resources = ThermalResources(thermal_width_mm)
+        _resources_cache[thermal_width_mm] = resources
+    return resources
+
+def warm_thermal_worker():
+    """Render pool initializer: load fonts and layout profiles before the first job arrives."""
+    for width in SUPPORTED_WIDTHS:
+        get_thermal_resources(width)
+
+class ThermalLayout:
+    """
+    Draw operations collected in a first pass, so the canvas can be allocated at
+    the exact content height instead of an oversized buffer that is cropped later.
+    """
 
-    img = Image.new('RGB', (width_px, height_px), 'white')
-    draw = ImageDraw.Draw(img)
+    def __init__(self, resources):
+        self.res = resources
+        self.ops = []
+
+    def text_centered(self, y, text, font_name='text', text_width=None):
+        if text_width is None:
+            text_width = self.res.measure(text, font_name)
+        x = (self.res.width_px - text_width) // 2
+        self.ops.append(('text', (x, y), text, font_name))
+
+    def line(self, y, width):
+        self.ops.append(('line', y, width))
+
+    def image(self, x, y, image):
+        self.ops.append(('image', (x, y), image))
+
+    def paint(self, mode, height):
+        img = Image.new(mode, (self.res.width_px, height), 'white')
+        draw = ImageDraw.Draw(img)
+        margin = self.res.margin
+        for op in self.ops:
+            if op[0] == 'text':
+                draw.text(op[1], op[2], fill='black', font=self.res.fonts[op[3]])
+            elif op[0] == 'line':
+                draw.line([(margin, op[1]), (self.res.width_px - margin, op[1])], fill='black', width=op[2])
+            else:
+                image = op[2]
+                if mode == '1':
+                    image = dither(image)
+                elif image.mode != mode:
+                    image = image.convert(mode)
+                img.paste(image, op[1])
+        return img
+
+def _layout_thermal_receipt(receipt, client, company, settings):
+    """First pass: position every element and return (layout, total height)."""
+    # Utiliser l'URL passée dans les settings en priorité, sinon chercher dans l'environnement
+    site_url = settings.get('site_url', '')
 
-    try:
-        font_title = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size_title)
-        font_text = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size_text)
-        font_text_bold = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size_text)
-    except:
-        font_title = ImageFont.load_default()
-        font_text = ImageFont.load_default()
-        font_text_bold = ImageFont.load_default()
+    res = get_thermal_resources(int(settings.get('thermal_width', 58)))
+    layout = ThermalLayout(res)
+    width_px = res.width_px
+    margin = res.margin
+    line_height = res.line_height
+    qr_size = res.qr_size
 
     y = margin + 5
 
     if company and company.get('logo') and os.path.exists(company['logo']):
         try:
-            logo_img = Image.open(company['logo'])
-            aspect = logo_img.width / logo_img.height
-            logo_w = int(logo_height * aspect)
-            if logo_w > width_px - 2 * margin:
-                logo_w = width_px - 2 * margin
-                logo_h = int(logo_w / aspect)
+            # Dithered variant built at upload time; older logos are resized on the fly
+            variant = logo_variant_path(company['logo'], f"thermal{res.thermal_width_mm}")
+            if os.path.exists(variant):
+                logo_img = Image.open(variant)
+                logo_img.load()
+                logo_w, logo_h = logo_img.size
             else:
-                logo_h = logo_height
-            logo_img = logo_img.resize((logo_w, logo_h), Image.LANCZOS)
-            if logo_img.mode != 'RGB':
-                logo_img = logo_img.convert('RGB')
+                logo_img = Image.open(company['logo'])
+                logo_w, logo_h = res.logo_size(logo_img.width, logo_img.height)
+                logo_img = logo_img.resize((logo_w, logo_h), Image.LANCZOS)
+                if logo_img.mode not in ('1', 'L', 'RGB'):
+                    logo_img = logo_img.convert('RGB')
             logo_x = (width_px - logo_w) // 2
-            img.paste(logo_img, (logo_x, y))
+            layout.image(logo_x, y, logo_img)
             y += logo_h + 10
         except Exception as e:
             pass
 
     company_name = company.get('name', '') if company else ''
     if company_name:
-        company_name_upper = company_name.upper()
-        text_bbox = draw.textbbox((0, 0), company_name_upper, font=font_title)
-        text_width = text_bbox[2] - text_bbox[0]
-        x = (width_px - text_width) // 2
-        draw.text((x, y), company_name_upper, fill='black', font=font_title)
+        layout.text_centered(y, company_name.upper(), 'title')
         y += line_height + 5
 
     if company and company.get('address'):
         address_lines = company['address'].split('\n')
         for addr_line in address_lines:
             if addr_line.strip():
-                text_bbox = draw.textbbox((0, 0), addr_line.strip(), font=font_text)
-                text_width = text_bbox[2] - text_bbox[0]
-                x = (width_px - text_width) // 2
-                draw.text((x, y), addr_line.strip(), fill='black', font=font_text)
+                layout.text_centered(y, addr_line.strip())
                 y += line_height
 
     if company and company.get('phone'):
-        phone_text = f"Tel: {company['phone']}"
-        text_bbox = draw.textbbox((0, 0), phone_text, font=font_text)
-        text_width = text_bbox[2] - text_bbox[0]
-        x = (width_px - text_width) // 2
-        draw.text((x, y), phone_text, fill='black', font=font_text)
+        layout.text_centered(y, f"Tel: {company['phone']}")
         y += line_height
 
     if company and company.get('tax_id'):
-        tax_text = f"ICE: {company['tax_id']}"
-        text_bbox = draw.textbbox((0, 0), tax_text, font=font_text)
-        text_width = text_bbox[2] - text_bbox[0]
-        x = (width_px - text_width) // 2
-        draw.text((x, y), tax_text, fill='black', font=font_text)
+        layout.text_centered(y, f"ICE: {company['tax_id']}")
         y += line_height
 
     y += 8
-    draw.line([(margin, y), (width_px - margin, y)], fill='black', width=2)
+    layout.line(y, 2)
     y += 12
 
-    receipt_text = f"RECU N: {receipt.get('receipt_number', '')}"
-    text_bbox = draw.textbbox((0, 0), receipt_text, font=font_title)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), receipt_text, fill='black', font=font_title)
+    layout.text_centered(y, f"RECU N: {receipt.get('receipt_number', '')}", 'title')
     y += line_height + 5
 
     created_at = receipt.get('created_at', '')
@@ -129,31 +242,23 @@ def _generate_thermal_receipt_task(receipt, client, company, settings):
             date_str = created_at[:16]
     else:
         date_str = ''
-    date_text = f"Date: {date_str}"
-    text_bbox = draw.textbbox((0, 0), date_text, font=font_text)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), date_text, fill='black', font=font_text)
+    layout.text_centered(y, f"Date: {date_str}")
     y += line_height
 
     y += 8
-    draw.line([(margin, y), (width_px - margin, y)], fill='black', width=1)
+    layout.line(y, 1)
     y += 12
 
     if client:
-        client_text = f"Client: {client.get('name', '')}"
-        text_bbox = draw.textbbox((0, 0), client_text, font=font_text_bold)
-        text_width = text_bbox[2] - text_bbox[0]
-        x = (width_px - text_width) // 2
-        draw.text((x, y), client_text, fill='black', font=font_text_bold)
+        layout.text_centered(y, f"Client: {client.get('name', '')}", 'text_bold')
         y += line_height
 
     y += 8
-    draw.line([(margin, y), (width_px - margin, y)], fill='black', width=1)
+    layout.line(y, 1)
     y += 12
 
     description = receipt.get('description', '')
-    max_chars = max(10, (width_px - 2 * margin) // (font_size_text // 2))
+    max_chars = res.max_chars
     desc_lines = []
     words = description.split(' ')
     current_line = ''
@@ -169,55 +274,33 @@ def _generate_thermal_receipt_task(receipt, client, company, settings):
         desc_lines.append(current_line)
 
     for desc_line in desc_lines[:4]:
-        text_bbox = draw.textbbox((0, 0), desc_line, font=font_text)
-        text_width = text_bbox[2] - text_bbox[0]
-        x = (width_px - text_width) // 2
-        draw.text((x, y), desc_line, fill='black', font=font_text)
+        layout.text_centered(y, desc_line)
         y += line_height
 
     y += 12
-    draw.line([(margin, y), (width_px - margin, y)], fill='black', width=3)
+    layout.line(y, 3)
     y += 15
 
-    amount_text = f"TOTAL: {receipt.get('amount', '0')} MAD"
-    text_bbox = draw.textbbox((0, 0), amount_text, font=font_title)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), amount_text, fill='black', font=font_title)
+    # Only the amount is measured; the "TOTAL: " prefix width comes from the registry
+    amount_value = f"{receipt.get('amount', '0')} MAD"
+    amount_width = res.measure(TOTAL_PREFIX, 'title') + res.measure(amount_value, 'title')
+    layout.text_centered(y, TOTAL_PREFIX + amount_value, 'title', text_width=amount_width)
     y += line_height + 5
 
-    payment_methods = {
-        'cash': 'Especes',
-        'card': 'Carte',
-        'transfer': 'Virement',
-        'check': 'Cheque'
-    }
-    payment_text = payment_methods.get(receipt.get('payment_method', ''), receipt.get('payment_method', ''))
-    pay_text = f"Paiement: {payment_text}"
-    text_bbox = draw.textbbox((0, 0), pay_text, font=font_text)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), pay_text, fill='black', font=font_text)
+    payment_text = PAYMENT_METHODS.get(receipt.get('payment_method', ''), receipt.get('payment_method', ''))
+    layout.text_centered(y, f"Paiement: {payment_text}")
     y += line_height
 
     y += 12
-    draw.line([(margin, y), (width_px - margin, y)], fill='black', width=1)
+    layout.line(y, 1)
     y += 15
 
-    thanks = "Merci pour votre confiance!"
-    text_bbox = draw.textbbox((0, 0), thanks, font=font_text)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), thanks, fill='black', font=font_text)
+    layout.text_centered(y, THANK_YOU_TEXT)
     y += line_height + 10
 
-    qr = qrcode.QRCode(version=1, box_size=3, border=1)
-    qr.add_data(site_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    qr_img = qr_img.resize((qr_size, qr_size))
+    qr_img = qr_image(site_url, box_size=3, size=qr_size)
     qr_x = (width_px - qr_size) // 2
-    img.paste(qr_img, (qr_x, y))
+    layout.image(qr_x, y, qr_img)
     y += qr_size + 8
 
     # Correction ICI : On extrait le domaine proprement depuis l'URL utilisée
@@ -229,29 +312,58 @@ def _generate_thermal_receipt_task(receipt, client, company, settings):
     except:
         domain = site_url
 
-    text_bbox = draw.textbbox((0, 0), domain, font=font_text)
-    text_width = text_bbox[2] - text_bbox[0]
-    x = (width_px - text_width) // 2
-    draw.text((x, y), domain, fill='black', font=font_text)
+    layout.text_centered(y, domain)
     y += line_height + 15
 
-    img = img.crop((0, 0, width_px, y))
+    return layout, y
+
+def _generate_thermal_receipt_task(receipt, client, company, settings, output_format='png', density=None):
+    layout, height = _layout_thermal_receipt(receipt, client, company, settings)
 
+    if output_format == 'escpos':
+        # Drawn straight onto a 1-bit canvas: no RGB decode/threshold hop in the print bridge
+        img = layout.paint('1', height)
+        if density is None:
+            density = settings.get('thermal_density', 0)
+        return escpos.encode_receipt(img, density=density)
+
+    img = layout.paint(PNG_MODE, height)
     buffer = BytesIO()
-    img.save(buffer, format='PNG')
+    img.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
     return buffer.getvalue()
 
-def generate_thermal_receipt(receipt, client, company, settings):
+def generate_thermal_receipt(receipt, client, company, settings, output_format='png', density=None):
     """
-    Wrapper to run image generation in a separate process to avoid blocking the main thread/process.
-    Uses a context manager to ensure safe process lifecycle and cleanup.
+    Wrapper to run image generation in the app-scoped render pool to avoid blocking the main thread/process.
+    `output_format` is 'png' (image) or 'escpos' (raw printer byte stream with cut command).
+    Raises RenderPoolBusy / RenderTimeout when the pool is saturated or the job is too slow.
     """
-    with ProcessPoolExecutor(max_workers=1) as executor:
-        # Submit the task to the process pool
-        future = executor.submit(_generate_thermal_receipt_task, receipt, client, company, settings)
-
-        # Wait for the result (this releases GIL if running in a thread)
-        image_bytes = future.result()
+    data = get_render_pool().run(
+        _generate_thermal_receipt_task, receipt, client, company, settings,
+        output_format=output_format, density=density
+    )
 
     # Wrap in BytesIO as expected by the caller
-    return BytesIO(image_bytes)
+    return BytesIO(data)
+
+def compose_thermal_roll(images):
+    """Stack rendered receipt PNGs into one roll image with a dashed cut mark between receipts."""
+    decoded = [Image.open(BytesIO(data)) for data in images]
+    width = max(img.width for img in decoded)
+    height = sum(img.height for img in decoded) + ROLL_CUT_GAP * (len(decoded) - 1)
+
+    roll = Image.new(PNG_MODE, (width, height), 'white')
+    draw = ImageDraw.Draw(roll)
+    y = 0
+    for index, img in enumerate(decoded):
+        if index:
+            cut_y = y + ROLL_CUT_GAP // 2
+            for x in range(0, width, 12):
+                draw.line([(x, cut_y), (x + 6, cut_y)], fill='black', width=1)
+            y += ROLL_CUT_GAP
+        roll.paste(img.convert(PNG_MODE), (0, y))
+        y += img.height
+
+    buffer = BytesIO()
+    roll.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
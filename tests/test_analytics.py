@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import uuid
+import tempfile
+from datetime import date, datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from init_db import db, init_database, Receipt as ReceiptModel
+from models import Receipt, User, Client
+from services.analytics import (report_range, utc_offsets, get_zone, revenue_series, revenue_report,
+                                breakdown_report, init_analytics_cache, get_analytics_cache, AnalyticsError)
+
+
+class TestReportRange(unittest.TestCase):
+    def test_default_ranges_end_with_the_current_bucket(self):
+        today = date(2026, 3, 18)  # a Wednesday
+        self.assertEqual(report_range('day', today=today), (date(2026, 2, 17), date(2026, 3, 19)))
+        self.assertEqual(report_range('week', today=today), (date(2025, 12, 29), date(2026, 3, 23)))
+        self.assertEqual(report_range('month', today=today), (date(2025, 4, 1), date(2026, 4, 1)))
+
+    def test_invalid_requests(self):
+        with self.assertRaises(AnalyticsError):
+            report_range('year')
+        with self.assertRaises(AnalyticsError):
+            report_range('day', start='2026-02-30')
+        with self.assertRaises(AnalyticsError):
+            report_range('day', start='2026-03-02', end='2026-03-01')
+
+    def test_offsets_follow_daylight_saving_changes(self):
+        segments = utc_offsets(get_zone('Europe/Paris'), datetime(2026, 3, 1), datetime(2026, 4, 1))
+        self.assertEqual(segments, [(datetime(2026, 3, 1), 60), (datetime(2026, 3, 29, 1, 0), 120)])
+
+
+class TestRevenueQueries(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'analytics.db')}"
+        init_database(self.app)
+        init_analytics_cache(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def add(self, created_at, amount, payment_method='cash', client_id=None):
+        db.session.add(ReceiptModel(id=str(uuid.uuid4()), user_id=self.user_id, receipt_number=str(uuid.uuid4())[:8],
+                                    description='x', amount=amount, payment_method=payment_method,
+                                    client_id=client_id, created_at=created_at))
+        db.session.commit()
+
+    def test_buckets_use_the_local_day(self):
+        zone = get_zone('Europe/Paris')
+        self.add(datetime(2026, 3, 9, 22, 30), 10)   # 23:30 in Paris, Monday 9th
+        self.add(datetime(2026, 3, 9, 23, 30), 20)   # 00:30 in Paris, Tuesday 10th
+        self.add(datetime(2026, 3, 29, 22, 30), 5)   # 00:30 in Paris after the DST change, 30th
+
+        days = {row['bucket']: row['total'] for row in revenue_series(
+            self.user_id, 'day', date(2026, 3, 1), date(2026, 4, 1), zone) if row['count']}
+        self.assertEqual(days, {'2026-03-09': 10, '2026-03-10': 20, '2026-03-30': 5})
+
+        weeks = revenue_series(self.user_id, 'week', date(2026, 3, 9), date(2026, 4, 6), zone)
+        self.assertEqual([row['total'] for row in weeks], [30, 0, 0, 5])
+
+        months = revenue_series(self.user_id, 'month', date(2026, 2, 1), date(2026, 4, 1), zone)
+        self.assertEqual(months, [{'bucket': '2026-02-01', 'count': 0, 'total': 0},
+                                  {'bucket': '2026-03-01', 'count': 3, 'total': 35}])
+
+    def test_reports_are_cached_until_the_next_write(self):
+        settings = {'timezone': 'UTC'}
+        client = Client.create(self.user_id, 'Ali')
+        Receipt.create(self.user_id, client['id'], 'a', '12', 'card')
+
+        first = revenue_report(self.user_id, settings, 'month')
+        self.assertEqual(revenue_report(self.user_id, settings, 'month'), first)
+        self.assertEqual(get_analytics_cache().hits, 1)
+
+        Receipt.create(self.user_id, client['id'], 'b', '3', 'cash')
+        self.assertEqual(revenue_report(self.user_id, settings, 'month')['total'], 15)
+        rows = breakdown_report(self.user_id, settings, 'client', locale='en')['rows']
+        self.assertEqual(rows, [{'key': client['id'], 'label': 'Ali', 'count': 2, 'total': 15}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from init_db import db, init_database, migrate_database
+from models import User, Client
+from utils.phone import phone_digits
+
+
+class TestPhoneDigits(unittest.TestCase):
+    def test_formats_of_one_number_are_equal(self):
+        for value in ('+212 6 12 34 56 78', '00212612345678', '06-12-34-56-78', '612345678'):
+            self.assertEqual(phone_digits(value), '612345678', value)
+        self.assertEqual(phone_digits('06 12'), '612')
+        self.assertEqual(phone_digits(''), '')
+
+
+class TestClientLookup(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'clients.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def names(self, query, **kwargs):
+        return [client['name'] for client in Client.lookup(self.user_id, query, **kwargs)]
+
+    def test_name_prefix_before_later_words(self):
+        for name in ('Ali Benani', 'Alia Tazi', 'Karim Ali', 'Bob'):
+            Client.create(self.user_id, name)
+        self.assertEqual(self.names('ali'), ['Ali Benani', 'Alia Tazi', 'Karim Ali'])
+        self.assertEqual(self.names('  ALI   b'), ['Ali Benani'])
+        self.assertEqual(self.names('ali', limit=1), ['Ali Benani'])
+        self.assertEqual(self.names('%'), [])
+        self.assertEqual(Client.lookup(User.create('other', 'secret')['id'], 'ali'), [])
+
+    def test_phone_in_any_format(self):
+        Client.create(self.user_id, 'Sara', whatsapp='+212 612-345678')
+        self.assertEqual(self.names('0612 34'), ['Sara'])
+        self.assertEqual(self.names('612345678'), ['Sara'])
+        self.assertEqual(self.names('0699'), [])
+
+        client = Client.lookup(self.user_id, 'sara')[0]
+        Client.update(client['id'], user_id=self.user_id, whatsapp='0699 11 22 33')
+        self.assertEqual(self.names('0699'), ['Sara'])
+
+    def test_existing_clients_are_normalized_by_the_migration(self):
+        Client.create(self.user_id, 'Sara', whatsapp='06 12 34 56 78')
+        db.session.execute(text("UPDATE clients SET whatsapp_digits = NULL"))
+        db.session.commit()
+        migrate_database(self.app)
+        self.assertEqual(self.names('0612'), ['Sara'])
+
+
+if __name__ == '__main__':
+    unittest.main()
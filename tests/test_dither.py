@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from services import dither
+
+
+def scalar_floyd_steinberg(grey):
+    """Reference pixel-by-pixel implementation."""
+    grey = [list(row) for row in grey]
+    height, width = len(grey), len(grey[0])
+    out = [[False] * width for _ in range(height)]
+    for y in range(height):
+        for x in range(width):
+            white = grey[y][x] >= 128
+            err = grey[y][x] - (255.0 if white else 0.0)
+            out[y][x] = white
+            if x + 1 < width:
+                grey[y][x + 1] += err * 7 / 16
+            if y + 1 < height:
+                if x > 0:
+                    grey[y + 1][x - 1] += err * 3 / 16
+                grey[y + 1][x] += err * 5 / 16
+                if x + 1 < width:
+                    grey[y + 1][x + 1] += err * 1 / 16
+    return out
+
+
+class TestDefaultDither(unittest.TestCase):
+    def test_default_is_pillow_floyd_steinberg(self):
+        img = Image.radial_gradient('L').resize((40, 30))
+        self.assertEqual(dither.DITHER_METHOD, 'pillow')
+        self.assertEqual(dither.dither(img).tobytes(), img.convert('1').tobytes())
+
+
+@unittest.skipIf(dither.np is None, "numpy is not installed")
+class TestDither(unittest.TestCase):
+    def test_wavefront_matches_scalar_reference(self):
+        np = dither.np
+        rng = np.random.default_rng(7)
+        for shape in [(1, 9), (9, 1), (13, 29), (30, 11)]:
+            grey = rng.integers(0, 256, shape).astype(np.float32)
+            expected = np.array(scalar_floyd_steinberg(grey.tolist()))
+            self.assertTrue((dither.floyd_steinberg(grey) == expected).all(), shape)
+
+    def test_methods_preserve_mean_tone(self):
+        img = Image.linear_gradient('L').resize((64, 64))
+        for method in dither.DITHER_METHODS:
+            out = dither.dither(img, method)
+            self.assertEqual(out.mode, '1')
+            self.assertEqual(out.size, img.size)
+            white = out.histogram()[255] / (64 * 64)
+            self.assertAlmostEqual(white, 0.5, delta=0.02)
+
+    def test_bilevel_images_are_left_untouched(self):
+        img = Image.new('1', (5, 5), 1)
+        self.assertIs(dither.dither(img), img)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from services import escpos
+
+
+class TestEscpos(unittest.TestCase):
+    def test_raster_header_and_bits(self):
+        # 10px wide -> 2 bytes per row, padding bits must stay white (0)
+        img = Image.new('1', (10, 2), 1)
+        img.putpixel((0, 0), 0)
+        img.putpixel((9, 1), 0)
+
+        data = escpos.raster_commands(img)
+        self.assertEqual(data[:8], b'\x1dv0\x00\x02\x00\x02\x00')
+        self.assertEqual(data[8:], bytes([0b10000000, 0, 0, 0b01000000]))
+
+    def test_tall_images_are_split_in_bands(self):
+        img = Image.new('1', (8, escpos.RASTER_BAND_HEIGHT + 10), 1)
+        data = escpos.raster_commands(img)
+        self.assertEqual(data.count(b'\x1dv0'), 2)
+
+    def test_encode_receipt_density_and_cut(self):
+        img = Image.new('1', (8, 1), 1)
+        stream = escpos.encode_receipt(img, density=-2)
+        self.assertTrue(stream.startswith(escpos.INIT + b'\x1d(K\x02\x001\xfe'))
+        self.assertTrue(stream.endswith(escpos.cut_command()))
+
+        default = escpos.encode_receipt(img, density=0, cut=False)
+        self.assertEqual(default, escpos.INIT + escpos.raster_commands(img))
+
+    def test_clamp_density(self):
+        self.assertEqual(escpos.clamp_density('42'), escpos.MAX_DENSITY)
+        self.assertEqual(escpos.clamp_density(-20), escpos.MIN_DENSITY)
+        self.assertEqual(escpos.clamp_density('abc'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
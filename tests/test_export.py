@@ -0,0 +1,43 @@
+import unittest
+import os
+import sys
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.export import month_range, archive_entry_name
+from utils.zipstream import stream_zip
+
+
+class TestExport(unittest.TestCase):
+    def test_month_range_wraps_december(self):
+        self.assertEqual(month_range(2025, 12), (datetime(2025, 12, 1), datetime(2026, 1, 1)))
+        self.assertEqual(month_range(2025, 2), (datetime(2025, 2, 1), datetime(2025, 3, 1)))
+
+    def test_entry_names_stay_inside_their_month_folder(self):
+        self.assertEqual(archive_entry_name(2025, 3, {'receipt_number': 'REC/../2025 03'}), '2025-03/REC_.._2025_03.pdf')
+        self.assertEqual(archive_entry_name(2025, 3, {'receipt_number': '', 'id': 'abc'}), '2025-03/abc.pdf')
+
+    def test_sanitised_duplicates_get_distinct_names(self):
+        taken = set()
+        names = [archive_entry_name(2025, 3, receipt, taken) for receipt in (
+            {'receipt_number': 'A/1', 'id': 'r1'},
+            {'receipt_number': 'A 1', 'id': 'r2'},
+            {'receipt_number': 'A_1', 'id': 'r3'},
+            {'receipt_number': 'A_1_r3', 'id': 'r4'},
+            {'receipt_number': 'A_1', 'id': 'r3'},
+        )]
+        self.assertEqual(names, ['2025-03/A_1.pdf', '2025-03/A_1_r2.pdf', '2025-03/A_1_r3.pdf',
+                                 '2025-03/A_1_r3_r4.pdf', '2025-03/A_1_r3_2.pdf'])
+
+    def test_zip_entries_can_be_file_objects(self):
+        index = BytesIO(b'a,b\r\n' * 50000)
+        archive = zipfile.ZipFile(BytesIO(b''.join(stream_zip([('r.pdf', b'%PDF'), ('index.csv', index)]))))
+        self.assertEqual(archive.read('r.pdf'), b'%PDF')
+        self.assertEqual(archive.read('index.csv'), b'a,b\r\n' * 50000)
+
+
+if __name__ == '__main__':
+    unittest.main()
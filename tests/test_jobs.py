@@ -0,0 +1,139 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+from datetime import datetime, timedelta
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from init_db import db, init_database, DocumentJob as DocumentJobModel
+from models import DocumentJob, User, Client, Receipt
+from services.jobs import prepare_job_params, init_job_runner, JobError, JOB_HANDLERS
+from services.render_cache import RenderCache
+from services.render_pool import RenderPool
+
+
+class TestJobParams(unittest.TestCase):
+    def test_rejects_unknown_kind_and_empty_selection(self):
+        with self.assertRaises(JobError):
+            prepare_job_params('bogus', {}, {}, 'fr')
+        with self.assertRaises(JobError):
+            prepare_job_params('pdf', {}, {}, 'fr')
+        with self.assertRaises(JobError):
+            prepare_job_params('pdf', {'start': '2026-13-01'}, {}, 'fr')
+
+    def test_thermal_defaults(self):
+        params = prepare_job_params('thermal_batch', {'ids': 'a, b', 'format': 'gif'}, {'thermal_density': 20}, 'fr')
+        self.assertEqual(params['ids'], ['a', 'b'])
+        self.assertEqual(params['format'], 'png')
+        self.assertEqual(params['output'], 'zip')
+        self.assertEqual(params['density'], 8)
+
+
+class TestJobTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'jobs.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('jobs-user', 'secret')['id']
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def test_claim_is_exclusive_and_oldest_first(self):
+        first = DocumentJob.create(self.user_id, 'export', {})
+        second = DocumentJob.create(self.user_id, 'export', {})
+        self.assertEqual(DocumentJob.claim_next('w1')['id'], first['id'])
+        self.assertEqual(DocumentJob.claim_next('w2')['id'], second['id'])
+        self.assertIsNone(DocumentJob.claim_next('w3'))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = DocumentJob.create(self.user_id, 'export', {})
+        for attempt in range(2):
+            DocumentJob.claim_next('dead-worker')
+            DocumentJobModel.query.filter_by(id=job['id']).update({'updated_at': datetime.utcnow() - timedelta(hours=1)})
+            db.session.commit()
+            DocumentJob.requeue_stale(datetime.utcnow() - timedelta(minutes=10), max_attempts=2)
+        # First stale run went back to the queue, the second exhausted the attempts
+        self.assertEqual(DocumentJob.get_by_id(job['id'])['status'], 'failed')
+
+    def test_expired_jobs_are_removed(self):
+        job = DocumentJob.create(self.user_id, 'export', {})
+        DocumentJob.update(job['id'], status='done', expires_at=datetime.utcnow() - timedelta(seconds=1))
+        self.assertEqual([j['id'] for j in DocumentJob.pop_expired(datetime.utcnow())], [job['id']])
+        self.assertIsNone(DocumentJob.get_by_id(job['id']))
+
+    def test_statement_is_streamed_without_the_pool(self):
+        client = Client.create(self.user_id, 'Ali')
+        for amount in ('10', '20.5'):
+            Receipt.create(self.user_id, client['id'], 'x', amount, 'cash')
+        params = prepare_job_params('statement', {'client_id': client['id']}, {}, 'fr')
+        output, reports = BytesIO(), []
+
+        name, mimetype = JOB_HANDLERS['statement']({'user_id': self.user_id}, params, output,
+                                                   lambda done, total: reports.append((done, total)), pool=None)
+        self.assertEqual(mimetype, 'application/pdf')
+        self.assertTrue(output.getvalue().startswith(b'%PDF'))
+        self.assertEqual(reports, [(0, 2), (1, 2), (2, 2)])
+
+    def run_job(self, kind, data, pool=None):
+        params = prepare_job_params(kind, data, {'site_url': 'https://example.com'}, 'fr')
+        output, reports = BytesIO(), []
+        result = JOB_HANDLERS[kind]({'user_id': self.user_id}, params, output,
+                                    lambda done, total: reports.append((done, total)), pool=pool)
+        return result, output.getvalue(), reports
+
+    def test_export_reads_receipts_in_chunks(self):
+        for amount in range(5):
+            Receipt.create(self.user_id, None, f'r{amount}', str(amount), 'cash')
+        chunks = list(Receipt.iter_many(self.user_id, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        streamed = [r['id'] for chunk in chunks for r in chunk]
+        self.assertEqual(sorted(streamed), sorted(r['id'] for r in Receipt.get_many(self.user_id)))
+        self.assertEqual(len(set(streamed)), 5)
+
+        (name, mimetype), data, reports = self.run_job('export', {})
+        self.assertEqual(mimetype, 'text/csv')
+        self.assertEqual(len(data.decode('utf-8-sig').splitlines()), 6)
+        self.assertEqual((reports[0], reports[-1]), ((0, 5), (5, 5)))
+        with self.assertRaises(JobError):
+            self.run_job('export', {'start': '2000-01-01', 'end': '2000-01-31'})
+
+    def test_single_pdf_job_beats_before_and_after_rendering(self):
+        receipt = Receipt.create(self.user_id, None, 'x', '10', 'cash')
+        self.app.extensions['render_cache'] = RenderCache(os.path.join(self.tmp.name, 'cache'), 1024 * 1024)
+        pool = RenderPool(max_workers=1, timeout=30)
+        try:
+            (name, mimetype), data, reports = self.run_job('pdf', {'ids': receipt['id']}, pool=pool)
+        finally:
+            pool.shutdown()
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertEqual(reports[0], (0, 1))
+        self.assertEqual(reports[-1], (1, 1))
+
+
+class TestJobRunnerSetup(unittest.TestCase):
+    def runner(self, directory, **env):
+        environ = {key: value for key, value in os.environ.items() if key != 'JOBS_ENABLED'}
+        environ.update(env, JOB_RESULTS_DIR=directory)
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return init_job_runner(Flask(__name__))
+
+    def test_web_workers_do_not_dispatch_by_default(self):
+        with tempfile.TemporaryDirectory() as directory:
+            runner = self.runner(directory)
+            self.assertFalse(runner.enabled)
+            runner.ensure_started()
+            self.assertIsNone(runner._thread)
+            self.assertTrue(self.runner(directory, JOBS_ENABLED='1').enabled)
+
+if __name__ == '__main__':
+    unittest.main()
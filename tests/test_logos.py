@@ -0,0 +1,107 @@
+import unittest
+import os
+import sys
+import hashlib
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from services.logos import build_logo_variants, flatten, logo_variant, thermal_variant, PDF_LOGO_BOX, THUMBNAIL_BOX
+from services.thermal import SUPPORTED_WIDTHS, get_thermal_resources
+from utils import files
+
+
+def png_bytes(img):
+    buffer = BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TestLogoVariants(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.logo_path = os.path.join(self.tmp.name, 'logo_test.png')
+        # Transparent logo with an opaque dark square in the middle
+        logo = Image.new('RGBA', (400, 200), (0, 0, 0, 0))
+        logo.paste((20, 20, 20, 255), (150, 50, 250, 150))
+        logo.save(self.logo_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_flatten_puts_transparency_on_white(self):
+        flat = flatten(Image.open(self.logo_path))
+        self.assertEqual(flat.mode, 'RGB')
+        self.assertEqual(flat.getpixel((0, 0)), (255, 255, 255))
+        self.assertEqual(flat.getpixel((200, 100)), (20, 20, 20))
+        self.assertEqual(flatten(Image.new('L', (2, 2))).mode, 'RGB')
+
+    def test_variant_sizes_and_modes(self):
+        paths = build_logo_variants(self.logo_path)
+        self.assertEqual(set(paths), {'pdf', 'thumb'} | {thermal_variant(width) for width in SUPPORTED_WIDTHS})
+
+        for width in SUPPORTED_WIDTHS:
+            with Image.open(paths[thermal_variant(width)]) as variant:
+                self.assertEqual(variant.mode, '1')
+                self.assertEqual(variant.size, get_thermal_resources(width).logo_size(400, 200))
+                # Transparent corners come out white, not black
+                self.assertEqual(variant.getpixel((0, 0)), 255)
+        with Image.open(paths['pdf']) as pdf:
+            self.assertEqual(pdf.mode, 'RGB')
+            self.assertLessEqual(pdf.width, PDF_LOGO_BOX[0])
+            self.assertEqual(pdf.getpixel((0, 0)), (255, 255, 255))
+        with Image.open(paths['thumb']) as thumb:
+            self.assertEqual(thumb.size, (THUMBNAIL_BOX[0], THUMBNAIL_BOX[0] // 2))
+
+    def test_existing_variants_are_kept_unless_forced(self):
+        path = build_logo_variants(self.logo_path)['thumb']
+        os.utime(path, (0, 0))
+        build_logo_variants(self.logo_path)
+        self.assertEqual(os.stat(path).st_mtime, 0)
+        build_logo_variants(self.logo_path, force=True)
+        self.assertNotEqual(os.stat(path).st_mtime, 0)
+
+    def test_legacy_logo_without_variants_falls_back_to_the_original(self):
+        self.assertEqual(logo_variant(self.logo_path, 'thermal58'), self.logo_path)
+        self.assertEqual(logo_variant('', 'pdf'), '')
+        build_logo_variants(self.logo_path)
+        self.assertEqual(logo_variant(self.logo_path, 'thermal58'), files.logo_variant_path(self.logo_path, 'thermal58'))
+
+
+class TestSaveLogo(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(files, 'UPLOAD_DIR', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data = png_bytes(Image.new('RGB', (120, 60), 'navy'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def upload(self, data, filename='logo.png'):
+        return files.save_logo(FileStorage(BytesIO(data), filename=filename))
+
+    def test_reupload_is_deduplicated_by_content_hash(self):
+        path = self.upload(self.data)
+        self.assertEqual(os.path.basename(path), f"logo_{hashlib.sha256(self.data).hexdigest()[:16]}.png")
+        self.assertTrue(os.path.exists(files.logo_variant_path(path, 'thermal80')))
+        stored = sorted(os.listdir(self.tmp.name))
+
+        self.assertEqual(self.upload(self.data, filename='same.jpg'), path)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), stored)
+
+        other = self.upload(png_bytes(Image.new('RGB', (120, 60), 'red')))
+        self.assertNotEqual(other, path)
+
+    def test_rejects_other_files(self):
+        self.assertIsNone(self.upload(b'not an image'))
+        self.assertIsNone(self.upload(self.data, filename='logo.svg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
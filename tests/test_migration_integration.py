@@ -4,6 +4,7 @@ import sqlite3
 from flask import Flask
 from init_db import init_database, db
 from sqlalchemy import text, inspect
+from sqlalchemy.exc import IntegrityError
 
 class TestMigrationIntegration(unittest.TestCase):
     def setUp(self):
@@ -68,5 +69,48 @@ class TestMigrationIntegration(unittest.TestCase):
             # SQLite stores boolean as 1/0
             self.assertTrue(is_active in [1, True], f"Default value for is_active not applied: {is_active}")
 
+class TestReceiptNumberConstraintMigration(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'test_receipt_number_migration.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        # Receipts table of older versions: receipt_number unique across all users
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE users (id VARCHAR(36) PRIMARY KEY, username VARCHAR(100), password_hash VARCHAR(255))")
+        conn.execute(
+            "CREATE TABLE receipts (id VARCHAR(36) PRIMARY KEY, user_id VARCHAR(36) NOT NULL REFERENCES users(id), "
+            "receipt_number VARCHAR(50) NOT NULL UNIQUE, client_id VARCHAR(36), company_id VARCHAR(36), "
+            "description TEXT NOT NULL, amount NUMERIC(10, 2) NOT NULL, payment_method VARCHAR(50) NOT NULL, created_at TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO users (id, username) VALUES ('user1', 'one'), ('user2', 'two')")
+        conn.execute("INSERT INTO receipts VALUES ('r1', 'user1', 'REC-0001', NULL, NULL, 'Vidange', 150.5, 'cash', '2026-01-02 10:00:00')")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def test_constraint_is_dropped_and_rows_kept(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(self.db_path)}'
+        init_database(app)
+
+        with app.app_context():
+            row = db.session.execute(text("SELECT user_id, receipt_number, amount FROM receipts WHERE id = 'r1'")).one()
+            self.assertEqual(tuple(row), ('user1', 'REC-0001', 150.5))
+            self.assertIn('uq_receipts_user_number', [i['name'] for i in inspect(db.engine).get_indexes('receipts')])
+
+            # Another user may now have the same number, the same user still may not
+            db.session.execute(text("INSERT INTO receipts (id, user_id, receipt_number, description, amount, payment_method) "
+                                    "VALUES ('r2', 'user2', 'REC-0001', 'x', 1, 'cash')"))
+            db.session.commit()
+            with self.assertRaises(IntegrityError):
+                db.session.execute(text("INSERT INTO receipts (id, user_id, receipt_number, description, amount, payment_method) "
+                                        "VALUES ('r3', 'user1', 'REC-0001', 'x', 1, 'cash')"))
+            db.session.rollback()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from init_db import db, init_database, Receipt as ReceiptModel
+from models import Receipt, User
+from services.numbering import format_receipt_number, number_pattern, effective_reset, period_bounds
+
+
+class TestNumberFormat(unittest.TestCase):
+    def test_matches_template_tokens(self):
+        now = datetime(2026, 3, 7)
+        self.assertEqual(format_receipt_number('REC-{YYYY}{MM}{DD}-{N}', 42, now), 'REC-20260307-0042')
+        self.assertEqual(format_receipt_number('{N}/{YYYY} {x}', 12345, now), '12345/2026 {x}')
+        self.assertEqual(format_receipt_number('', 1, now), 'REC-20260307-0001')
+
+    def test_reset_needs_the_period_in_the_template(self):
+        self.assertEqual(effective_reset('F-{YYYY}{MM}-{N}', 'monthly'), 'monthly')
+        self.assertEqual(effective_reset('F-{YYYY}-{N}', 'daily'), 'never')
+        self.assertEqual(effective_reset('F-{N}', 'bogus'), 'never')
+        self.assertEqual(period_bounds('monthly', datetime(2026, 12, 31))[1:], (datetime(2026, 12, 1), datetime(2027, 1, 1)))
+
+    def test_pattern_reads_the_counter_back(self):
+        pattern, prefix = number_pattern('REC-{YYYY}{MM}{DD}-{N}')
+        self.assertEqual(prefix, 'REC-')
+        self.assertEqual(pattern.match('REC-20250101-0042').group(1), '0042')
+        self.assertIsNone(pattern.match('REC-2025-0042'))
+        self.assertEqual(number_pattern('{N}.x')[0].match('12345.x').group(1), '12345')
+
+
+class TestReceiptSequence(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'numbers.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def create(self, user_id, **kwargs):
+        return Receipt.create(user_id, None, 'x', '1', 'cash', **kwargs)['receipt_number']
+
+    def test_numbers_are_sequential_per_user(self):
+        alice = User.create('alice', 'secret')['id']
+        bob = User.create('bob', 'secret')['id']
+        self.assertEqual([self.create(alice, receipt_number_format='A-{N}') for _ in range(3)], ['A-0001', 'A-0002', 'A-0003'])
+        # Same format for another tenant no longer collides
+        self.assertEqual(self.create(bob, receipt_number_format='A-{N}'), 'A-0001')
+
+    def test_counter_resets_with_its_period(self):
+        alice = User.create('alice', 'secret')['id']
+        self.create(alice, receipt_number_format='A-{N}')
+        today = datetime.utcnow().strftime('%Y%m%d')
+        number = self.create(alice, receipt_number_format='D-{YYYY}{MM}{DD}-{N}', receipt_number_reset='daily')
+        # Seeded from today's receipts, then counted independently of the global counter
+        self.assertEqual(number, f'D-{today}-0002')
+        self.assertEqual(self.create(alice, receipt_number_format='A-{N}'), 'A-0002')
+
+    def test_seed_continues_after_the_highest_existing_number(self):
+        alice = User.create('alice', 'secret')['id']
+        # Receipts from before sequences existed; deleting one leaves the count below the highest number
+        for n in (1, 2, 3):
+            db.session.add(ReceiptModel(id=str(uuid.uuid4()), user_id=alice, receipt_number=f'A-{n:04d}',
+                                        description='x', amount=1, payment_method='cash'))
+        db.session.commit()
+        first = ReceiptModel.query.filter_by(receipt_number='A-0001').one()
+        Receipt.delete(first.id, user_id=alice)
+        self.assertEqual(self.create(alice, receipt_number_format='A-{N}'), 'A-0004')
+
+    def test_number_date_follows_the_stored_created_at(self):
+        alice = User.create('alice', 'secret')['id']
+        receipt = Receipt.create(alice, None, 'x', '1', 'cash', receipt_number_format='D-{YYYY}{MM}{DD}-{N}',
+                                 receipt_number_reset='daily')
+        created_at = datetime.fromisoformat(receipt['created_at'])
+        self.assertEqual(receipt['receipt_number'], f"D-{created_at:%Y%m%d}-0001")
+
+
+if __name__ == '__main__':
+    unittest.main()
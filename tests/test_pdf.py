@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import pdf
+
+RECEIPT = {
+    'receipt_number': 'REC-20260101-0001',
+    'created_at': '2026-01-01T10:30:00',
+    'description': 'Reparation',
+    'amount': '150.00',
+    'payment_method': 'cash'
+}
+CLIENT = {'name': 'Client', 'email': 'client@example.com'}
+COMPANY = {'name': 'Entreprise', 'address': '12 Rue Exemple\nCasablanca', 'phone': '0522000000'}
+
+
+class TestCanvasPdf(unittest.TestCase):
+    def setUp(self):
+        self.labels = pdf.get_pdf_labels('fr')
+
+    def test_one_page_receipt_uses_canvas(self):
+        settings = {'site_url': 'https://example.com', 'pdf_renderer': 'canvas'}
+        layout = pdf._layout_canvas_receipt(RECEIPT, CLIENT, COMPANY, settings, self.labels)
+        self.assertTrue(layout.fits())
+
+        data = pdf.generate_receipt_pdf(RECEIPT, CLIENT, COMPANY, settings, locale='fr').getvalue()
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertEqual(data.count(b'/Type /Page\n'), 1)
+
+    def test_overflowing_receipt_falls_back_to_platypus(self):
+        receipt = dict(RECEIPT, description='Ligne de description assez longue ' * 80)
+        settings = {'site_url': 'https://example.com', 'pdf_renderer': 'canvas'}
+        layout = pdf._layout_canvas_receipt(receipt, CLIENT, COMPANY, settings, self.labels)
+        self.assertFalse(layout.fits())
+
+        data = pdf.generate_receipt_pdf(receipt, CLIENT, COMPANY, settings, locale='fr').getvalue()
+        self.assertTrue(data.startswith(b'%PDF'))
+
+    def test_footer_cache_is_bounded_across_hosts(self):
+        for n in range(pdf.FOOTER_CACHE_SIZE * 2):
+            pdf.get_pdf_footer(self.labels, f'https://host{n}.example')
+        self.assertEqual(pdf._footer.cache_info().currsize, pdf.FOOTER_CACHE_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from init_db import db, init_database
+from models import User, Client, Company, Receipt
+from routes import register_routes
+from services.prerender import PrerenderQueue, init_prerender_queue, enqueue_prerender
+from services.render_cache import RenderCache
+from services.render_pool import RenderPool
+
+
+class TestPrerenderQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'prerender.db')}"
+        init_database(self.app)
+        self.pool = RenderPool(max_workers=1, max_pending=0, timeout=30)
+        self.cache = RenderCache(os.path.join(self.tmp.name, 'cache'), 10 * 1024 * 1024)
+        self.app.extensions['render_pool'] = self.pool
+        self.app.extensions['render_cache'] = self.cache
+        register_routes(self.app)
+
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+        self.client_id = Client.create(self.user_id, 'Ali')['id']
+        self.company_id = Company.create(self.user_id, 'Garage')['id']
+        self.http = self.app.test_client()
+        with self.http.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+
+    def tearDown(self):
+        self.pool.shutdown()
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def cached_files(self):
+        return sorted(name for _, _, files in os.walk(self.cache.directory) for name in files)
+
+    def add_receipt(self):
+        response = self.http.post('/receipts/add', data={
+            'client_id': self.client_id, 'company_id': self.company_id,
+            'description': 'Vidange', 'amount': '150', 'payment_method': 'cash'
+        })
+        self.assertEqual(response.status_code, 302)
+        return Receipt.get_sorted(self.user_id)[0]
+
+    def drain(self, prerender):
+        prerender._queue.join()
+
+    def test_new_receipt_is_prerendered_with_the_download_keys(self):
+        prerender = init_prerender_queue(self.app)
+        receipt = self.add_receipt()
+        self.drain(prerender)
+
+        stats = prerender.stats()
+        self.assertEqual((stats['enqueued'], stats['rendered'], stats['failed'], stats['depth']), (1, 1, 0, 0))
+        self.assertIsNotNone(stats['last_duration'])
+        files = self.cached_files()
+        self.assertEqual(len(files), 2)
+
+        # The downloads hit the pre-rendered entries instead of adding new ones
+        for url in (f"/receipts/pdf/{receipt['id']}", f"/receipts/thermal/{receipt['id']}"):
+            response = self.http.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            response.close()
+        self.assertEqual(self.cached_files(), files)
+
+    def test_busy_pool_skips_the_thermal_ticket(self):
+        prerender = init_prerender_queue(self.app)
+        blocker = self.pool.submit(time.sleep, 1)
+        self.add_receipt()
+        self.drain(prerender)
+        blocker.result()
+        stats = prerender.stats()
+        self.assertEqual((stats['rendered'], stats['skipped']), (0, 1))
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_full_queue_drops_jobs(self):
+        prerender = PrerenderQueue(self.app, maxsize=1)
+        # No worker: the queue keeps what it is given
+        with mock.patch.object(prerender, '_ensure_worker'):
+            self.assertTrue(prerender.enqueue('r1', self.user_id, {}, 'fr'))
+            self.assertFalse(prerender.enqueue('r2', self.user_id, {}, 'fr'))
+        stats = prerender.stats()
+        self.assertEqual((stats['enqueued'], stats['dropped'], stats['depth']), (1, 1, 1))
+        self.assertGreaterEqual(stats['oldest_age'], 0)
+
+    def test_disabled_by_environment(self):
+        with mock.patch.dict(os.environ, {'PRERENDER_ENABLED': '0'}):
+            prerender = init_prerender_queue(self.app)
+        self.assertFalse(prerender.enabled)
+        receipt = self.add_receipt()
+        with self.app.test_request_context():
+            self.assertFalse(enqueue_prerender(receipt))
+        self.assertEqual(prerender.stats()['enqueued'], 0)
+        self.assertIsNone(prerender._thread)
+        self.assertEqual(self.cached_files(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
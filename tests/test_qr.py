@@ -0,0 +1,20 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import qr
+
+
+class TestQr(unittest.TestCase):
+    def test_shared_payload_is_rendered_once(self):
+        first = qr.qr_image('https://example.com/qr-test', box_size=3, size=100)
+        second = qr.qr_image('https://example.com/qr-test', box_size=3, size=100)
+        self.assertIs(first, second)
+        self.assertEqual(first.size, (100, 100))
+        self.assertTrue(qr.qr_png('https://example.com/qr-test').startswith(b'\x89PNG'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import unittest
+import os
+import sys
+import uuid
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html import unescape
+from urllib.parse import urlsplit, parse_qs
+
+from flask import Flask, render_template
+from init_db import db, init_database, Receipt as ReceiptModel
+from models import Receipt, User, Client, Company, UserStats
+from routes import register_routes
+from routes.receipts import parse_receipt_filters, encode_cursor
+from services.render_cache import RenderCache
+from services.render_pool import RenderPool
+from utils.i18n import t
+
+
+class ReceiptQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'receipts.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def add_receipts(self, count, **fields):
+        start = datetime(2026, 1, 1)
+        for i in range(count):
+            # Three receipts per timestamp by default so the id tiebreaker matters
+            values = dict(description='x', amount=10, payment_method='cash', client_id=None, company_id=None,
+                          created_at=start + timedelta(minutes=i // 3))
+            values.update({key: value(i) if callable(value) else value for key, value in fields.items()})
+            db.session.add(ReceiptModel(
+                id=str(uuid.uuid4()), user_id=self.user_id, receipt_number=f'R-{i:04d}', **values
+            ))
+        db.session.commit()
+
+
+class TestReceiptPages(ReceiptQueryTestCase):
+    def test_pages_cover_every_receipt_once_newest_first(self):
+        self.add_receipts(25)
+        seen, cursor = [], None
+        while True:
+            page, cursor = Receipt.get_page(self.user_id, cursor=cursor, limit=10)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len({r['id'] for r in seen}), 25)
+        self.assertEqual([r['created_at'] for r in seen], sorted((r['created_at'] for r in seen), reverse=True))
+
+    def test_last_full_page_has_no_cursor(self):
+        self.add_receipts(10)
+        page, cursor = Receipt.get_page(self.user_id, limit=10)
+        self.assertEqual(len(page), 10)
+        self.assertIsNone(cursor)
+
+
+class TestReceiptBundles(ReceiptQueryTestCase):
+    def test_bundle_matches_separate_lookups(self):
+        client = Client.create(self.user_id, 'Ali', whatsapp='0600')
+        company = Company.create(self.user_id, 'ACME', address='1 rue X')
+        self.add_receipts(1, client_id=client['id'], company_id=company['id'], amount=12.5)
+        receipt_id = Receipt.get_all(self.user_id)[0]['id']
+
+        bundle = Receipt.get_bundle(receipt_id, user_id=self.user_id)
+        receipt = Receipt.get_by_id(receipt_id)
+        for field in bundle.keys():
+            if field not in ('client', 'company'):
+                self.assertEqual(bundle[field], receipt[field])
+        self.assertEqual(bundle.client.name, 'Ali')
+        self.assertEqual(bundle.company.get('address'), '1 rue X')
+        self.assertIsNone(bundle.get('missing'))
+
+    def test_related_rows_of_another_user_are_not_joined(self):
+        other_id = User.create('other', 'secret')['id']
+        client = Client.create(other_id, 'Foreign')
+        self.add_receipts(1, client_id=client['id'])
+        receipt_id = Receipt.get_all(self.user_id)[0]['id']
+
+        self.assertIsNone(Receipt.get_bundle(receipt_id).client)
+        self.assertIsNone(Receipt.get_bundle(receipt_id, user_id=other_id))
+
+
+class TestUserStats(ReceiptQueryTestCase):
+    def test_summary_follows_receipt_and_client_writes(self):
+        client = Client.create(self.user_id, 'Ali')
+        first = Receipt.create(self.user_id, client['id'], 'a', '10.10', 'cash')
+        Receipt.create(self.user_id, client['id'], 'b', '5.25', 'card')
+        Receipt.create(self.user_id, client['id'], 'c', '1', 'crypto')
+        Receipt.delete(first['id'], user_id=self.user_id)
+        Client.create(self.user_id, 'Sara')
+
+        stats = UserStats.get(self.user_id)
+        self.assertEqual(stats['receipt_count'], 2)
+        self.assertEqual(stats['client_count'], 2)
+        self.assertEqual(stats['total_amount'], 6.25)
+        self.assertEqual(stats['payment_totals'], {'cash': 0, 'card': 5.25, 'transfer': 0, 'check': 0, 'other': 1})
+        self.assertEqual(UserStats.rebuild(self.user_id), [])
+
+    def test_missing_summary_is_built_and_drift_repaired(self):
+        self.add_receipts(4, amount=2.5)
+        self.assertEqual(UserStats.get(self.user_id)['total_amount'], 10)
+
+        # Rows written behind the model's back
+        db.session.add(ReceiptModel(id=str(uuid.uuid4()), user_id=self.user_id, receipt_number='X-1',
+                                    description='x', amount=5, payment_method='cash'))
+        db.session.commit()
+        self.assertIn(self.user_id, UserStats.rebuild())
+        stats = UserStats.get(self.user_id)
+        self.assertEqual((stats['receipt_count'], stats['total_amount']), (5, 15))
+
+class TestReceiptFilters(ReceiptQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client.create(self.user_id, 'Ali')
+        # Day i: amount i, cash on even days, card on odd days, Ali's on days 0-4
+        self.add_receipts(10, amount=lambda i: i, payment_method=lambda i: 'cash' if i % 2 == 0 else 'card',
+                          client_id=lambda i: self.client['id'] if i < 5 else None,
+                          created_at=lambda i: datetime(2026, 1, 1 + i, 12))
+        # Inserted directly: bring the dashboard summary up to date
+        UserStats.rebuild(self.user_id)
+
+    def receipts(self, **args):
+        _, filters = parse_receipt_filters(args)
+        seen, cursor = [], None
+        while True:
+            page, cursor = Receipt.get_page(self.user_id, cursor=cursor, limit=3, filters=filters)
+            seen.extend(page)
+            if cursor is None:
+                return [int(float(r.amount)) for r in seen], Receipt.get_totals(self.user_id, filters)
+
+    def test_filters_combine_across_pages(self):
+        self.assertEqual(self.receipts(start='2026-01-03', end='2026-01-08'), ([7, 6, 5, 4, 3, 2], {'count': 6, 'total': 27}))
+        self.assertEqual(self.receipts(payment_method='card', min_amount='3', max_amount='7.5'), ([7, 5, 3], {'count': 3, 'total': 15}))
+        self.assertEqual(self.receipts(client_id=self.client['id'], payment_method='cash'), ([4, 2, 0], {'count': 3, 'total': 6}))
+        self.assertEqual(self.receipts(company_id='none'), ([], {'count': 0, 'total': 0}))
+
+    def test_without_filters_totals_come_from_the_summary(self):
+        self.assertEqual(self.receipts(start='', min_amount='abc', max_amount='nan'), (list(range(9, -1, -1)), {'count': 10, 'total': 45}))
+        self.assertEqual(parse_receipt_filters({'end': '2026-01-31', 'min_amount': ' 5 ', 'start': 'x'})[0],
+                         {'end': '2026-01-31', 'min_amount': '5'})
+
+    def test_next_page_urls_keep_every_filter(self):
+        app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates'))
+        register_routes(app)
+        app.context_processor(lambda: {'t': t, 'locale': 'fr', 'is_rtl': False, 'settings': {}, 'current_user': None, 'is_superadmin': False})
+        args = {'start': '2026-01-01', 'payment_method': 'cash'}
+        filter_args, filters = parse_receipt_filters(args)
+        receipts, next_cursor = Receipt.get_page(self.user_id, limit=2, filters=filters)
+        totals = Receipt.get_totals(self.user_id, filters)
+        with app.test_request_context('/receipts/', query_string=args):
+            html = render_template('receipts.html', receipts=receipts, next_cursor=encode_cursor(next_cursor), filter_args=filter_args,
+                                   totals=totals, filter_client=None, companies=[], current_year=2026)
+        for attribute in ('data-page-url', 'data-list-url'):
+            url = unescape(html.split(f'{attribute}="', 1)[1].split('"', 1)[0])
+            self.assertEqual(parse_qs(urlsplit(url).query), {'start': ['2026-01-01'], 'payment_method': ['cash']})
+        self.assertIsNotNone(next_cursor)
+        self.assertNotIn('/receipts/page?', html.split('<script>', 1)[1])
+
+
+class TestThermalBatchZip(ReceiptQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = RenderPool(max_workers=1, max_pending=0, timeout=30)
+        self.app.secret_key = 'test'
+        self.app.extensions['render_pool'] = self.pool
+        self.app.extensions['render_cache'] = RenderCache(os.path.join(self.tmp.name, 'cache'), 1024 * 1024)
+        register_routes(self.app)
+        self.add_receipts(2)
+        self.http = self.app.test_client()
+        with self.http.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+
+    def tearDown(self):
+        self.pool.shutdown()
+        super().tearDown()
+
+    def test_busy_pool_is_a_503_not_a_truncated_archive(self):
+        blocker = self.pool.submit(time.sleep, 1)
+        response = self.http.get('/receipts/thermal/batch?start=2026-01-01&end=2026-01-01&output=zip')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+        blocker.result()
+        response = self.http.get('/receipts/thermal/batch?start=2026-01-01&end=2026-01-01&output=zip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.count(b'PK\x01\x02'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
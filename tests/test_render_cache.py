@@ -0,0 +1,116 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+import shutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from services.documents import render_batch
+from services.render_cache import RenderCache, render_key
+from services.render_pool import RenderPool
+
+
+def _render_id(receipt, client, company, settings):
+    return receipt['id'].encode()
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.receipt = {'id': 'r1', 'receipt_number': 'REC-1', 'amount': '10.00', 'created_at': '2026-01-01T10:00:00'}
+        self.client = {'id': 'c1', 'name': 'Client'}
+        self.company = {'id': 'co1', 'name': 'Company', 'logo': ''}
+        self.settings = {'thermal_width': 58, 'site_url': 'https://example.com', 'timezone': 'Africa/Casablanca'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_key_changes_with_relevant_inputs_only(self):
+        base = render_key('thermal', self.receipt, self.client, self.company, self.settings)
+        self.assertEqual(base, render_key('thermal', self.receipt, self.client, self.company, dict(self.settings)))
+
+        # Irrelevant settings do not bust the cache
+        other_tz = dict(self.settings, timezone='Europe/Paris')
+        self.assertEqual(base, render_key('thermal', self.receipt, self.client, self.company, other_tz))
+
+        wider = dict(self.settings, thermal_width=80)
+        self.assertNotEqual(base, render_key('thermal', self.receipt, self.client, self.company, wider))
+        self.assertNotEqual(base, render_key('pdf', self.receipt, self.client, self.company, self.settings))
+        self.assertNotEqual(base, render_key('thermal', self.receipt, self.client, self.company, self.settings, locale='en'))
+
+    def test_key_changes_when_logo_file_is_replaced(self):
+        logo_path = os.path.join(self.tmp_dir, 'logo.png')
+        with open(logo_path, 'wb') as f:
+            f.write(b'v1')
+        company = dict(self.company, logo=logo_path)
+        first = render_key('pdf', self.receipt, self.client, company, self.settings)
+        os.utime(logo_path, (time.time() + 10, time.time() + 10))
+        self.assertNotEqual(first, render_key('pdf', self.receipt, self.client, company, self.settings))
+
+    def test_get_or_render_renders_once(self):
+        cache = RenderCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=1024)
+        calls = []
+
+        def render():
+            calls.append(1)
+            return b'data'
+
+        path = cache.get_or_render('k', 'png', render, namespace='co1')
+        self.assertEqual(path, cache.get_or_render('k', 'png', render, namespace='co1'))
+        self.assertEqual(len(calls), 1)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+        cache.invalidate('co1')
+        self.assertIsNone(cache.get('k', 'png', namespace='co1'))
+
+    def test_lru_eviction_keeps_recent_entries(self):
+        cache = RenderCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=250)
+        now = time.time()
+        for i in range(3):
+            path = cache.put(f'k{i}', 'png', b'x' * 100)
+            os.utime(path, (now - 100 + i, now - 100 + i))
+        # k0 is the least recently used entry
+        self.assertIsNone(cache.get('k0', 'png'))
+        self.assertIsNotNone(cache.get('k2', 'png'))
+
+    def test_overwriting_a_key_does_not_inflate_the_size(self):
+        cache = RenderCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=250)
+        cache.put('k0', 'png', b'x' * 100)
+        for _ in range(5):
+            cache.put('k1', 'png', b'y' * 100)
+        self.assertEqual(cache._size, 200)
+        # Both entries still fit, so nothing was evicted
+        self.assertIsNotNone(cache.get('k0', 'png'))
+        cache.put('k1', 'png', b'z' * 40)
+        self.assertEqual(cache._size, cache._scan_size())
+
+    def test_namespace_cannot_escape_cache_dir(self):
+        cache = RenderCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=1024)
+        cache.invalidate('..')
+        self.assertTrue(os.path.isdir(self.tmp_dir))
+        self.assertTrue(cache.path_for('k', 'png', '..').startswith(cache.directory))
+
+    def test_batch_survives_eviction_of_a_looked_up_entry(self):
+        app = Flask(__name__)
+        cache = app.extensions['render_cache'] = RenderCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=1024)
+        pool = RenderPool(max_workers=1, timeout=10)
+        jobs = [(dict(self.receipt, id=f'r{i}', company_id='co1'), self.client, self.company) for i in range(3)]
+        for receipt, client, company in jobs:
+            cache.put(render_key('thermal', receipt, client, company, self.settings), 'png', b'cached', 'co1')
+        try:
+            with app.app_context():
+                batch = render_batch(jobs, self.settings, 'thermal', 'png', _render_id, {}, pool=pool)
+                # The first window (two entries) has been looked up; evict everything before it drains
+                self.assertEqual(next(batch)[1], b'cached')
+                cache.invalidate('co1')
+                self.assertEqual([data for _, data in batch], [b'cached', b'r2'])
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
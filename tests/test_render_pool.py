@@ -0,0 +1,64 @@
+import unittest
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.render_pool import RenderPool, RenderPoolBusy, RenderPoolError, RenderTimeout
+
+
+class TestRenderPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = RenderPool(max_workers=1, max_pending=0, timeout=5)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_run_returns_result_and_reuses_workers(self):
+        first = self.pool.run(os.getpid)
+        second = self.pool.run(os.getpid)
+        self.assertNotEqual(first, os.getpid())
+        self.assertEqual(first, second, "Worker process should be reused between jobs")
+
+    def test_submit_rejects_when_saturated(self):
+        future = self.pool.submit(time.sleep, 0.5)
+        with self.assertRaises(RenderPoolBusy) as ctx:
+            self.pool.submit(time.sleep, 0)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        future.result()
+        # Slot is released once the job completes
+        self.pool.run(time.sleep, 0)
+
+    def test_run_times_out(self):
+        with self.assertRaises(RenderTimeout):
+            self.pool.run(time.sleep, 1, timeout=0.1)
+
+    def test_hung_job_is_killed_and_frees_its_slot(self):
+        worker = self.pool.run(os.getpid)
+        with self.assertRaises(RenderTimeout):
+            self.pool.run(time.sleep, 60, timeout=0.2)
+
+        # The only slot is free again and a fresh worker serves the next job
+        started = time.monotonic()
+        self.assertNotEqual(self.pool.run(os.getpid, timeout=5), worker)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_jobs_in_flight_on_a_recycled_pool_fail_as_retryable(self):
+        pool = RenderPool(max_workers=2, max_pending=0, timeout=5)
+        try:
+            hung = pool.submit(time.sleep, 60)
+            other = pool.submit(time.sleep, 2)
+            with self.assertRaises(RenderTimeout):
+                pool.result(hung, timeout=0.2)
+            # Its worker went down with the pool: a RenderPoolError the caller can retry, not a crash
+            with self.assertRaises(RenderPoolError) as ctx:
+                pool.result(other)
+            self.assertGreaterEqual(ctx.exception.retry_after, 1)
+            self.assertEqual(pool.run(abs, -3), 3)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
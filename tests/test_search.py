@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from init_db import db, init_database
+from models import Receipt, User, Client, Company
+from services.search import search_receipt_ids, ensure_search_schema, query_terms
+
+
+class TestReceiptSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'search.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+        self.client = Client.create(self.user_id, 'Ali Benani', whatsapp='+212 600-112233', email='ali@example.com')
+        self.company = Company.create(self.user_id, 'Garage Atlas')
+        self.receipt = Receipt.create(self.user_id, self.client['id'], 'Vidange moteur', '150.50', 'cash',
+                                      company_id=self.company['id'], receipt_number_format='REC-{N}')
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def search(self, query, user_id=None, **kwargs):
+        return search_receipt_ids(user_id or self.user_id, query, **kwargs)[0]
+
+    def test_matches_every_indexed_field(self):
+        for query in ('REC-0001', 'vidange', 'moteur vid', '150.50', 'benani', 'ali@example', '600112233', 'atlas', 'ALÍ'):
+            self.assertEqual(self.search(query), [self.receipt['id']], query)
+        self.assertEqual(self.search('vidange freins'), [])
+        self.assertEqual(self.search('  *"() '), [])
+
+    def test_results_are_limited_to_the_user(self):
+        other_id = User.create('other', 'secret')['id']
+        Receipt.create(other_id, '', 'Vidange', '10', 'cash', receipt_number_format='REC-{N}')
+        self.assertEqual(len(self.search('vidange')), 1)
+        self.assertEqual(len(self.search('vidange', user_id=other_id)), 1)
+
+    def test_index_follows_writes(self):
+        Client.update(self.client['id'], user_id=self.user_id, name='Sara Idrissi')
+        self.assertEqual(self.search('benani'), [])
+        self.assertEqual(self.search('idrissi'), [self.receipt['id']])
+
+        Company.update(self.company['id'], user_id=self.user_id, name='Moto Rif')
+        self.assertEqual(self.search('rif'), [self.receipt['id']])
+
+        Receipt.delete(self.receipt['id'], user_id=self.user_id)
+        self.assertEqual(self.search('vidange'), [])
+
+    def test_pages_and_ranking(self):
+        for i in range(25):
+            Receipt.create(self.user_id, '', f'Entretien {i}', '20', 'card', receipt_number_format='REC-{N}')
+        first, has_more = search_receipt_ids(self.user_id, 'entretien', page=1, per_page=20)
+        second, last = search_receipt_ids(self.user_id, 'entretien', page=2, per_page=20)
+        self.assertTrue(has_more)
+        self.assertFalse(last)
+        self.assertEqual(len(set(first + second)), 25)
+        # A receipt number outranks a number found in a description
+        Receipt.create(self.user_id, '', 'Rappel REC-0002', '5', 'cash', receipt_number_format='X-{N}')
+        self.assertEqual(Receipt.get_bundles(self.search('0002')[:1], self.user_id)[0].receipt_number, 'REC-0002')
+
+    def test_existing_receipts_are_indexed_when_the_index_is_created(self):
+        db.session.execute(text("DROP TABLE receipt_search"))
+        db.session.execute(text("DROP TABLE receipt_search_docs"))
+        db.session.commit()
+        self.assertTrue(ensure_search_schema())
+        self.assertFalse(ensure_search_schema())
+        self.assertEqual(self.search('vidange'), [self.receipt['id']])
+
+    def test_query_terms(self):
+        self.assertEqual(query_terms('Café-123 "x" OR_y'), ['café', '123', 'x', 'or', 'y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
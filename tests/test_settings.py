@@ -0,0 +1,87 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event, update
+from init_db import db, init_database, Settings as SettingsModel
+from models import Settings, User
+from utils.template_context import LazyMapping
+
+
+class TestSettingsCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'settings.db')}"
+        init_database(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.user_id = User.create('owner', 'secret')['id']
+        Settings.save(self.user_id, {'thermal_width': 80})
+        self.queries = 0
+        event.listen(db.engine, 'before_cursor_execute', self.count_query)
+        self.ttl = Settings.CACHE_TTL
+
+    def tearDown(self):
+        Settings.CACHE_TTL = self.ttl
+        event.remove(db.engine, 'before_cursor_execute', self.count_query)
+        db.session.remove()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def count_query(self, *args):
+        self.queries += 1
+
+    def test_cached_until_saved(self):
+        self.assertEqual(Settings.get(self.user_id)['thermal_width'], 80)
+        self.queries = 0
+        settings = Settings.get(self.user_id)
+        settings['thermal_width'] = 48
+        self.assertEqual(Settings.get(self.user_id)['thermal_width'], 80)
+        self.assertEqual(self.queries, 0)
+
+        Settings.save(self.user_id, {'thermal_width': 57})
+        self.assertEqual(Settings.get(self.user_id)['thermal_width'], 57)
+
+    def test_change_by_another_worker_is_seen_after_the_ttl(self):
+        Settings.CACHE_TTL = 0
+        Settings.get(self.user_id)
+        db.session.execute(update(SettingsModel).where(SettingsModel.user_id == self.user_id)
+                           .values(thermal_width=48, version=SettingsModel.version + 1))
+        db.session.commit()
+        self.assertEqual(Settings.get(self.user_id)['thermal_width'], 48)
+        # Unchanged versions: only the version check runs
+        self.queries = 0
+        Settings.get(self.user_id)
+        self.assertEqual(self.queries, 1)
+
+    def test_request_memo_and_site_url_fallback(self):
+        Settings.get(self.user_id)
+        self.queries = 0
+        with self.app.test_request_context('/', base_url='http://one.example'):
+            self.assertEqual(Settings.get(self.user_id)['site_url'], 'http://one.example')
+            Settings.get(self.user_id)
+        with self.app.test_request_context('/', base_url='http://two.example'):
+            self.assertEqual(Settings.get(self.user_id)['site_url'], 'http://two.example')
+        self.assertEqual(self.queries, 0)
+
+
+class TestLazyMapping(unittest.TestCase):
+    def test_loaded_once_and_only_when_read(self):
+        loads = []
+        settings = LazyMapping(lambda: loads.append(1) or {'site_url': 'http://x', 'pwa_enabled': True})
+        app = Flask(__name__)
+        with app.app_context():
+            template = app.jinja_env.from_string("{% if flag %}{{ settings.site_url }}|{{ settings.get('pwa_enabled') }}{% endif %}")
+            self.assertEqual(template.render(flag=False, settings=settings), '')
+            self.assertEqual(loads, [])
+            self.assertEqual(template.render(flag=True, settings=settings), 'http://x|True')
+        self.assertEqual(loads, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
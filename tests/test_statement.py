@@ -0,0 +1,48 @@
+import unittest
+import os
+import sys
+from io import BytesIO
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.statement import render_client_statement, _fit, FONT, FONT_SIZE
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+def receipts(count):
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        yield {
+            'receipt_number': f'REC-{i:05d}',
+            'created_at': start + timedelta(hours=i),
+            'description': 'Prestation ' * (1 + i % 20),
+            'amount': Decimal('10.50'),
+            'payment_method': 'cash'
+        }
+
+
+class TestStatement(unittest.TestCase):
+    def test_totals_and_pagination(self):
+        output = BytesIO()
+        count, total = render_client_statement(receipts(150), {'name': 'Client'}, output, locale='fr')
+        self.assertEqual(count, 150)
+        self.assertEqual(total, Decimal('1575.00'))
+        data = output.getvalue()
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertGreater(data.count(b'/Type /Page\n'), 1)
+
+    def test_empty_statement_is_one_page(self):
+        output = BytesIO()
+        self.assertEqual(render_client_statement(iter(()), {'name': 'Client'}, output, locale='fr'), (0, Decimal('0')))
+        self.assertEqual(output.getvalue().count(b'/Type /Page\n'), 1)
+
+    def test_long_text_is_cut_to_the_column(self):
+        text = _fit('Description tres longue ' * 30, 100)
+        self.assertTrue(text.endswith('...'))
+        self.assertLessEqual(stringWidth(text, FONT, FONT_SIZE), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import sys
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops
+from services import thermal
+
+
+class TestThermalLayout(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        logo_path = os.path.join(self.tmp.name, 'logo.png')
+        logo = Image.new('RGB', (200, 100), 'white')
+        logo.paste((30, 30, 30), (50, 25, 150, 75))
+        logo.save(logo_path)
+        self.receipt = {
+            'receipt_number': 'REC-0001', 'created_at': '2026-01-01T10:00:00', 'amount': '150.00',
+            'payment_method': 'cash', 'description': 'Vidange moteur et remplacement du filtre a huile'
+        }
+        self.client = {'name': 'Ali'}
+        self.company = {'name': 'Garage', 'address': 'Rue 1\nCasablanca', 'phone': '0600000000', 'logo': logo_path}
+        self.settings = {'thermal_width': 58, 'site_url': 'https://example.com'}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fixed_height_render(self, mode, settings):
+        # What the renderer did before the two-pass layout: an oversized canvas cropped to the content
+        layout, height = thermal._layout_thermal_receipt(self.receipt, self.client, self.company, settings)
+        res = layout.res
+        fixed_height = 45 * res.line_height + 200 + res.qr_size + res.logo_height
+        self.assertLess(height, fixed_height)
+        return layout.paint(mode, fixed_height).crop((0, 0, res.width_px, height))
+
+    def assertSamePixels(self, first, second):
+        self.assertEqual(first.size, second.size)
+        self.assertIsNone(ImageChops.difference(first, second).getbbox())
+
+    def test_tight_canvas_matches_the_trimmed_fixed_height_render(self):
+        for width in thermal.SUPPORTED_WIDTHS:
+            settings = dict(self.settings, thermal_width=width)
+            data = thermal._generate_thermal_receipt_task(self.receipt, self.client, self.company, settings)
+            with Image.open(BytesIO(data)) as png:
+                self.assertEqual(png.mode, thermal.PNG_MODE)
+                self.assertSamePixels(png.convert('RGB'), self.fixed_height_render('RGB', settings))
+
+    def test_escpos_canvas_matches_the_trimmed_fixed_height_render(self):
+        with mock.patch.object(thermal.escpos, 'encode_receipt', side_effect=lambda img, density: img):
+            img = thermal._generate_thermal_receipt_task(
+                self.receipt, self.client, self.company, self.settings, output_format='escpos'
+            )
+        self.assertEqual(img.mode, '1')
+        self.assertSamePixels(img, self.fixed_height_render('1', self.settings))
+
+    def test_png_compress_level_is_applied(self):
+        with mock.patch.object(thermal, 'PNG_COMPRESS_LEVEL', 9):
+            small = thermal._generate_thermal_receipt_task(self.receipt, self.client, self.company, self.settings)
+        with mock.patch.object(thermal, 'PNG_COMPRESS_LEVEL', 0):
+            large = thermal._generate_thermal_receipt_task(self.receipt, self.client, self.company, self.settings)
+        self.assertLess(len(small), len(large))
+        with Image.open(BytesIO(small)) as first, Image.open(BytesIO(large)) as second:
+            self.assertSamePixels(first, second)
+
+
+class TestThermalResources(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(thermal._resources_cache, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.receipt = {'receipt_number': 'REC-0001', 'amount': '10.00', 'payment_method': 'card'}
+        self.settings = {'thermal_width': 58, 'site_url': 'https://example.com'}
+
+    def layout(self, width):
+        settings = dict(self.settings, thermal_width=width)
+        return thermal._layout_thermal_receipt(self.receipt, None, None, settings)[0]
+
+    def test_resources_are_built_once_per_width(self):
+        with mock.patch.object(thermal, 'ThermalResources', wraps=thermal.ThermalResources) as built:
+            first = self.layout(58)
+            second = self.layout(58)
+            self.assertIs(first.res, second.res)
+            self.assertEqual(built.call_count, 1)
+
+            wide = self.layout(80)
+            self.assertEqual(built.call_count, 2)
+        self.assertIsNot(wide.res, first.res)
+        self.assertEqual(set(thermal._resources_cache), {58, 80})
+        self.assertGreater(wide.res.width_px, first.res.width_px)
+        self.assertGreater(wide.res.font_size_title, first.res.font_size_title)
+
+    def test_warm_worker_fills_every_supported_width(self):
+        thermal.warm_thermal_worker()
+        self.assertEqual(set(thermal._resources_cache), set(thermal.SUPPORTED_WIDTHS))
+        for width in thermal.SUPPORTED_WIDTHS:
+            self.assertEqual(thermal.get_thermal_resources(width).thermal_width_mm, width)
+
+    def test_constant_strings_are_premeasured(self):
+        res = thermal.get_thermal_resources(58)
+        with mock.patch.object(res, '_measure', wraps=res._measure) as measure:
+            res.measure(thermal.THANK_YOU_TEXT)
+            res.measure(thermal.TOTAL_PREFIX, 'title')
+            self.assertEqual(measure.call_count, 0)
+            self.assertGreater(res.measure('150.00 MAD', 'title'), 0)
+            self.assertEqual(measure.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,9 @@
+from datetime import datetime
+
+
+def parse_date(value):
+    """A YYYY-MM-DD query parameter as a datetime at midnight, or None when absent or invalid."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
@@ -1,5 +1,6 @@
 import os
 import uuid
+import hashlib
 from PIL import Image as PILImage
 
 UPLOAD_DIR = 'static/uploads'
@@ -11,7 +12,12 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_logo(file):
+def logo_variant_path(logo_path, variant):
+    """Path of a derived logo file, e.g. static/uploads/logo_ab12_thermal58.png."""
+    base, _ = os.path.splitext(logo_path)
+    return f"{base}_{variant}.png"
+
+def save_logo(file, variants=True):
     if not file or not file.filename:
         return None
     
@@ -25,16 +31,23 @@ def save_logo(file):
     if size > MAX_FILE_SIZE:
         return None
     
-    filename = f"logo_{uuid.uuid4().hex[:8]}.png"
+    # Named after the content hash: re-uploading the same logo reuses the stored files
+    digest = hashlib.sha256(file.read()).hexdigest()[:16]
+    file.seek(0)
+    filename = f"logo_{digest}.png"
     filepath = os.path.join(UPLOAD_DIR, filename)
     
     try:
-        img = PILImage.open(file.stream)
-        img.verify()
-        file.seek(0)
-        img = PILImage.open(file.stream)
-        img.thumbnail((400, 200))
-        img.save(filepath, 'PNG')
+        if not os.path.exists(filepath):
+            img = PILImage.open(file.stream)
+            img.verify()
+            file.seek(0)
+            img = PILImage.open(file.stream)
+            img.thumbnail((400, 200))
+            img.save(filepath, 'PNG')
+        if variants:
+            from services.logos import build_logo_variants
+            build_logo_variants(filepath)
         return filepath
     except Exception:
         return None
@@ -20,9 +20,9 @@ def set_locale(locale):
     if locale in ['fr', 'en', 'ar']:
         session['locale'] = locale
 
-def t(key):
+def t(key, locale=None):
     translations = get_translations()
-    locale = get_locale()
+    locale = locale or get_locale()
     keys = key.split('.')
     value = translations.get(locale, translations['fr'])
     for k in keys:
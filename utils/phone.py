@@ -0,0 +1,18 @@
+import re
+
+_NON_DIGITS = re.compile(r'\D+')
+# Length of a national number (Morocco, France): what is left without country code or trunk 0
+NATIONAL_DIGITS = 9
+
+
+def phone_digits(value):
+    """
+    Digits of a phone number without leading zeros, country code or trunk 0, so
+    '+212 6 12 34 56 78', '00212612345678' and '0612345678' all give '612345678'.
+    Applied to a partial number typed in a lookup, '06 12' gives the prefix '612'.
+    """
+    return _NON_DIGITS.sub('', value or '').lstrip('0')[-NATIONAL_DIGITS:]
+
+
+def looks_like_phone(value):
+    return bool(re.fullmatch(r'[\d\s+().-]+', value or '')) and any(char.isdigit() for char in value)
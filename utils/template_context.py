@@ -0,0 +1,54 @@
+import threading
+from collections.abc import Mapping
+
+
+class LazyMapping(Mapping):
+    """
+    Read-only mapping whose content is produced by `loader` on first access and
+    then memoized. Templates read it like the dict it stands for
+    (`settings.site_url`, `settings.get(...)`, `'key' in settings`).
+    """
+    __slots__ = ('_loader', '_data')
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _resolve(self):
+        if self._data is None:
+            self._data = self._loader()
+        return self._data
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __repr__(self):
+        return f"LazyMapping({self._data!r})" if self.loaded else "LazyMapping(<not loaded>)"
+
+
+class ContextStats:
+    """Counts template renders and how many of them actually needed the settings lookup."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'renders': 0, 'settings_loaded': 0}
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters['settings_avoided'] = counters['renders'] - counters['settings_loaded']
+        return counters
@@ -0,0 +1,50 @@
+import io
+import zipfile
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink: ZipFile falls back to data descriptors and never seeks back."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+CHUNK_SIZE = 64 * 1024
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    Yield a ZIP archive chunk by chunk from an iterable of (name, bytes) entries,
+    so the archive is never held in memory or written to a temp file as a whole.
+    An entry may also be a binary file object, which is copied in chunks.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=compression) as archive:
+        for name, data in entries:
+            if hasattr(data, 'read'):
+                with archive.open(name, mode='w', force_zip64=True) as member:
+                    for block in iter(lambda: data.read(CHUNK_SIZE), b''):
+                        member.write(block)
+                        chunk = buffer.pop()
+                        if chunk:
+                            yield chunk
+            else:
+                archive.writestr(name, data)
+            chunk = buffer.pop()
+            if chunk:
+                yield chunk
+    yield buffer.pop()